@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List
 from core.config import DatastoreConfig, AdapterConfig
 from core.query import Query
 
@@ -28,9 +28,37 @@ class Adapter(ABC):
     @abstractmethod
     def close(self): ...
 
+    def fetch_batches(self, query: Query, batch_size: int, op_name: str="") -> Iterator[List[Dict]]:
+        # stores with server-side cursors stream the rows, others fetch them at once and hand them out in batches
+        rows = self.fetch(query, op_name)
+        for i in range(0, len(rows), batch_size):
+            yield rows[i:i+batch_size]
+
+    def write_batch(self, table: str, rows: List[Dict]):
+        # stores with a bulk path write the batch at once, others a row at a time
+        for row in rows:
+            self.insert_or_update(table, row)
+
+    def delete(self, query: Query):
+        # rows matching the query's filters
+        raise NotImplementedError(f"{type(self).__name__} does not delete rows")
+
+    def replace_rows(self, table: str, query: Query, batches: Iterable[List[Dict]]) -> int:
+        # stores with transactions swap the rows in one, others delete and then write
+        self.delete(query)
+        written = 0
+        for rows in batches:
+            self.write_batch(table, rows)
+            written += len(rows)
+        return written
+
+    def clone(self) -> 'Adapter':
+        # new unconnected adapter with the same configuration, e.g. for a worker thread
+        return self.__class__(self.store_config, self.adapter_config, self.role)
+
     def __eq__(self, value: 'Adapter') -> bool:
         return self.adapter_config == value.adapter_config
 
 
 class ExternalAdapter(ABC):
-    pass
\ No newline at end of file
+    pass
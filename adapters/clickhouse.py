@@ -1,6 +1,21 @@
+import re
+from itertools import islice
+from typing import Dict, Iterator, List, Tuple
 from clickhouse_driver import Client
+
+from core.config import HASH_MD5_HASH, HASHTEXT64_HASH, MD5_SUM_HASH, SUM64_HASH
+from core.query import RowHashMeta, BlockHashMeta, BlockNameMeta, QuantilesMeta, SketchMeta
 from .base import Adapter
-from core.query import Query, Field
+from core.query import Query, Field, Filter
+from engine.sql_builder import SqlBuilder
+
+
+def named_params(sql: str, params: list) -> Tuple[str, Dict]:
+    # clickhouse_driver only takes named parameters
+    names = iter(range(len(params)))
+    sql = re.sub(r"%s", lambda m: f"%(p{next(names)})s", sql)
+    return sql, {f"p{i}": value for i, value in enumerate(params)}
+
 
 # class ClickHouseAdapter(Adapter):
 #     def connect(self):
@@ -40,62 +55,168 @@ from core.query import Query, Field
 
 class ClickHouseAdapter(Adapter):
     def connect(self):
-        c = self.config
+        cfg = self.store_config
         self.client = Client(
-            host=c['host'], port=c['port'], user=c['username'], password=c['password'], database=c['database']
+            host=cfg['host'], port=cfg['port'], user=cfg['username'], password=cfg['password'], database=cfg['database']
         )
 
+    def _build_partition_key_expr(self, partition_column: str, partition_column_type: str) -> str:
+        # integer the blocks of a partition column are cut from, same values as Postgres
+        if partition_column_type == "int":
+            return partition_column
+        elif partition_column_type == "datetime":
+            return f"toUnixTimestamp({partition_column})"
+        elif partition_column_type == "date":
+            return f"toInt32({partition_column})"
+        elif partition_column_type == "uuid":
+            return f"reinterpretAsUInt32(reverse(unhex(substring(toString({partition_column}), 1, 8))))"
+        elif partition_column_type == "str":
+            return f"reinterpretAsUInt32(reverse(substring(MD5(toString({partition_column})), 1, 4)))"
+        raise ValueError(f"Unsupported partition type: {partition_column_type}")
+
     def _build_group_name_expr(self, field: Field) -> str:
-        part_type, interval, factor, uuid_len = field.hash_fields
-        factors = []
-        cur = int(interval)
-        while cur >= 1:
-            factors.append(cur)
-            cur = cur // int(factor)
-            if cur == 0:
-                factors.append(1)
-                break
+        metadata: BlockNameMeta = field.metadata
+        level = metadata.level
+        intervals = metadata.intervals
+        partition_column = metadata.partition_column
+        partition_column_type = metadata.partition_column_type
+
+        base = self._build_partition_key_expr(partition_column, partition_column_type)
+        if metadata.encoding == "int":
+            # nested intervals: the level's block number alone names the block
+            return f"intDiv({base}, {intervals[level-1]})"
+
         segments = []
-        base = field.expr
-        for idx, fct in enumerate(factors):
+        for idx in range(level):
             if idx == 0:
-                expr = f"intDiv({base}, {fct})"
+                expr = f"intDiv({base}, {intervals[idx]})"
             else:
-                prev = factors[idx-1]
-                expr = f"intDiv({base} % {prev}, {fct})"
-            segments.append(f"lpad(CAST({expr} AS String), 2, '0')")
-        return " || '-' || ".join(segments)
+                expr = f"intDiv(modulo({base}, {intervals[idx-1]}), {intervals[idx]})"
+            segments.append(f"toString({expr})")
+        return "concat(" + ", '-', ".join(segments) + ")" if len(segments) > 1 else segments[0]
+
+    def _build_rowhash_expr(self, field: Field) -> str:
+        metadata: RowHashMeta = field.metadata
+        expr = ""
+        concat = ",".join([f"ifNull(toString({x.expr}), '')" for x in metadata.fields])
+        if metadata.strategy == HASHTEXT64_HASH:
+            raise ValueError(f"Strategy {metadata.strategy} is only supported on Postgres")
+        if metadata.strategy == SUM64_HASH:
+            # same value as Postgres: first 8 bytes of the md5 as a signed Int64
+            source = f"toString({metadata.hash_column})" if metadata.hash_column else f"concat({concat})"
+            expr = f"reinterpretAsInt64(reverse(substring(MD5({source}), 1, 8)))"
+        elif metadata.hash_column:
+            expr = metadata.hash_column
+        elif metadata.strategy == MD5_SUM_HASH:
+            # same value as Postgres: first 4 bytes of the md5 as a signed int
+            expr = f"reinterpretAsInt32(reverse(substring(MD5(concat({concat})), 1, 4)))"
+        elif metadata.strategy == HASH_MD5_HASH:
+            expr = f"lower(hex(MD5(concat({concat}))))"
+        return expr
+
+    def _build_blockhash_expr(self, field: Field):
+        metadata: BlockHashMeta = field.metadata
+        inner_expr = self._build_rowhash_expr(field)
+        if metadata.strategy == MD5_SUM_HASH:
+            expr = f"sum(toInt64({inner_expr}))"
+        elif metadata.strategy == HASH_MD5_HASH:
+            ordered = f"arraySort(x -> x.1, groupArray(({metadata.order_column}, toString({inner_expr}))))"
+            expr = f"lower(hex(MD5(arrayStringConcat(arrayMap(x -> x.2, {ordered}), ','))))"
+        elif metadata.strategy == SUM64_HASH:
+            # Int64 sum wraps around, read back as unsigned it is the sum modulo 2^64
+            expr = f"toUInt64(sum({inner_expr}))"
+        return expr
+
+    def _build_quantiles_expr(self, field: Field):
+        metadata: QuantilesMeta = field.metadata
+        fractions = ", ".join(str(x) for x in metadata.fractions)
+        return f"quantiles({fractions})({metadata.partition_column})"
+
+    def _build_sketch_expr(self, field: Field) -> str:
+        # same cells as Postgres: element and check hashes use the sum64_hash md5 prefix
+        metadata: SketchMeta = field.metadata
+        rowhash = self._build_rowhash_expr(Field(expr="rowhash", metadata=RowHashMeta(
+            strategy=metadata.strategy, hash_column=metadata.hash_column, fields=metadata.fields
+        )))
+        element = f"reinterpretAsInt64(reverse(substring(MD5(concat(toString({metadata.key_column}), '|', toString({rowhash}))), 1, 8)))"
+        if metadata.part == "cell":
+            return f"({metadata.index * metadata.width} + modulo(bitAnd(bitShiftRight({element}, {16 * metadata.index}), 65535), {metadata.width}))"
+        elif metadata.part == "key":
+            return f"groupBitXor(toInt64({metadata.key_column}))"
+        elif metadata.part == "hash":
+            return f"groupBitXor({element})"
+        elif metadata.part == "check":
+            return f"groupBitXor(reinterpretAsInt64(reverse(substring(MD5(toString({element})), 1, 8))))"
+        raise ValueError(f"Unsupported sketch part: {metadata.part}")
 
     def _rewrite_query(self, query: Query) -> Query:
-        new_sel=[]
+        rewritten = []
         for f in query.select:
-            if f.type=='hash':
-                expr = f"reinterpretAsUInt32(substr(CityHash64({','.join(f.hash_fields)}),1,4))"
-                new_sel.append(Field(expr=expr, alias=f.alias, type='column'))
-            else:
-                new_sel.append(f)
-        query.select=new_sel
-        new_gb=[]
-        for g in query.group_by:
-            if g.type=='group_name':
-                expr=self._build_group_name_expr(g)
-                new_gb.append(Field(expr=expr, alias=None, type='column'))
+            if f.type == 'blockhash':
+                expr = self._build_blockhash_expr(f)
+                rewritten.append(Field(expr=expr, alias=f.alias, type='column'))
+            elif f.type == "blockname":
+                expr = self._build_group_name_expr(f)
+                rewritten.append(Field(expr=expr, alias=f.alias, type='column'))
+            elif f.type == "rowhash":
+                expr = self._build_rowhash_expr(f)
+                rewritten.append(Field(expr=expr, alias=f.alias, type='column'))
+            elif f.type == "quantiles":
+                expr = self._build_quantiles_expr(f)
+                rewritten.append(Field(expr=expr, alias=f.alias, type='column'))
+            elif f.type == "sketch":
+                expr = self._build_sketch_expr(f)
+                rewritten.append(Field(expr=expr, alias=f.alias, type='column'))
             else:
-                new_gb.append(g)
-        query.group_by=new_gb
-        query.select.extend(new_gb)
+                rewritten.append(f)
+        query.select = rewritten
+        query.order_by = [
+            f"min({self._build_partition_key_expr(o.metadata.partition_column, o.metadata.partition_column_type)})"
+            if isinstance(o, Field) and o.type == 'blockorder' else o
+            for o in query.order_by
+        ]
+        # UUID ordering isn't the hex text order on every server version, compare keys instead
+        query.filters = [
+            Filter(
+                column=self._build_partition_key_expr(f.metadata.partition_column, f.metadata.partition_column_type),
+                operator=f.operator,
+                value=f.value
+            ) if f.type == 'partitionkey' else f
+            for f in query.filters
+        ]
+        # quantiles() already samples; SAMPLE would need a sampling key on the table
+        query.sample = None
         return query
 
-    def _build_sql(self, query: Query) -> (str, dict):
-        q=self._rewrite_query(query)
-        return SqlBuilder.build(q)
+    def _build_sql(self, query: Query) -> Tuple[str, Dict]:
+        q = self._rewrite_query(query)
+        sql, params = SqlBuilder.build(q)
+        if q.grouping_sets:
+            # names of levels outside a row's grouping set come back NULL instead of 0 or ''
+            sql = sql[:-1] + "\nSETTINGS group_by_use_nulls = 1;"
+        return named_params(sql, params)
 
-    def fetch(self, query: Query) -> list:
+    def fetch(self, query: Query, op_name: str="") -> list:
         sql, params = self._build_sql(query)
         data, cols = self.client.execute(sql, params, with_column_types=True)
         names = [c[0] for c in cols]
         return [dict(zip(names,row)) for row in data]
 
+    def fetch_one(self, query: Query, op_name: str="") -> Dict:
+        return self.fetch(query, op_name=op_name)[0]
+
+    def fetch_batches(self, query: Query, batch_size: int, op_name: str="") -> Iterator[List[Dict]]:
+        # streamed in native blocks of batch_size rows instead of a single result
+        sql, params = self._build_sql(query)
+        rows = self.client.execute_iter(sql, params, with_column_types=True, settings={"max_block_size": batch_size})
+        # with column types the first item is the column list
+        names = [c[0] for c in next(rows, [])]
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            yield [dict(zip(names, row)) for row in batch]
+
     def execute(self, sql: str, params=None):
         self.client.execute(sql, params or {})
 
@@ -104,5 +225,34 @@ class ClickHouseAdapter(Adapter):
         stmt = f"INSERT INTO {table} ({','.join(row.keys())}) VALUES ({placeholders})"
         self.client.execute(stmt, list(row.values()))
 
+    def delete(self, query: Query):
+        # lightweight DELETE, the rows are masked at once and dropped by later merges
+        sql, params = named_params(*SqlBuilder.build_delete(self._rewrite_query(query)))
+        self.client.execute(sql, params)
+
+    def write_batch(self, table: str, rows: List[Dict]):
+        """
+        Insert a batch as native columns, one INSERT per partition.
+
+        Every INSERT makes at least one part per partition it touches, so the
+        rows are sent in a single columnar call rather than row by row. With
+        SinkConfig.partition_by set, the batch is first split on that column
+        so each call writes into exactly one partition.
+        """
+        if not rows:
+            return
+        cols = list(rows[0].keys())
+        partition_by = getattr(self.adapter_config, "partition_by", None)
+        groups = {}
+        if partition_by:
+            for row in rows:
+                groups.setdefault(row.get(partition_by), []).append(row)
+        else:
+            groups[None] = rows
+        stmt = f"INSERT INTO {table} ({','.join(cols)}) VALUES"
+        for group in groups.values():
+            columns = [[row.get(c) for row in group] for c in cols]
+            self.client.execute(stmt, columns, columnar=True)
+
     def close(self):
-        pass
+        self.client.disconnect()
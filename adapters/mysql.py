@@ -1,6 +1,36 @@
+import os
+import tempfile
+import uuid
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Tuple
 import pymysql
 from .base import Adapter
-from core.query import Query, Field
+from core.config import COLLAPSE, DELETE_INSERT
+from core.query import Query, Field, Filter, PartitionKeyMeta
+from engine.sql_builder import SqlBuilder
+
+# room left in a packet for the statement around the rows
+PACKET_HEADROOM = 1024
+
+
+def load_data_value(value: Any) -> bytes:
+    # a value in LOAD DATA's default format: \N for NULL, backslash escapes for the delimiters.
+    # bytes are kept as they are, text is utf-8, the file is loaded as CHARACTER SET binary
+    if value is None:
+        return b"\\N"
+    if isinstance(value, bool):
+        value = b"1" if value else b"0"
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value)
+    elif isinstance(value, (str, int, float, Decimal, uuid.UUID, datetime, date, time)):
+        value = str(value).encode("utf-8")
+    else:
+        raise TypeError(f"Cannot write a {type(value).__name__} value with LOAD DATA")
+    return (
+        value.replace(b"\\", b"\\\\").replace(b"\t", b"\\t").replace(b"\n", b"\\n")
+        .replace(b"\r", b"\\r").replace(b"\0", b"\\0")
+    )
 
 # class MySQLAdapter(Adapter):
 #     def connect(self):
@@ -47,12 +77,14 @@ from core.query import Query, Field
 
 class MySQLAdapter(Adapter):
     def connect(self):
-        cfg = self.config
+        cfg = self.store_config
         self.conn = pymysql.connect(
             host=cfg['host'], port=cfg['port'], user=cfg['username'],
-            password=cfg['password'], db=cfg['database'], cursorclass=pymysql.cursors.DictCursor
+            password=cfg['password'], db=cfg['database'], cursorclass=pymysql.cursors.DictCursor,
+            local_infile=self._load_data()
         )
         self.cursor = self.conn.cursor()
+        self._max_packet = None
 
     def _build_group_name_expr(self, field: Field) -> str:
         part_type, interval, factor, uuid_len = field.hash_fields
@@ -74,7 +106,27 @@ class MySQLAdapter(Adapter):
                 prev = factors[idx-1]
                 expr = f"FLOOR(({base} % {prev}) / {fct})"
             segments.append(f"LPAD({expr},2,'0')")
-        return " CONCAT('-', ") . join(segments) . ""
+        return "CONCAT(" + ", '-', ".join(segments) + ")"
+
+    def _build_partition_key_expr(self, partition_column: str, partition_column_type: str) -> str:
+        # key-space position of uuid and str columns, same values as Postgres
+        if partition_column_type == "uuid":
+            return f"CONV(LEFT({partition_column}, 8), 16, 10)"
+        elif partition_column_type == "str":
+            return f"CONV(LEFT(MD5({partition_column}), 8), 16, 10)"
+        raise ValueError(f"Unsupported partition type: {partition_column_type}")
+
+    def _rewrite_filters(self, filters: List[Filter]) -> List[Filter]:
+        # partitionkey filters hold key-space positions, compared against the column they would be cast from otherwise
+        rewritten = []
+        for flt in filters:
+            if flt.type != 'partitionkey':
+                rewritten.append(flt)
+                continue
+            metadata: PartitionKeyMeta = flt.metadata
+            column = self._build_partition_key_expr(metadata.partition_column, metadata.partition_column_type)
+            rewritten.append(Filter(column=column, operator=flt.operator, value=flt.value))
+        return rewritten
 
     def _rewrite_query(self, query: Query) -> Query:
         # handle hash fields
@@ -97,17 +149,21 @@ class MySQLAdapter(Adapter):
                 new_gb.append(g)
         query.group_by=new_gb
         query.select.extend(new_gb)
+        query.filters = self._rewrite_filters(query.filters)
         return query
 
     def _build_sql(self, query: Query) -> (str, list):
         q = self._rewrite_query(query)
         return SqlBuilder.build(q)
 
-    def fetch(self, query: Query) -> list:
+    def fetch(self, query: Query, op_name: str="") -> list:
         sql, params = self._build_sql(query)
         self.cursor.execute(sql, params)
         return self.cursor.fetchall()
 
+    def fetch_one(self, query: Query, op_name: str="") -> Dict:
+        return self.fetch(query, op_name=op_name)[0]
+
     def execute(self, sql: str, params=None):
         self.cursor.execute(sql, params or [])
         self.conn.commit()
@@ -119,6 +175,121 @@ class MySQLAdapter(Adapter):
         stmt = f"INSERT INTO {table} ({','.join(cols)}) VALUES ({placeholders}) ON DUPLICATE KEY UPDATE {updates};"
         self.execute(stmt, vals)
 
+    def _merge_strategy(self):
+        merge_strategy = getattr(self.adapter_config, "merge_strategy", None)
+        return merge_strategy.strategy if merge_strategy else None
+
+    def _load_data(self) -> bool:
+        merge_strategy = getattr(self.adapter_config, "merge_strategy", None)
+        return bool(merge_strategy and merge_strategy.load_data_infile)
+
+    def _unique_columns(self, cols) -> List[str]:
+        meta_columns = self.adapter_config.meta_columns
+        return (meta_columns and meta_columns.unique_columns) or list(cols)
+
+    def _packet_limit(self) -> int:
+        # largest statement both server and client accept
+        if self._max_packet is None:
+            self.cursor.execute("SELECT @@max_allowed_packet AS max_allowed_packet")
+            server = int(self.cursor.fetchone()["max_allowed_packet"])
+            self._max_packet = min(server, self.conn.max_allowed_packet) - PACKET_HEADROOM
+        return self._max_packet
+
+    def _insert_statements(self, table: str, cols: List[str], rows: List[Dict]) -> List[str]:
+        # multi-row INSERTs, each as many rows as fit in max_allowed_packet
+        prefix = f"INSERT INTO {table} ({','.join(cols)}) VALUES "
+        suffix = ""
+        if self._merge_strategy() not in (DELETE_INSERT, COLLAPSE):
+            unique_columns = self._unique_columns(cols)
+            updates = ','.join(f"{c}=VALUES({c})" for c in cols if c not in unique_columns)
+            # updating a key column with itself turns duplicates into no-ops
+            suffix = f" ON DUPLICATE KEY UPDATE {updates or f'{cols[0]}={cols[0]}'}"
+        limit = self._packet_limit()
+        statements, values, size = [], [], len(prefix) + len(suffix)
+        encoding = self.conn.encoding
+        for row in rows:
+            value = self.conn.escape(tuple(row.get(c) for c in cols))
+            # the packet limit is in bytes; bytes values come back surrogate-escaped, as pymysql sends them
+            value_size = len(value.encode(encoding, "surrogateescape"))
+            if values and size + value_size + 1 > limit:
+                statements.append(prefix + ",".join(values) + suffix)
+                values, size = [], len(prefix) + len(suffix)
+            values.append(value)
+            size += value_size + 1
+        if values:
+            statements.append(prefix + ",".join(values) + suffix)
+        return statements
+
+    def _load_data_infile(self, table: str, cols: List[str], rows: List[Dict]):
+        # the rows go to an anonymous in-memory file the client streams from (a temp file where memfd is missing)
+        data = b"".join(b"\t".join(load_data_value(row.get(c)) for c in cols) + b"\n" for row in rows)
+        if hasattr(os, "memfd_create"):
+            fd = os.memfd_create("load_data")
+            path = f"/proc/self/fd/{fd}"
+        else:
+            fd, path = tempfile.mkstemp()
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+            self.cursor.execute(
+                f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} CHARACTER SET binary ({','.join(cols)})", (path,)
+            )
+        finally:
+            os.close(fd)
+            if not path.startswith("/proc/"):
+                os.unlink(path)
+
+    def write_batch(self, table: str, rows: List[Dict]):
+        """
+        Write a batch in one transaction.
+
+        Rows go out as multi-row INSERT ... ON DUPLICATE KEY UPDATE statements
+        sized to max_allowed_packet (plain INSERTs for delete_insert and
+        collapse sinks). A delete_insert sink with load_data_infile set streams
+        the batch with LOAD DATA LOCAL INFILE instead.
+        """
+        if not rows:
+            return
+        try:
+            self._write_rows(table, rows)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def _write_rows(self, table: str, rows: List[Dict]):
+        cols = list(rows[0].keys())
+        if self._merge_strategy() == DELETE_INSERT and self._load_data():
+            self._load_data_infile(table, cols, rows)
+        else:
+            for statement in self._insert_statements(table, cols, rows):
+                self.cursor.execute(statement)
+
+    def _build_delete_sql(self, query: Query) -> Tuple[str, list]:
+        q = self._rewrite_query(query)
+        return SqlBuilder.build_delete(q)
+
+    def delete(self, query: Query):
+        sql, params = self._build_delete_sql(query)
+        self.execute(sql, params)
+
+    def replace_rows(self, table: str, query: Query, batches: Iterable[List[Dict]]) -> int:
+        # range delete and the batches' inserts commit together
+        sql, params = self._build_delete_sql(query)
+        written = 0
+        try:
+            self.cursor.execute(sql, params)
+            for rows in batches:
+                if rows:
+                    self._write_rows(table, rows)
+                    written += len(rows)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return written
+
     def close(self):
         self.cursor.close()
         self.conn.close()
\ No newline at end of file
@@ -1,12 +1,79 @@
-from core.query import RowHashMeta, BlockHashMeta, BlockNameMeta
-from typing import Dict, Tuple
+from core.query import RowHashMeta, BlockHashMeta, BlockNameMeta, PartitionKeyMeta, QuantilesMeta, SketchMeta
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+import io
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, Union
+import uuid
 import psycopg2
 
-from core.config import HASH_MD5_HASH, MD5_SUM_HASH
+from core.config import COLLAPSE, DELETE_INSERT, HASH_MD5_HASH, HASHTEXT64_HASH, KEY_SPACE, MD5_SUM_HASH, MERGEABLE_STRATEGIES, SUM64_HASH
 from .base import Adapter
-from core.query import Query, Field
+from core.query import Query, Field, Filter
 from engine.sql_builder import SqlBuilder
 
+def key_to_uuid(key):
+    # smallest uuid whose leading 32 bits are key, None past the end of the key space
+    if key >= KEY_SPACE:
+        return None
+    return f"{int(key):08x}-0000-0000-0000-000000000000"
+
+
+def array_literal(values: Union[list, tuple]) -> str:
+    # a {...} array literal, elements quoted so commas, braces and quotes inside them survive
+    items = []
+    for value in values:
+        if value is None:
+            items.append("NULL")
+        elif isinstance(value, (list, tuple)):
+            items.append(array_literal(value))
+        else:
+            text = copy_scalar_text(value)
+            items.append('"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"')
+    return "{" + ",".join(items) + "}"
+
+
+def copy_scalar_text(value: Any) -> str:
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # bytea hex format
+        return "\\x" + bytes(value).hex()
+    if isinstance(value, dict):
+        return json.dumps(value)
+    if isinstance(value, timedelta):
+        return f"{value.total_seconds()} seconds"
+    if isinstance(value, (str, int, float, Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f"Cannot write a {type(value).__name__} value with COPY")
+
+
+def copy_text_value(value: Any, is_json: bool=False) -> str:
+    # a value in COPY text format: \N for NULL, backslash escapes for the delimiters
+    if value is None:
+        return "\\N"
+    if is_json:
+        # a json/jsonb column takes lists and scalars as JSON, str values are JSON text already
+        value = value if isinstance(value, str) else json.dumps(value)
+    elif isinstance(value, (list, tuple)):
+        value = array_literal(value)
+    else:
+        value = copy_scalar_text(value)
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def copy_text_buffer(rows: List[Dict], cols: List[str], json_columns: Iterable[str]=()) -> io.StringIO:
+    buffer = io.StringIO()
+    is_json = [c in json_columns for c in cols]
+    for row in rows:
+        buffer.write("\t".join(copy_text_value(row.get(c), j) for c, j in zip(cols, is_json)))
+        buffer.write("\n")
+    buffer.seek(0)
+    return buffer
+
+
 class PostgresAdapter(Adapter):
     def connect(self):
         cfg = self.store_config
@@ -16,6 +83,17 @@ class PostgresAdapter(Adapter):
             user=cfg['username'], password=cfg['password'], dbname=cfg['database']
         )
         self.cursor = self.conn.cursor()
+        self._json_columns = {}
+
+    def _build_partition_key_expr(self, partition_column: str, partition_column_type: str) -> str:
+        # integer the blocks of non-numeric partition columns are cut from
+        if partition_column_type == "date":
+            return f"({partition_column} - DATE '1970-01-01')"
+        elif partition_column_type == "uuid":
+            return f"('x'||left({partition_column}::text, 8))::bit(32)::bigint"
+        elif partition_column_type == "str":
+            return f"('x'||left(md5({partition_column}::text), 8))::bit(32)::bigint"
+        return partition_column
 
     def _build_group_name_expr(self, field: Field) -> str:
         metadata: BlockNameMeta = field.metadata
@@ -24,16 +102,24 @@ class PostgresAdapter(Adapter):
         partition_column = metadata.partition_column
         partition_column_type = metadata.partition_column_type
 
-        if partition_column_type == "int":
+        if metadata.encoding == "int":
+            # nested intervals: the level's block number alone names the block
+            if partition_column_type == "datetime":
+                return f"FLOOR(EXTRACT(EPOCH FROM {partition_column}) / {intervals[level-1]})::bigint"
+            key = self._build_partition_key_expr(partition_column, partition_column_type)
+            return f"FLOOR({key} / {intervals[level-1]})::bigint"
+
+        if partition_column_type in ("int", "date", "uuid", "str"):
             # For integer partition columns, we divide by the interval
+            key = self._build_partition_key_expr(partition_column, partition_column_type)
             segments = []
             for idx in range(level):
                 fct = intervals[idx]
                 if idx == 0:
-                    expr = f"FLOOR({partition_column} / {intervals[idx]})"
+                    expr = f"FLOOR({key} / {intervals[idx]})"
                 else:
                     prev = intervals[idx-1]
-                    expr = f"FLOOR(mod({partition_column}, {prev}) / {intervals[idx]})"
+                    expr = f"FLOOR(mod({key}, {prev}) / {intervals[idx]})"
                 segments.append(f"{expr}::text")
             return " || '-' || ".join(segments)
 
@@ -55,7 +141,15 @@ class PostgresAdapter(Adapter):
     def _build_rowhash_expr(self, field: Field) -> str:
         metadata: RowHashMeta = field.metadata
         expr=""
-        if metadata.hash_column:
+        if metadata.strategy == SUM64_HASH:
+            # first 8 bytes of the md5 as a signed bigint
+            source = f"{metadata.hash_column}::text" if metadata.hash_column else f"CONCAT({','.join([f'{x.expr}' for x in metadata.fields])})"
+            expr = f"(('x'||substr(md5({source}),1,16))::bit(64)::bigint)"
+        elif metadata.strategy == HASHTEXT64_HASH:
+            # native 64-bit text hash, about twice as fast as md5 and stable across Postgres versions
+            source = f"{metadata.hash_column}::text" if metadata.hash_column else f"CONCAT({','.join([f'{x.expr}' for x in metadata.fields])})"
+            expr = f"hashtextextended({source}, 0)"
+        elif metadata.hash_column:
             expr = metadata.hash_column
         elif metadata.strategy == MD5_SUM_HASH:
             concat = ",".join([f"{x.expr}" for x in metadata.fields])
@@ -72,9 +166,53 @@ class PostgresAdapter(Adapter):
             expr = f"sum({inner_expr}::numeric)"
         elif metadata.strategy == HASH_MD5_HASH:
             expr = f"md5(string_agg({inner_expr},',' order by {metadata.order_column}))"
+        elif metadata.strategy in MERGEABLE_STRATEGIES:
+            # unsigned sum modulo 2^64, the same value ClickHouse gets from a wrapping Int64 sum
+            expr = f"mod(mod(sum({inner_expr}), 18446744073709551616) + 18446744073709551616, 18446744073709551616)"
         return expr
 
 
+    def _build_quantiles_expr(self, field: Field):
+        metadata: QuantilesMeta = field.metadata
+        fractions = ",".join(str(x) for x in metadata.fractions)
+        return f"percentile_disc(ARRAY[{fractions}]::float8[]) WITHIN GROUP (ORDER BY {metadata.partition_column})"
+
+    def _build_sketch_expr(self, field: Field) -> str:
+        # one part of an invertible bloom lookup table cell over (key, rowhash) elements
+        metadata: SketchMeta = field.metadata
+        rowhash = self._build_rowhash_expr(Field(expr="rowhash", metadata=RowHashMeta(
+            strategy=metadata.strategy, hash_column=metadata.hash_column, fields=metadata.fields
+        )))
+        element = f"(('x'||substr(md5(CONCAT({metadata.key_column}::text, '|', ({rowhash})::text)),1,16))::bit(64)::bigint)"
+        if metadata.part == "cell":
+            return f"({metadata.index * metadata.width} + MOD((({element}) >> {16 * metadata.index}) & 65535, {metadata.width}))"
+        elif metadata.part == "key":
+            return f"BIT_XOR({metadata.key_column}::bigint)"
+        elif metadata.part == "hash":
+            return f"BIT_XOR({element})"
+        elif metadata.part == "check":
+            return f"BIT_XOR(('x'||substr(md5(({element})::text),1,16))::bit(64)::bigint)"
+        raise ValueError(f"Unsupported sketch part: {metadata.part}")
+
+    def _rewrite_filters(self, filters):
+        rewritten = []
+        for flt in filters:
+            if flt.type != 'partitionkey':
+                rewritten.append(flt)
+                continue
+            metadata: PartitionKeyMeta = flt.metadata
+            if metadata.partition_column_type == "uuid":
+                # uuids sort like their hex text, so key ranges are uuid ranges an index can serve
+                if flt.operator == 'in_ranges':
+                    value = [(key_to_uuid(s), key_to_uuid(e)) for s, e in flt.value]
+                    rewritten.append(Filter(column=metadata.partition_column, operator=flt.operator, value=value))
+                elif key_to_uuid(flt.value) is not None:
+                    rewritten.append(Filter(column=metadata.partition_column, operator=flt.operator, value=key_to_uuid(flt.value)))
+                # an upper bound at the end of the key space filters nothing
+                continue
+            column = self._build_partition_key_expr(metadata.partition_column, metadata.partition_column_type)
+            rewritten.append(Filter(column=column, operator=flt.operator, value=flt.value))
+        return rewritten
 
     def _rewrite_query(self, query: Query) -> Query:
         rewritten = []
@@ -88,9 +226,21 @@ class PostgresAdapter(Adapter):
             elif f.type == "rowhash":
                 expr = self._build_rowhash_expr(f)
                 rewritten.append(Field(expr=expr, alias=f.alias, type='column'))
+            elif f.type == "quantiles":
+                expr = self._build_quantiles_expr(f)
+                rewritten.append(Field(expr=expr, alias=f.alias, type='column'))
+            elif f.type == "sketch":
+                expr = self._build_sketch_expr(f)
+                rewritten.append(Field(expr=expr, alias=f.alias, type='column'))
             else:
                 rewritten.append(f)
         query.select = rewritten
+        query.order_by = [
+            f"MIN({self._build_partition_key_expr(o.metadata.partition_column, o.metadata.partition_column_type)})"
+            if isinstance(o, Field) and o.type == 'blockorder' else o
+            for o in query.order_by
+        ]
+        query.filters = self._rewrite_filters(query.filters)
 
         # Ensure group_by fields are included in select
         # query.select.extend(query.group_by)
@@ -105,27 +255,141 @@ class PostgresAdapter(Adapter):
         sql, params = self._build_sql(query)
         # import pdb;pdb.set_trace()
         # print(sql,params)
-        self.cursor.execute(sql, params)
+        try:
+            self.cursor.execute(sql, params)
+        except Exception:
+            # a failed statement aborts the transaction, the connection stays usable for the next query
+            self.conn.rollback()
+            raise
         cols = [d[0] for d in self.cursor.description]
         return [dict(zip(cols, row)) for row in self.cursor.fetchall()]
     
     def fetch_one(self, query: Query, op_name: str="") -> Dict:
         return self.fetch(query, op_name=op_name)[0]
 
+    def fetch_batches(self, query: Query, batch_size: int, op_name: str="") -> Iterator[List[Dict]]:
+        # named (server-side) cursor, only batch_size rows are held on the client at a time
+        sql, params = self._build_sql(query)
+        cursor = self.conn.cursor(name=f"batches_{uuid.uuid4().hex}")
+        try:
+            cursor.itersize = batch_size
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                cols = [d[0] for d in cursor.description]
+                yield [dict(zip(cols, row)) for row in rows]
+        finally:
+            cursor.close()
+            # the cursor lives in a transaction of its own
+            self.conn.commit()
+
     def execute(self, sql: str, params=None):
         self.cursor.execute(sql, params or [])
         self.conn.commit()
 
+    def _unique_columns(self, cols) -> List[str]:
+        meta_columns = self.adapter_config.meta_columns
+        return (meta_columns and meta_columns.unique_columns) or list(cols)
+
     def insert_or_update(self, table: str, row: dict):
         cols, vals = zip(*row.items())
         ph = ','.join(['%s'] * len(cols))
         up = ','.join([f"{c}=EXCLUDED.{c}" for c in cols])
         stmt = (
             f"INSERT INTO {table} ({','.join(cols)}) VALUES ({ph}) "
-            f"ON CONFLICT ({','.join(self.config.get('unique_keys', cols))}) DO UPDATE SET {up};"
+            f"ON CONFLICT ({','.join(self._unique_columns(cols))}) DO UPDATE SET {up};"
         )
         self.execute(stmt, vals)
 
+    def _merge_strategy(self):
+        merge_strategy = getattr(self.adapter_config, "merge_strategy", None)
+        return merge_strategy.strategy if merge_strategy else None
+
+    def _table_json_columns(self, table: str) -> set:
+        # json/jsonb columns of the sink table; lists going there are JSON arrays, not Postgres arrays
+        if table not in self._json_columns:
+            self.cursor.execute(
+                "SELECT attname FROM pg_attribute WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped "
+                "AND atttypid IN ('json'::regtype, 'jsonb'::regtype)",
+                [table]
+            )
+            self._json_columns[table] = {row[0] for row in self.cursor.fetchall()}
+        return self._json_columns[table]
+
+    def _copy_text_buffer(self, table: str, rows: List[Dict], cols: List[str]) -> io.StringIO:
+        return copy_text_buffer(rows, cols, self._table_json_columns(table))
+
+    def _copy_rows(self, table: str, rows: List[Dict]):
+        cols = list(rows[0].keys())
+        self.cursor.copy_expert(f"COPY {table} ({','.join(cols)}) FROM STDIN", self._copy_text_buffer(table, rows, cols))
+
+    def write_batch(self, table: str, rows: List[Dict]):
+        """
+        Write a batch with a single COPY, in one transaction.
+
+        delete_insert and collapse sinks have no rows to update, the batch is
+        copied straight into the table. Otherwise it is copied into a
+        temporary staging table and merged with one INSERT ... ON CONFLICT DO
+        UPDATE on the unique columns.
+        """
+        if not rows:
+            return
+        cols = list(rows[0].keys())
+        column_list = ','.join(cols)
+        try:
+            if self._merge_strategy() in (DELETE_INSERT, COLLAPSE):
+                self._copy_rows(table, rows)
+            else:
+                stage = f"stage_{table.replace('.', '_')}"
+                # emptied by every commit, so it is created once per connection and reused
+                self.cursor.execute(
+                    f"CREATE TEMP TABLE IF NOT EXISTS {stage} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+                )
+                self.cursor.copy_expert(f"COPY {stage} ({column_list}) FROM STDIN", self._copy_text_buffer(table, rows, cols))
+                unique_columns = self._unique_columns(cols)
+                updates = ','.join(f"{c}=EXCLUDED.{c}" for c in cols if c not in unique_columns)
+                self.cursor.execute(
+                    f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {stage} "
+                    f"ON CONFLICT ({','.join(unique_columns)}) "
+                    + (f"DO UPDATE SET {updates}" if updates else "DO NOTHING")
+                )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def _build_delete_sql(self, query: Query) -> Tuple[str, list]:
+        q = self._rewrite_query(query)
+        return SqlBuilder.build_delete(q)
+
+    def delete(self, query: Query):
+        sql, params = self._build_delete_sql(query)
+        self.execute(sql, params)
+
+    def replace_rows(self, table: str, query: Query, batches: Iterable[List[Dict]]) -> int:
+        """
+        Delete the rows matching the query and COPY the batches in their
+        place, all in one transaction.
+
+        Readers see either the old rows or the new ones, and a failure part
+        way through leaves the old rows in place.
+        """
+        sql, params = self._build_delete_sql(query)
+        written = 0
+        try:
+            self.cursor.execute(sql, params)
+            for rows in batches:
+                if rows:
+                    self._copy_rows(table, rows)
+                    written += len(rows)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return written
+
     def close(self):
         self.cursor.close()
         self.conn.close()
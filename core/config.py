@@ -13,6 +13,37 @@ from utils.utils_fn import generate_alias, generate_column_from_alias
 
 MD5_SUM_HASH = "md5sum_hash"
 HASH_MD5_HASH = "hash_md5_hash"
+SUM64_HASH = "sum64_hash"
+# Postgres only: native hashtextextended instead of md5
+HASHTEXT64_HASH = "hashtext64_hash"
+# block hashes of these strategies are sums of their children's, modulo 2^64
+MERGEABLE_STRATEGIES = (SUM64_HASH, HASHTEXT64_HASH)
+
+DEPTH_FIRST = "depth_first"
+BREADTH_FIRST = "breadth_first"
+SINGLE_PASS = "single_pass"
+
+EQUAL_WIDTH = "equal_width"
+EQUI_DEPTH = "equi_depth"
+
+# block names: '-' joined text segments, or one bigint per level (floor(key / interval))
+TEXT_BLOCK_IDS = "text"
+INT_BLOCK_IDS = "int"
+
+# sink merge strategies
+DELETE_INSERT = "delete_insert"
+UPSERT = "upsert"
+COLLAPSE = "collapse"
+
+# uuid and str partition keys are bucketed into integers in [0, KEY_SPACE):
+# the leading 32 bits of the uuid, or of the md5 of the string. uuid ranges are
+# rewritten into uuid comparisons an index on the column serves. str buckets
+# spread any key evenly, but their range filters (hash levels, chunked deletes)
+# are on the md5 expression and scan the table unless it has an index on that
+# expression, e.g. in Postgres ((('x'||left(md5(col::text), 8))::bit(32)::bigint)).
+# start and end of a keyed range are key-space positions (uuids are accepted for uuid keys)
+KEY_SPACE = 2**32
+KEYED_PARTITION_TYPES = ("uuid", "str")
 
 def parse_lambda_from_string(expr: str):
     """
@@ -57,12 +88,28 @@ def parse_dynamic_field(value: Any) -> Any:
     return value
 
 class Block:
-    def __init__(self, start: Union[datetime,int,str], end: Union[datetime,int,str], level: int, num_rows: int, hash: str):
+    def __init__(self, start: Union[datetime,int,str], end: Union[datetime,int,str], level: int, num_rows: int, hash: str, key_start: Any=None, key_end: Any=None, position: Optional[int]=None):
         self.start = start
         self.end = end
         self.level = level
         self.num_rows = num_rows
         self.hash = hash
+        # [key_start, key_end) on the secondary key of a split block, None where open
+        self.key_start = key_start
+        self.key_end = key_end
+        # integer offset of the block on its level's grid (epoch seconds, day number or key), from the block name
+        self.position = position
+
+    @property
+    def is_key_split(self) -> bool:
+        return self.key_start is not None or self.key_end is not None
+
+class RowDiff:
+    # unique keys (tuples of unique column values) that differ within a block
+    def __init__(self, inserts: List[tuple], updates: List[tuple], deletes: List[tuple]):
+        self.inserts = inserts
+        self.updates = updates
+        self.deletes = deletes
 
 class DynamicModel(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
@@ -158,6 +205,10 @@ class FieldConfig(DynamicModel):
 class MergeStrategyConfig(DynamicModel):
     strategy: Literal['delete_insert', 'upsert', 'collapse']
     allow_delete: bool = False
+    # delete_insert: rows replaced per transaction, larger blocks are replaced in sub-ranges
+    chunk_size: Optional[int] = None
+    # MySQL: write delete_insert batches with LOAD DATA LOCAL INFILE
+    load_data_infile: bool = False
 
 class TableConfig(DynamicModel):
     table: str
@@ -169,6 +220,7 @@ class StoreMeta(BaseModel):
     partition_column: Optional[str] = None
     hash_column: Optional[str] = None
     order_column: Optional[str] = None
+    updated_column: Optional[str] = None
     unique_columns: Optional[List[str]] = None
 
 class SourceConfig(DynamicModel):
@@ -179,6 +231,8 @@ class SourceConfig(DynamicModel):
     filters: Optional[List[FilterConfig]] = None
     fields: Optional[List[FieldConfig]] = None
     meta_columns: Optional[StoreMeta] = None
+    # rows per round trip when the load stage streams blocks from the source
+    batch_size: int = 1000
 
     @property
     def table_fields(self):
@@ -210,6 +264,10 @@ class SinkConfig(DynamicModel):
     datastore: str
     table: TableConfig
     batch_size: int
+    # a batch is also written once its rows reach about this many bytes
+    batch_bytes: Optional[int] = None
+    # ClickHouse: column holding the table's partition value, each insert then writes one partition
+    partition_by: Optional[str] = None
     adapter: Optional[str] = None
     merge_strategy: Optional[MergeStrategyConfig] = None
     filters: Optional[List[FilterConfig]] = []
@@ -233,13 +291,34 @@ AdapterConfig = Union[SourceConfig, SinkConfig, StateConfig]
 
 class ReconciliationConfig(DynamicModel):
     name: Optional[str] = 'default'
-    strategy: Literal["md5sum_hash", "hash_md5_hash"]
+    strategy: Literal["md5sum_hash", "hash_md5_hash", "sum64_hash", "hashtext64_hash"]
     partition_column_type: Literal['int', 'float', 'datetime', 'date', 'uuid', 'str']
     start: Optional[Union[str, Callable]] = None
     end: Optional[Union[str, Callable]] = None
     initial_partition_interval: int
     max_block_size: int = 1000
     partition_multiplier: int = 1
+    max_workers: int = 1
+    descent: Literal["depth_first", "breadth_first", "single_pass"] = DEPTH_FIRST
+    # local block-hash cache of agreed partitions, needs meta_columns.updated_column on both states
+    cache_path: Optional[str] = None
+    partitioning: Literal["equal_width", "equi_depth"] = EQUAL_WIDTH
+    # pick each block's child interval from its row count instead of a fixed reduction factor
+    adaptive_intervals: bool = False
+    # percent of the table sampled (TABLESAMPLE SYSTEM) when planning equi-depth partitions
+    partition_sample: Optional[float] = None
+    # int block ids are used where every interval divides the one above it
+    block_ids: Literal["text", "int"] = TEXT_BLOCK_IDS
+    # compare one count and hash of the whole range first, skip descent when in sync
+    range_fingerprint: bool = False
+    # cells of the IBLT sketch mismatched blocks are first compared with (single integer unique column, others use key lists)
+    sketch_size: Optional[int] = None
+    # top levels compared by row count, latest updated_column and a sum of key hashes instead of
+    # row hashes, which an index on (partition_column, updated_column, unique_columns) answers alone;
+    # needs updated_column on both states
+    summary_levels: int = 0
+    # split mismatched leaves still over max_block_size on order_column (or the first unique column)
+    split_hot_blocks: bool = False
     source_meta_columns: Optional[StoreMeta] = None
     sink_meta_columns: Optional[StoreMeta] = None
     sourcestate_meta_columns: Optional[StoreMeta] = None
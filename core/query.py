@@ -24,6 +24,29 @@ class BlockNameMeta:
     strategy: str
     partition_column_type: str
     intervals: Optional[List[int]]
+    encoding: str = 'text'      # 'text', 'int'
+
+
+@dataclass
+class QuantilesMeta:
+    partition_column: str
+    partition_column_type: str
+    fractions: List[float]
+
+@dataclass
+class SketchMeta:
+    part: str                   # 'cell', 'key', 'hash', 'check'
+    key_column: str
+    strategy: str
+    index: int = 0              # hash function of a 'cell' part
+    width: int = 1              # cells per hash function
+    hash_column: Optional[str] = None
+    fields: Optional[List['Field']] = field(default_factory=list)
+
+@dataclass
+class PartitionKeyMeta:
+    partition_column: str
+    partition_column_type: str
 
    
 
@@ -32,13 +55,16 @@ class Filter:
     column: str
     operator: str
     value: Any
+    type: str = 'column'        # 'column', 'partitionkey'
+    metadata: Optional[PartitionKeyMeta] = None
 
 @dataclass
 class Field:
     expr: str
     alias: Optional[str] = None
-    type: str = 'column'        # 'column', 'blockhash', 'blockname', 'rowhash'
-    metadata: Optional[Union[BlockHashMeta, BlockNameMeta, RowHashMeta]] = None
+    type: str = 'column'        # 'column', 'blockhash', 'blockname', 'rowhash', 'quantiles', 'blockorder', 'sketch'
+    metadata: Optional[Union[BlockHashMeta, BlockNameMeta, RowHashMeta, QuantilesMeta, PartitionKeyMeta, SketchMeta]] = None
+    params: Optional[List[Any]] = None     # values of %s placeholders in expr
 
 @dataclass
 class Table:
@@ -60,8 +86,10 @@ class Query:
     joins: Optional[List[Join]] = field(default_factory=list)
     filters: Optional[List[Filter]] = field(default_factory=list)
     group_by: Optional[List[Field]] = field(default_factory=list)
-    order_by: Optional[List[str]] = field(default_factory=list)
+    grouping_sets: Optional[List[List[Field]]] = field(default_factory=list)
+    order_by: Optional[List[Union[str, Field]]] = field(default_factory=list)
     limit: Optional[int] = None
+    sample: Optional[float] = None   # percent of the table to sample
 
     @property
     def json(self) -> str:
@@ -0,0 +1,113 @@
+import sqlite3
+from datetime import datetime
+from typing import Any, Optional
+
+from core.config import Block
+
+
+def encode_value(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class BlockHashCache:
+    """
+    Block hashes that source and sink agreed on in earlier runs, kept in a
+    local SQLite file.
+
+    Entries are scoped to a pipeline and reconciliation and keyed by level and
+    block range. Next to the hash an entry records the row count and each
+    side's watermark (latest value of the updated/order column) observed
+    before the block was hashed. It only vouches for a block while both sides
+    still report that row count and watermark, so any insert, delete or
+    watermark-bumping update sends the block back to hashing.
+    """
+
+    def __init__(self, path: str, pipeline: str, reconciliation: str):
+        self.path = path
+        self.pipeline = pipeline
+        self.reconciliation = reconciliation
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS block_hashes (
+                pipeline TEXT NOT NULL,
+                reconciliation TEXT NOT NULL,
+                level INTEGER NOT NULL,
+                block_start TEXT NOT NULL,
+                block_end TEXT NOT NULL,
+                strategy TEXT NOT NULL,
+                num_rows INTEGER NOT NULL,
+                hash TEXT,
+                source_watermark TEXT NOT NULL,
+                sink_watermark TEXT NOT NULL,
+                PRIMARY KEY (pipeline, reconciliation, level, block_start, block_end)
+            )
+            """
+        )
+        self.conn.commit()
+
+    def _key(self, level: int, start, end):
+        return (self.pipeline, self.reconciliation, level, encode_value(start), encode_value(end))
+
+    def match(self, level: int, start, end, strategy: str, source: Optional[Block], sink: Optional[Block]) -> Optional[Block]:
+        # source/sink carry the current row count and watermark of the block on each side
+        if source is None or sink is None:
+            return None
+        row = self.conn.execute(
+            """
+            SELECT strategy, num_rows, hash, source_watermark, sink_watermark FROM block_hashes
+            WHERE pipeline = ? AND reconciliation = ? AND level = ? AND block_start = ? AND block_end = ?
+            """,
+            self._key(level, start, end)
+        ).fetchone()
+        if row is None:
+            return None
+        cached_strategy, num_rows, block_hash, source_watermark, sink_watermark = row
+        if (
+            cached_strategy != strategy
+            or source.num_rows != num_rows
+            or sink.num_rows != num_rows
+            or encode_value(source.hash) != source_watermark
+            or encode_value(sink.hash) != sink_watermark
+        ):
+            return None
+        return Block(start=start, end=end, level=level, num_rows=num_rows, hash=block_hash)
+
+    def put(self, block: Block, strategy: str, source_watermark, sink_watermark):
+        if source_watermark is None or sink_watermark is None:
+            # without a watermark later changes can't be detected
+            return
+        self.conn.execute(
+            """
+            INSERT OR REPLACE INTO block_hashes
+            (pipeline, reconciliation, level, block_start, block_end, strategy, num_rows, hash, source_watermark, sink_watermark)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            self._key(block.level, block.start, block.end) + (
+                strategy,
+                block.num_rows,
+                encode_value(block.hash),
+                encode_value(source_watermark),
+                encode_value(sink_watermark)
+            )
+        )
+
+    def discard(self, level: int, start, end):
+        self.conn.execute(
+            """
+            DELETE FROM block_hashes
+            WHERE pipeline = ? AND reconciliation = ? AND level = ? AND block_start = ? AND block_end = ?
+            """,
+            self._key(level, start, end)
+        )
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,231 @@
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from adapters.base import Adapter
+from core.config import DELETE_INSERT, Block, ReconciliationConfig, RowDiff, SinkConfig, SourceConfig
+from core.query import Field, Filter, Query
+from engine.query_builder import build_filters_from_config, build_joins_from_config, build_table_from_config
+from engine.reconcile import build_key_filters, build_partition_filters, iter_row_diffs
+from utils.utils_fn import generate_alias
+
+# statuses whose blocks are copied from the source; N blocks are in sync and D blocks hold no source rows
+LOAD_STATUSES = ('A', 'M')
+# unique keys looked up or deleted per query when only the differing rows of a block are moved
+MAX_KEYS_PER_QUERY = 1000
+
+
+def build_unique_key_filter(unique_columns: List[str], keys: List[tuple]) -> Filter:
+    # rows whose unique key is one of keys, a row value comparison for composite keys
+    if len(unique_columns) == 1:
+        return Filter(column=unique_columns[0], operator="IN", value=tuple(key[0] for key in keys))
+    return Filter(column="(" + ", ".join(unique_columns) + ")", operator="IN", value=tuple(tuple(key) for key in keys))
+
+
+def build_source_rows_query(block: Block, config: SourceConfig, r_config: ReconciliationConfig, keys: Optional[List[tuple]]=None) -> Query:
+    # every source row of the block, or only those with the given unique keys, with the configured joins and filters
+    meta_columns = config.meta_columns
+    filters = build_partition_filters(meta_columns.partition_column, r_config.partition_column_type, block.start, block.end)
+    filters += build_key_filters(block, config)
+    if keys is not None:
+        filters.append(build_unique_key_filter(meta_columns.unique_columns, keys))
+    filters += build_filters_from_config(config)
+    return Query(
+        select=[Field(expr=f.column, alias=f.alias, type="column") for f in config.fields],
+        table=build_table_from_config(config),
+        joins=build_joins_from_config(config) if hasattr(config, 'joins') else [],
+        filters=filters
+    )
+
+
+def sink_table_name(config: SinkConfig) -> str:
+    table = config.table
+    return f"{table.dbschema}.{table.table}" if table.dbschema else table.table
+
+
+def to_sink_row(row: Dict[str, Any], config: SinkConfig) -> Dict[str, Any]:
+    # source row (keyed by field alias) to sink columns
+    out = {}
+    for field in config.fields:
+        if field.source:
+            # filled from an external store, not read from the source
+            continue
+        if callable(field.source_column):
+            out[field.column] = field.source_column(row)
+        else:
+            out[field.column] = row.get(generate_alias(field.source_column or field.column))
+    return out
+
+
+def row_size(row: Dict[str, Any]) -> int:
+    # rough size of a row on the wire, enough to bound a batch
+    return sum(len(str(v)) for v in row.values() if v is not None)
+
+
+def iter_sink_batches(
+    source: Adapter,
+    sink_config: SinkConfig,
+    block: Block,
+    r_config: ReconciliationConfig,
+    keys: Optional[List[tuple]]=None
+) -> Iterator[List[Dict]]:
+    """
+    Source rows of a block (or of its given unique keys) as sink rows, in
+    sink batches.
+
+    Rows are streamed from the source in SourceConfig.batch_size batches and
+    collected into sink batches across them, each handed out once it holds
+    SinkConfig.batch_size rows or SinkConfig.batch_bytes bytes, and the rest
+    at the end of the block. Memory stays flat however many rows the block
+    holds.
+    """
+    source_config = source.adapter_config
+    query = build_source_rows_query(block, source_config, r_config, keys=keys)
+    batch_bytes = getattr(sink_config, "batch_bytes", None)
+    rows, size = [], 0
+    for batch in source.fetch_batches(query, source_config.batch_size):
+        for row in batch:
+            rows.append(to_sink_row(row, sink_config))
+            if batch_bytes:
+                size += row_size(rows[-1])
+            if len(rows) >= sink_config.batch_size or (batch_bytes and size >= batch_bytes):
+                yield rows
+                rows, size = [], 0
+    if rows:
+        yield rows
+
+
+def load_block(source: Adapter, sink: Adapter, block: Block, r_config: ReconciliationConfig) -> int:
+    # merge the source rows of a block into the sink, returns the number of rows written
+    table = sink_table_name(sink.adapter_config)
+    written = 0
+    for rows in iter_sink_batches(source, sink.adapter_config, block, r_config):
+        sink.write_batch(table, rows)
+        written += len(rows)
+    return written
+
+
+def build_sink_keys_query(block: Block, config: SinkConfig, r_config: ReconciliationConfig, keys: List[tuple]) -> Query:
+    # the sink rows of a block with the given unique keys
+    meta_columns = config.meta_columns
+    filters = build_partition_filters(meta_columns.partition_column, r_config.partition_column_type, block.start, block.end)
+    filters.append(build_unique_key_filter(meta_columns.unique_columns, keys))
+    filters += build_filters_from_config(config)
+    return Query(select=[], table=build_table_from_config(config), filters=filters)
+
+
+def load_row_diff(source: Adapter, sink: Adapter, block: Block, diff: RowDiff, r_config: ReconciliationConfig, allow_delete: bool) -> int:
+    """
+    Move only the differing rows of a block: sink-only keys are deleted when
+    the merge strategy allows deletes, and the source rows of inserted and
+    updated keys are merged into the sink. Keys go MAX_KEYS_PER_QUERY at a
+    time. Returns the number of rows written.
+    """
+    sink_config = sink.adapter_config
+    table = sink_table_name(sink_config)
+    if allow_delete:
+        for i in range(0, len(diff.deletes), MAX_KEYS_PER_QUERY):
+            sink.delete(build_sink_keys_query(block, sink_config, r_config, diff.deletes[i:i+MAX_KEYS_PER_QUERY]))
+    keys = diff.inserts + diff.updates
+    written = 0
+    for i in range(0, len(keys), MAX_KEYS_PER_QUERY):
+        for rows in iter_sink_batches(source, sink_config, block, r_config, keys=keys[i:i+MAX_KEYS_PER_QUERY]):
+            sink.write_batch(table, rows)
+            written += len(rows)
+    return written
+
+
+def build_sink_delete_query(block: Block, config: SinkConfig, r_config: ReconciliationConfig) -> Query:
+    # the sink rows of a block: its range on the partition column, key range and the sink filters
+    meta_columns = config.meta_columns
+    filters = build_partition_filters(meta_columns.partition_column, r_config.partition_column_type, block.start, block.end)
+    if not filters:
+        # without a range the delete would empty the whole table
+        raise ValueError(f"Cannot delete a block range on a {r_config.partition_column_type} partition column")
+    filters += build_key_filters(block, config)
+    filters += build_filters_from_config(config)
+    return Query(select=[], table=build_table_from_config(config), filters=filters)
+
+
+def chunk_block(block: Block, chunk_size: Optional[int]) -> List[Block]:
+    # equal sub-ranges of about chunk_size rows, key-split blocks are already bounded
+    if not chunk_size or block.num_rows <= chunk_size or block.is_key_split:
+        return [block]
+    if not isinstance(block.start, (int, date)):
+        return [block]
+    count = -(-block.num_rows // chunk_size)
+    span = block.end - block.start
+    if isinstance(span, int):
+        step = max(1, -(-span // count))
+    elif isinstance(block.start, datetime):
+        step = span / count
+    else:
+        # dates only move by whole days
+        step = timedelta(days=max(1, -(-span.days // count)))
+    chunks, start = [], block.start
+    while start < block.end:
+        end = min(start + step, block.end)
+        chunks.append(Block(start, end, block.level, block.num_rows // count, None))
+        start = end
+    return chunks
+
+
+def replace_block(source: Adapter, sink: Adapter, block: Block, r_config: ReconciliationConfig, copy: bool=True) -> int:
+    """
+    Replace the sink rows of a block with its source rows.
+
+    Each chunk of the block (MergeStrategyConfig.chunk_size rows) is one
+    range DELETE on the sink followed by a bulk insert of the chunk's source
+    rows, in one sink transaction, so locks are held for a chunk at a time.
+    With copy=False the range is only emptied. Returns the number of rows
+    written.
+    """
+    sink_config = sink.adapter_config
+    table = sink_table_name(sink_config)
+    written = 0
+    for chunk in chunk_block(block, sink_config.merge_strategy.chunk_size):
+        query = build_sink_delete_query(chunk, sink_config, r_config)
+        batches = iter_sink_batches(source, sink_config, chunk, r_config) if copy else []
+        written += sink.replace_rows(table, query, batches)
+    return written
+
+
+def load(
+    pipeline: 'Pipeline',
+    r_config: ReconciliationConfig,
+    pairs: Iterable[Tuple[Block, str]]
+) -> int:
+    """
+    Bring the sink in line with the (block, status) pairs of a
+    reconciliation run, as discovery yields them.
+
+    A blocks are copied whole. For M blocks the states' row diff names the
+    keys that differ, and only those rows are moved (see load_row_diff);
+    without unique columns to diff by they are copied whole, or replaced
+    as a range when the merge strategy allows deletes. delete_insert sinks
+    replace the sink range of both. D blocks are emptied with range
+    deletes when the merge strategy allows deletes. Returns the number of
+    rows written.
+    """
+    merge_strategy = pipeline.sink.adapter_config.merge_strategy
+    strategy = merge_strategy.strategy if merge_strategy else None
+    allow_delete = bool(merge_strategy and merge_strategy.allow_delete)
+    sourcestate, sinkstate = pipeline.sourcestate, pipeline.sinkstate
+    if strategy != DELETE_INSERT and all(
+        state.adapter_config.meta_columns.unique_columns for state in (sourcestate, sinkstate)
+    ):
+        triples = iter_row_diffs(sourcestate, sinkstate, pairs, r_config)
+    else:
+        triples = ((block, status, None) for block, status in pairs)
+    written = 0
+    for block, status, diff in triples:
+        if status in LOAD_STATUSES and strategy == DELETE_INSERT:
+            written += replace_block(pipeline.source, pipeline.sink, block, r_config)
+        elif diff is not None:
+            written += load_row_diff(pipeline.source, pipeline.sink, block, diff, r_config, allow_delete)
+        elif status == 'M' and allow_delete:
+            written += replace_block(pipeline.source, pipeline.sink, block, r_config)
+        elif status in LOAD_STATUSES:
+            written += load_block(pipeline.source, pipeline.sink, block, r_config)
+        elif status == 'D' and allow_delete:
+            replace_block(pipeline.source, pipeline.sink, block, r_config, copy=False)
+    return written
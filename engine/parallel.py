@@ -0,0 +1,125 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Iterable, List, Optional
+
+
+def run_concurrently(*calls: Callable[[], Any]) -> List[Any]:
+    # first call runs on the current thread, the others on helper threads
+    if len(calls) <= 1:
+        return [call() for call in calls]
+    with ThreadPoolExecutor(max_workers=len(calls)-1) as pool:
+        futures = [pool.submit(call) for call in calls[1:]]
+        first = calls[0]()
+        return [first] + [future.result() for future in futures]
+
+
+class WorkStealingExecutor:
+    """
+    Run tasks on a fixed pool of threads, each owning a private deque.
+
+    A worker pops the newest task from its own deque (so a descent stays
+    depth-first on the worker that started it) and, when it runs dry, steals
+    the oldest task from a peer. Handlers may spawn child tasks which land on
+    the spawning worker's deque. ``run`` returns once every task, including
+    spawned ones, has finished (or the executor is cancelled); the first
+    handler error is re-raised.
+    """
+
+    def __init__(
+        self,
+        num_workers: int,
+        handler: Callable[[Any, Any, Callable[[Any], None]], None],
+        open_worker: Optional[Callable[[int], Any]] = None,
+        close_worker: Optional[Callable[[Any], None]] = None
+    ):
+        if num_workers < 1:
+            raise ValueError(f"num_workers must be >= 1, got {num_workers}")
+        self.num_workers = num_workers
+        self.handler = handler
+        self.open_worker = open_worker
+        self.close_worker = close_worker
+        self._deques: List[Deque[Any]] = []
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._error: Optional[BaseException] = None
+        self._cancelled = False
+
+    def cancel(self) -> None:
+        """Stop handing out tasks; ``run`` returns once running handlers finish."""
+        with self._cond:
+            self._cancelled = True
+            self._cond.notify_all()
+
+    def run(self, tasks: Iterable[Any]) -> None:
+        self._deques = [deque() for _ in range(self.num_workers)]
+        self._pending = 0
+        self._error = None
+        # round-robin the seed tasks so every worker starts with local work
+        for index, task in enumerate(tasks):
+            self._deques[index % self.num_workers].append(task)
+            self._pending += 1
+        if not self._pending:
+            return
+
+        threads = [
+            threading.Thread(target=self._work, args=(worker_id,), name=f"block-worker-{worker_id}", daemon=True)
+            for worker_id in range(self.num_workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _work(self, worker_id: int):
+        context = None
+        try:
+            context = self.open_worker(worker_id) if self.open_worker else None
+            spawn = lambda task: self._push(worker_id, task)
+            while True:
+                task = self._next_task(worker_id)
+                if task is None:
+                    break
+                try:
+                    self.handler(task, context, spawn)
+                finally:
+                    self._task_done()
+        except BaseException as exc:
+            self._fail(exc)
+        finally:
+            if context is not None and self.close_worker:
+                self.close_worker(context)
+
+    def _next_task(self, worker_id: int):
+        with self._cond:
+            while True:
+                if self._error is not None or self._pending == 0 or self._cancelled:
+                    return None
+                own = self._deques[worker_id]
+                if own:
+                    return own.pop()
+                for offset in range(1, self.num_workers):
+                    victim = self._deques[(worker_id + offset) % self.num_workers]
+                    if victim:
+                        return victim.popleft()
+                self._cond.wait()
+
+    def _push(self, worker_id: int, task: Any):
+        with self._cond:
+            self._deques[worker_id].append(task)
+            self._pending += 1
+            self._cond.notify()
+
+    def _task_done(self):
+        with self._cond:
+            self._pending -= 1
+            if self._pending == 0:
+                self._cond.notify_all()
+
+    def _fail(self, exc: BaseException):
+        with self._cond:
+            if self._error is None:
+                self._error = exc
+            self._cond.notify_all()
@@ -1,4 +1,5 @@
-from engine.reconcile import prepare_data_blocks
+from engine.load import load
+from engine.reconcile import iter_data_blocks
 from datetime import datetime
 from typing import Union
 import signal
@@ -120,6 +121,35 @@ class Pipeline:
         #             self.external_stores[e.externalstore] = get_external_adapter(e.externalstore, externalstores)
 
     
+    def _reconciliation_config(self, recon_name: str) -> ReconciliationConfig:
+        rconfig: ReconciliationConfig | None = next((p for p in self.config.reconciliation if p.name == recon_name), None)
+        if not rconfig:
+            raise ValueError(f"Reconciliation config with name {recon_name} not found")
+        return rconfig
+
+    def iter_blocks(self,
+        recon_name='default',
+        initial_partition_interval=None,
+        max_block_size: int= 1000,
+        interval_reduction_factor=10,
+        start: Union[int, str, datetime, None]=None,
+        end: Union[int, str, datetime, None]=None,
+        force_update=False,
+        max_workers: int=None,
+        descent: str=None,
+        cache_path: str=None,
+        partitioning: str=None,
+        adaptive_intervals: bool=None,
+        range_fingerprint: bool=None
+    ):
+        """
+        Merged (block, status) pairs in key order as discovery finalizes them,
+        so loading can start on the first windows while later ones are still
+        being compared.
+        """
+        rconfig = self._reconciliation_config(recon_name)
+        return iter_data_blocks(self, rconfig, initial_partition_interval, max_block_size, interval_reduction_factor, start, end, force_update, max_workers=max_workers, descent=descent, cache_path=cache_path, partitioning=partitioning, adaptive_intervals=adaptive_intervals, range_fingerprint=range_fingerprint)
+    
     def run(self, 
         recon_name='default',
         initial_partition_interval=None,
@@ -127,12 +157,17 @@ class Pipeline:
         interval_reduction_factor=10,
         start: Union[int, str, datetime, None]=None,
         end: Union[int, str, datetime, None]=None,
-        force_update=False
+        force_update=False,
+        max_workers: int=None,
+        descent: str=None,
+        cache_path: str=None,
+        partitioning: str=None,
+        adaptive_intervals: bool=None,
+        range_fingerprint: bool=None
     ):
-        rconfig: ReconciliationConfig | None = next((p for p in self.config.reconciliation if p.name == recon_name), None)
-        if not rconfig:
-            raise ValueError(f"Reconciliation config with name {recon_name} not found")
-        blocks, status = prepare_data_blocks(self, rconfig, initial_partition_interval, max_block_size, interval_reduction_factor, start, end, force_update)
+        # blocks are loaded as discovery finalizes them, not after the whole range is compared
+        rconfig = self._reconciliation_config(recon_name)
+        pairs = iter_data_blocks(self, rconfig, initial_partition_interval, max_block_size, interval_reduction_factor, start, end, force_update, max_workers=max_workers, descent=descent, cache_path=cache_path, partitioning=partitioning, adaptive_intervals=adaptive_intervals, range_fingerprint=range_fingerprint)
 
-        load(self, rconfig, blocks, status)
+        load(self, rconfig, pairs)
 
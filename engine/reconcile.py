@@ -1,14 +1,34 @@
-from core.config import Block
+from core.config import Block, RowDiff
+from dataclasses import replace
 from datetime import UTC, datetime, date, timedelta
+import bisect
+import hashlib
+import logging
 import math
-from typing import List, Literal, Tuple, Dict, Union
+from functools import partial
+import threading
+import uuid
+import numpy as np
+from typing import Any, Dict, Iterable, Iterator, List, Literal, Optional, Tuple, Union
 from adapters.base import Adapter
-from core.config import HASH_MD5_HASH, MD5_SUM_HASH, PipelineConfig, ReconciliationConfig, SinkConfig, SourceConfig, StateConfig
-from core.query import BlockHashMeta, BlockNameMeta, Join, Query, Field, Filter, RowHashMeta, Table
-from utils.utils_fn import add_tz, find_interval_factor, get_value
+from core.config import BREADTH_FIRST, DEPTH_FIRST, EQUAL_WIDTH, EQUI_DEPTH, INT_BLOCK_IDS, KEY_SPACE, KEYED_PARTITION_TYPES, SINGLE_PASS, HASH_MD5_HASH, MD5_SUM_HASH, MERGEABLE_STRATEGIES, SUM64_HASH, TEXT_BLOCK_IDS, PipelineConfig, ReconciliationConfig, SinkConfig, SourceConfig, StateConfig
+from engine.block_cache import BlockHashCache
+from engine.parallel import WorkStealingExecutor, run_concurrently
+from core.query import BlockHashMeta, BlockNameMeta, Join, PartitionKeyMeta, QuantilesMeta, Query, Field, Filter, RowHashMeta, SketchMeta, Table
+from utils.utils_fn import add_tz, find_interval_factor, get_value, largest_divisor_at_most
 
+logger = logging.getLogger(__name__)
 
-Status = Dict[Tuple[datetime, datetime, int], str]
+# upper bound of ranges folded into one batched block-hash query
+MAX_RANGES_PER_QUERY = 1000
+# depth guard when child intervals are chosen per block
+MAX_ADAPTIVE_LEVEL = 64
+# date partition values are cut into blocks by their day number
+EPOCH_DATE = date(1970, 1, 1)
+# block result sets at least this large are converted to blocks with numpy
+VECTORIZE_MIN_BLOCKS = 256
+# hash functions of a row sketch, each owning a third of the cells
+SKETCH_HASHES = 3
 
 
 def build_filters_from_config(config):
@@ -81,7 +101,16 @@ def partition_generator(start, end, initial_partition_interval, partition_column
         #     s1 = datetime.fromtimestamp(x, start.tzinfo)
         #     e1 = datetime.fromtimestamp(min(x+initial_partition_interval-1, end_timestamp), end.tzinfo)
         #     yield (s1, e1)
-    elif partition_column_type == "int":
+    elif partition_column_type == "date":
+        # intervals count days
+        initial_partition_interval = int(initial_partition_interval or 365)
+        cur = (start - EPOCH_DATE).days
+        end_day = (end - EPOCH_DATE).days
+        while cur<end_day:
+            cur1 = ((cur+initial_partition_interval)//initial_partition_interval)*initial_partition_interval
+            yield (EPOCH_DATE+timedelta(days=cur), EPOCH_DATE+timedelta(days=min(cur1, end_day)))
+            cur = cur1
+    elif partition_column_type in ("int",) + KEYED_PARTITION_TYPES:
         initial_partition_interval = initial_partition_interval or 200000
         cur = start
         while cur<end:
@@ -93,6 +122,25 @@ def partition_generator(start, end, initial_partition_interval, partition_column
         #     e1 = min(x+initial_partition_interval-1, end)
         #     yield (s1, e1)
 
+def key_space_bound(value, partition_column_type: str, upper: bool) -> int:
+    # user bound of a keyed range as a key-space position; a uuid is widened to the buckets it falls in
+    if isinstance(value, str) and value.isdigit():
+        value = int(value)
+    if isinstance(value, (str, uuid.UUID)) and partition_column_type == "uuid":
+        try:
+            number = uuid.UUID(str(value)).int
+        except ValueError:
+            raise ValueError(f"{value!r} is not a uuid")
+        key, rest = divmod(number, 2**96)
+        return key + 1 if upper and rest else key
+    if isinstance(value, bool) or not isinstance(value, int):
+        # md5 buckets keep no order of the strings, a str range can't be mapped
+        raise ValueError(f"Bounds of a {partition_column_type} partition column are key-space positions, got {value!r}")
+    if not 0 <= value <= KEY_SPACE:
+        raise ValueError(f"Key-space position {value} is outside [0, {KEY_SPACE}]")
+    return value
+
+
 def get_data_range(
         sourcestate: Adapter,
         sinkstate: Adapter,
@@ -104,11 +152,17 @@ def get_data_range(
     user_start = get_value(r_config.start) if start is None else start
     user_end = get_value(r_config.end) if end is None else end
 
+    if r_config.partition_column_type in KEYED_PARTITION_TYPES:
+        # keys are bucketed into a fixed key space, there is no range to look up
+        start = 0 if user_start is None else key_space_bound(user_start, r_config.partition_column_type, upper=False)
+        end = KEY_SPACE if user_end is None else key_space_bound(user_end, r_config.partition_column_type, upper=True)
+        return start, end
+
     sstart = user_start
     send = user_end
 
     if not (user_start and user_end):
-        if r_config.strategy in (MD5_SUM_HASH, HASH_MD5_HASH):
+        if r_config.strategy in (MD5_SUM_HASH, HASH_MD5_HASH) + MERGEABLE_STRATEGIES:
             query = build_data_range_query( sourcestate.adapter_config)
             result = sourcestate.fetch_one(query, op_name="range_search")
             sstart = result["start"] if result else None
@@ -124,7 +178,12 @@ def get_data_range(
 
             if send:
                 # add buffer of 1 for exclusive range
-                send = send+timedelta(seconds=1) if r_config.partition_column_type == "datetime" else send+1
+                if r_config.partition_column_type == "datetime":
+                    send = send+timedelta(seconds=1)
+                elif r_config.partition_column_type == "date":
+                    send = send+timedelta(days=1)
+                else:
+                    send = send+1
     
     sstart = max(user_start, sstart) if user_start else sstart
     send = min(user_end, send) if user_end else send
@@ -133,8 +192,135 @@ def get_data_range(
 
 
 
+def build_quantiles_query(
+    start: Union[datetime,int,str],
+    end: Union[datetime,int,str],
+    fractions: List[float],
+    config: Union[StateConfig, SourceConfig, SinkConfig],
+    r_config: ReconciliationConfig,
+    sample: float=None,
+    column: str=None
+) -> Query:
+    # quantiles of column (the partition column by default) among the rows in [start, end)
+    partition_column = config.meta_columns.partition_column
+    select = [
+        Field(expr=column or partition_column, alias="quantiles", type="quantiles", metadata=QuantilesMeta(
+            partition_column=column or partition_column,
+            partition_column_type=r_config.partition_column_type,
+            fractions=fractions
+        ))
+    ]
+    return Query(
+        select=select,
+        table=build_table_from_config(config),
+        joins=build_joins_from_config(config) if hasattr(config, 'joins') else [],
+        filters=build_partition_filters(partition_column, r_config.partition_column_type, start, end) + build_filters_from_config(config),
+        sample=sample
+    )
+
+def leaf_block_start(value, intervals, partition_column_type, tzinfo=None):
+    # start of the leaf block holding value, by the same arithmetic as the block names
+    if partition_column_type == "datetime":
+        x = math.floor(add_tz(value).timestamp())
+    elif partition_column_type == "date":
+        x = (value - EPOCH_DATE).days
+    else:
+        x = math.floor(value)
+    parts = [x // intervals[0]] + [(x % intervals[idx-1]) // intervals[idx] for idx in range(1, len(intervals))]
+    block_start = sum(part*interval for part, interval in zip(parts, intervals))
+    if partition_column_type == "datetime":
+        return datetime.fromtimestamp(block_start, tzinfo)
+    elif partition_column_type == "date":
+        return EPOCH_DATE + timedelta(days=block_start)
+    return block_start
+
+def plan_equi_depth_partitions(
+    sourcestate: Adapter,
+    sinkstate: Adapter,
+    start: Union[datetime,int,str],
+    end: Union[datetime,int,str],
+    r_config: ReconciliationConfig,
+    intervals: List[int],
+    num_partitions: int,
+    sample: float=None
+) -> List[Tuple[Union[datetime,int,str], Union[datetime,int,str]]]:
+    """
+    Split [start, end) into about num_partitions windows of similar row counts.
+
+    Cut points are the partition column quantiles of source and sink (so a
+    window is bounded on both sides), moved down to the start of their leaf
+    block so every block stays within a single window. Returns [] when no
+    quantiles could be computed, e.g. on an empty sample.
+    """
+    if r_config.partition_column_type in KEYED_PARTITION_TYPES:
+        # hashed and random keys already spread evenly over equal-width windows
+        return []
+    if num_partitions < 2:
+        return [(start, end)]
+    fractions = [round(i/num_partitions, 6) for i in range(1, num_partitions)]
+    src_rows, snk_rows = fetch_pair(
+        sourcestate,
+        build_quantiles_query(start, end, fractions, sourcestate.adapter_config, r_config, sample=sample),
+        sinkstate,
+        build_quantiles_query(start, end, fractions, sinkstate.adapter_config, r_config, sample=sample)
+    )
+    cuts = set()
+    for rows in (src_rows, snk_rows):
+        values = rows[0]["quantiles"] if rows else None
+        for value in values or []:
+            if value is None:
+                continue
+            cut = leaf_block_start(value, intervals, r_config.partition_column_type, getattr(start, 'tzinfo', None))
+            if start < cut < end:
+                cuts.add(cut)
+    if not cuts:
+        return []
+    bounds = [start] + sorted(cuts) + [end]
+    return list(zip(bounds, bounds[1:]))
+
+
+
+def format_partition_value(value, partition_column_type):
+    if partition_column_type == "datetime":
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+def partition_filter(partition_column, partition_column_type, operator, value) -> Filter:
+    if partition_column_type in KEYED_PARTITION_TYPES:
+        # values are positions in the key space, adapters translate them for the column
+        return Filter(
+            column=partition_column,
+            operator=operator,
+            value=value,
+            type='partitionkey',
+            metadata=PartitionKeyMeta(partition_column=partition_column, partition_column_type=partition_column_type)
+        )
+    if operator == 'in_ranges':
+        value = [(format_partition_value(s, partition_column_type), format_partition_value(e, partition_column_type)) for s, e in value]
+    else:
+        value = format_partition_value(value, partition_column_type)
+    return Filter(column=partition_column, operator=operator, value=value)
+
+def build_partition_filters(partition_column, partition_column_type, start, end) -> List[Filter]:
+    # [start, end) on the partition column
+    if partition_column_type not in ("datetime", "date", "int") + KEYED_PARTITION_TYPES:
+        return []
+    return [
+        partition_filter(partition_column, partition_column_type, '>=', start),
+        partition_filter(partition_column, partition_column_type, '<', end)
+    ]
+
+
 # Build Query object based on config and partition type
 
+def block_name_encoding(r_config: ReconciliationConfig, intervals: List[int], level: int) -> str:
+    # floor(key / interval) only names the same block as the text segments when intervals nest
+    if r_config.block_ids != INT_BLOCK_IDS:
+        return TEXT_BLOCK_IDS
+    if any(intervals[i-1] % intervals[i] for i in range(1, level)):
+        return TEXT_BLOCK_IDS
+    return INT_BLOCK_IDS
+
 def build_block_hash_query(
     start: Union[datetime,int,str], 
     end: Union[datetime,int,str], 
@@ -142,7 +328,8 @@ def build_block_hash_query(
     intervals: List[int],
     config: Union[StateConfig, SourceConfig, SinkConfig],
     r_config: ReconciliationConfig,
-    target: Literal["source", "sink"]
+    target: Literal["source", "sink"],
+    ranges: List[Tuple[Union[datetime,int,str], Union[datetime,int,str]]] = None
 ) -> Query:
     # import pdb;pdb.set_trace()
     partition_column_type = r_config.partition_column_type
@@ -172,7 +359,8 @@ def build_block_hash_query(
         intervals=intervals,
         partition_column_type=partition_column_type,
         strategy=r_config.strategy,
-        partition_column=partition_column   
+        partition_column=partition_column,
+        encoding=block_name_encoding(r_config, intervals, level)
     ), type="blockname")
 
     select = [
@@ -182,49 +370,229 @@ def build_block_hash_query(
     ]
     grp_field = Field(expr="blockname", type="column") 
 
-    filters = []
-    if partition_column_type=="datetime":
-        filters += [
-             Filter(column=partition_column, operator='>=', value=start.strftime("%Y-%m-%d %H:%M:%S")), 
-             Filter(column=partition_column, operator='<', value=end.strftime("%Y-%m-%d %H:%M:%S"))
-        ]
-    elif partition_column_type == "int":
-        filters += [
-             Filter(column=partition_column, operator='>=', value=start), 
-             Filter(column=partition_column, operator='<', value=end)
-        ]
-    elif partition_column_type == "str":
-        filters += [
-             Filter(column=partition_column, operator='>=', value=start), 
-             Filter(column=partition_column, operator='<', value=end)
-        ]
+    filters = build_partition_filters(partition_column, partition_column_type, start, end)
+    if ranges and len(ranges) > 1:
+        filters.append(partition_filter(partition_column, partition_column_type, 'in_ranges', list(ranges)))
     filters += build_filters_from_config(config)
     query = Query(
         select=select,
         table=build_table_from_config(config),
         joins=build_joins_from_config(config) if hasattr(config, 'joins') else [],
         filters=filters,
-        group_by=[grp_field]
+        group_by=[grp_field],
+        # blocks are disjoint key ranges, so their smallest key orders them like their names
+        order_by=[Field(
+            expr=f"MIN({partition_column})",
+            type="blockorder",
+            metadata=PartitionKeyMeta(partition_column=partition_column, partition_column_type=partition_column_type)
+        )]
     )
     return query
 
+def build_block_tree_hash_query(
+    start: Union[datetime,int,str],
+    end: Union[datetime,int,str],
+    max_level: int,
+    intervals: List[int],
+    config: Union[StateConfig, SourceConfig, SinkConfig],
+    r_config: ReconciliationConfig,
+    target: Literal["source", "sink"]
+) -> Query:
+    # block hashes of every level in a single scan, one grouping set per level
+    query = build_block_hash_query(start, end, max_level, intervals, config, r_config, target)
+    block_name_field = query.select.pop()
+    for level in range(1, max_level+1):
+        query.select.append(Field(
+            expr="blockname",
+            alias=f"blockname_{level}",
+            metadata=replace(block_name_field.metadata, level=level),
+            type="blockname"
+        ))
+    query.group_by = []
+    query.grouping_sets = [[Field(expr=f"blockname_{level}", type="column")] for level in range(1, max_level+1)]
+    return query
+
+def build_range_fingerprint_query(
+    start: Union[datetime,int,str],
+    end: Union[datetime,int,str],
+    intervals: List[int],
+    config: Union[StateConfig, SourceConfig, SinkConfig],
+    r_config: ReconciliationConfig,
+    target: Literal["source", "sink"]
+) -> Query:
+    # row count and one order independent hash of the whole range, without grouping.
+    # hash_md5_hash would string_agg every row of the range, so it is summed like sum64_hash instead
+    query = build_block_hash_query(start, end, 1, intervals, config, r_config, target)
+    strategy = r_config.strategy if r_config.strategy in MERGEABLE_STRATEGIES else SUM64_HASH
+    query.select = [
+        replace(f, metadata=replace(f.metadata, strategy=strategy)) if f.type == "blockhash" else f
+        for f in query.select if f.type != "blockname"
+    ]
+    query.group_by = []
+    query.order_by = []
+    return query
+
+def build_row_hash_query(
+    start: Union[datetime,int,str],
+    end: Union[datetime,int,str],
+    config: Union[StateConfig, SourceConfig, SinkConfig],
+    r_config: ReconciliationConfig,
+    target: Literal["source", "sink"]
+) -> Query:
+    # (unique key, row hash) of every row in [start, end), ordered by the key
+    meta_columns = config.meta_columns
+    unique_columns = meta_columns.unique_columns
+    if not unique_columns:
+        raise ValueError(f"Row level diff needs meta_columns.unique_columns on the {target} state")
+    row_hash_field = Field(
+        expr="rowhash",
+        alias="rowhash",
+        type="rowhash",
+        metadata=RowHashMeta(
+            strategy=r_config.strategy,
+            hash_column=meta_columns.hash_column,
+            fields=[Field(expr=x.column) for x in config.fields]
+        )
+    )
+    filters = build_partition_filters(meta_columns.partition_column, r_config.partition_column_type, start, end)
+    filters += build_filters_from_config(config)
+    return Query(
+        # keys are aliased so both sides line up even if their column names differ
+        select=[Field(expr=column, alias=f"key_{i}", type="column") for i, column in enumerate(unique_columns)] + [row_hash_field],
+        table=build_table_from_config(config),
+        joins=build_joins_from_config(config) if hasattr(config, 'joins') else [],
+        filters=filters,
+        order_by=list(unique_columns)
+    )
+
+def build_row_sketch_query(
+    start: Union[datetime,int,str],
+    end: Union[datetime,int,str],
+    width: int,
+    config: Union[StateConfig, SourceConfig, SinkConfig],
+    r_config: ReconciliationConfig,
+    target: Literal["source", "sink"]
+) -> Query:
+    # IBLT of the (key, rowhash) elements in [start, end): one grouping set per hash function
+    query = build_row_hash_query(start, end, config, r_config, target)
+    row_hash_meta = query.select[-1].metadata
+    key_column, = config.meta_columns.unique_columns
+
+    def sketch_field(alias, part, index=0):
+        return Field(expr=alias, alias=alias, type="sketch", metadata=SketchMeta(
+            part=part,
+            key_column=key_column,
+            strategy=row_hash_meta.strategy,
+            index=index,
+            width=width,
+            hash_column=row_hash_meta.hash_column,
+            fields=row_hash_meta.fields
+        ))
+
+    cells = [sketch_field(f"cell_{i}", "cell", i) for i in range(SKETCH_HASHES)]
+    query.select = cells + [
+        Field(expr="COUNT(1)", alias="row_count", type="column"),
+        sketch_field("key_xor", "key"),
+        sketch_field("hash_xor", "hash"),
+        sketch_field("check_xor", "check")
+    ]
+    query.grouping_sets = [[Field(expr=f"cell_{i}", type="column")] for i in range(SKETCH_HASHES)]
+    query.order_by = []
+    return query
+
+def build_block_summary_query(
+    start: Union[datetime,int,str],
+    end: Union[datetime,int,str],
+    level: int,
+    intervals: List[int],
+    config: Union[StateConfig, SourceConfig, SinkConfig],
+    r_config: ReconciliationConfig,
+    target: Literal["source", "sink"],
+    ranges: List[Tuple[Union[datetime,int,str], Union[datetime,int,str]]] = None,
+    key_hash: bool = False
+) -> Query:
+    # row count and latest watermark per block; the watermark takes the blockhash slot so to_blocks can read it
+    meta_columns = config.meta_columns
+    query = build_block_hash_query(start, end, level, intervals, config, r_config, target, ranges=ranges)
+    query.select = [
+        Field(expr=f"MAX({meta_columns.updated_column})", alias="blockhash", type="column") if f.type == "blockhash" else f
+        for f in query.select
+    ]
+    if key_hash:
+        # sum of the key hashes catches a delete and an insert that leave count and watermark alone
+        key_columns = meta_columns.unique_columns or [meta_columns.partition_column]
+        query.select.append(Field(
+            expr=meta_columns.partition_column,
+            alias="keyhash",
+            metadata=BlockHashMeta(
+                order_column=meta_columns.order_column,
+                partition_column=meta_columns.partition_column,
+                hash_column=None,
+                strategy=SUM64_HASH,
+                fields=[Field(expr=x) for x in key_columns],
+                partition_column_type=r_config.partition_column_type
+            ),
+            type="blockhash"
+        ))
+    return query
+
+def split_block_tree(rows, max_level) -> Dict[int, List[Dict]]:
+    # regroup the rows of a block tree query into per-level block hash rows
+    levels = {level: [] for level in range(1, max_level+1)}
+    for row in rows:
+        for level in range(1, max_level+1):
+            blockname = row[f"blockname_{level}"]
+            # names of levels outside the row's grouping set are NULL
+            if blockname is not None and blockname != '':
+                levels[level].append({"blockname": blockname, "blockhash": row["blockhash"], "row_count": row["row_count"]})
+                break
+    return levels
+
+def rollup_block_levels(rows, max_level, intervals) -> Dict[int, List[Dict]]:
+    # derive the hash rows of every level from the leaf level, for mergeable strategies
+    levels = {max_level: list(rows)}
+    for level in range(max_level-1, 0, -1):
+        parents = {}
+        for row in levels[level+1]:
+            if isinstance(row["blockname"], str):
+                # a parent's name is its child's name without the last segment
+                blockname = row["blockname"].rsplit('-', 1)[0]
+            else:
+                blockname = row["blockname"]*intervals[level]//intervals[level-1]
+            parent = parents.setdefault(blockname, {"blockname": blockname, "blockhash": 0, "row_count": 0})
+            parent["blockhash"] = (parent["blockhash"] + int(row["blockhash"])) % 2**64
+            parent["row_count"] += row["row_count"]
+        levels[level] = list(parents.values())
+    return levels
+
 def to_blocks(
     blocks_data,
     r_config: ReconciliationConfig, 
     start, 
     end,  
     level, 
-    intervals
+    intervals,
+    ranges=None
 ):
     # import pdb;pdb.set_trace()
+    # with several ranges (batched descent) each block is clipped to the range it belongs to
+    ranges = ranges or [(start, end)]
+    if len(blocks_data) >= VECTORIZE_MIN_BLOCKS and r_config.partition_column_type in ("datetime", "date", "int") + KEYED_PARTITION_TYPES:
+        return to_blocks_vectorized(blocks_data, r_config, start, end, level, intervals, ranges)
+    range_starts = [s for s, _ in ranges]
     blocks = []
     for block_data in blocks_data:
         blockname, blockhash, row_count = block_data["blockname"], block_data["blockhash"], block_data["row_count"]
-        parts = [int(x) for x in blockname.split('-')]
-        block_start = 0
-        for index, part_num in enumerate(parts):
-            block_start += part_num*intervals[index]
+        if isinstance(blockname, str):
+            parts = [int(x) for x in blockname.split('-')]
+            block_start = 0
+            for index, part_num in enumerate(parts):
+                block_start += part_num*intervals[index]
+        else:
+            # integer block id: the block number at this level
+            block_start = blockname*intervals[level-1]
         block_end = block_start+intervals[level-1]
+        position = block_start
         if r_config.partition_column_type == "datetime":
             # Convert timestamps to datetime objects with the same timezone awareness as start/end
             if getattr(start, 'tzinfo', None) is not None:
@@ -236,113 +604,608 @@ def to_blocks(
                 block_start_dt = datetime.fromtimestamp(block_start)
                 block_end_dt = datetime.fromtimestamp(block_end)
             
-            block_start = max(block_start_dt, start)
-            block_end = min(block_end_dt, end)
-        elif r_config.partition_column_type == "int":
-            block_start = max(block_start, start)
-            block_end = min(block_end,end)
+            block_start, block_end = block_start_dt, block_end_dt
+        elif r_config.partition_column_type == "date":
+            block_start, block_end = EPOCH_DATE+timedelta(days=block_start), EPOCH_DATE+timedelta(days=block_end)
+        if r_config.partition_column_type in ("datetime", "date", "int") + KEYED_PARTITION_TYPES:
+            range_index = bisect.bisect_right(range_starts, block_start) - 1
+            if range_index < 0 or ranges[range_index][1] <= block_start:
+                range_index += 1
+            range_start, range_end = ranges[min(range_index, len(ranges)-1)]
+            block_start = max(block_start, range_start)
+            block_end = min(block_end, range_end)
         block = Block(
             start=block_start, 
             end=block_end, 
             level=level,
             num_rows=row_count, 
-            hash=blockhash
+            hash=blockhash,
+            position=position
         )
         blocks.append(block)
     return blocks
 
 
+def to_partition_numbers(values, partition_column_type: str) -> np.ndarray:
+    # partition values as offsets on the block grid (epoch seconds, day numbers or keys)
+    if partition_column_type == "datetime":
+        return np.array([v.timestamp() for v in values], dtype=np.float64)
+    if partition_column_type == "date":
+        return np.array([(v - EPOCH_DATE).days for v in values], dtype=np.int64)
+    return np.array(values, dtype=np.int64)
+
+
+def from_partition_numbers(numbers: np.ndarray, partition_column_type: str, tzinfo=None) -> list:
+    if partition_column_type == "datetime":
+        # neighbouring blocks share bounds, so convert every distinct second once
+        unique, inverse = np.unique(numbers, return_inverse=True)
+        converted = [datetime.fromtimestamp(v, tzinfo) for v in unique.tolist()]
+        return [converted[i] for i in inverse.tolist()]
+    if partition_column_type == "date":
+        return (np.datetime64(EPOCH_DATE, 'D') + numbers).astype(object).tolist()
+    return numbers.tolist()
+
+
+def to_blocks_vectorized(
+    blocks_data,
+    r_config: ReconciliationConfig,
+    start,
+    end,
+    level,
+    intervals,
+    ranges
+):
+    """
+    Array-backed counterpart of to_blocks for large result sets: block names
+    are parsed and turned into clipped start/end offsets as int64 arrays, and
+    Block objects are only built at the end.
+    """
+    partition_column_type = r_config.partition_column_type
+    tzinfo = getattr(start, 'tzinfo', None) if partition_column_type == "datetime" else None
+    names = [block_data["blockname"] for block_data in blocks_data]
+    if isinstance(names[0], str):
+        parts = np.array('-'.join(names).split('-'), dtype=np.int64).reshape(len(names), level)
+        block_starts = parts @ np.array(intervals[:level], dtype=np.int64)
+    else:
+        block_starts = np.array(names, dtype=np.int64) * intervals[level-1]
+    block_ends = block_starts + intervals[level-1]
+
+    range_starts = to_partition_numbers([s for s, _ in ranges], partition_column_type)
+    range_ends = to_partition_numbers([e for _, e in ranges], partition_column_type)
+    range_index = np.searchsorted(range_starts, block_starts, side='right') - 1
+    past_range = (range_index < 0) | (range_ends[np.maximum(range_index, 0)] <= block_starts)
+    range_index = np.minimum(range_index + past_range, len(ranges)-1)
+    # clipped bounds take the range value itself, which may be finer than the grid
+    clip_start = block_starts < range_starts[range_index]
+    clip_end = block_ends > range_ends[range_index]
+
+    starts = from_partition_numbers(block_starts, partition_column_type, tzinfo)
+    ends = from_partition_numbers(block_ends, partition_column_type, tzinfo)
+    range_index = range_index.tolist()
+    for index in np.flatnonzero(clip_start).tolist():
+        starts[index] = ranges[range_index[index]][0]
+    for index in np.flatnonzero(clip_end).tolist():
+        ends[index] = ranges[range_index[index]][1]
+
+    return [
+        Block(
+            start=block_start,
+            end=block_end,
+            level=level,
+            num_rows=block_data["row_count"],
+            hash=block_data["blockhash"],
+            position=position
+        )
+        for block_start, block_end, position, block_data in zip(starts, ends, block_starts.tolist(), blocks_data)
+    ]
+
+
     
 
 
-def calculate_block_status(src_blocks: List[Block], snk_blocks: List[Block]) -> Tuple[List[Block], Status]:
-    status: Status = {}
-    all_keys = {(c.start, c.end, c.level) for c in src_blocks} | {(c.start, c.end, c.level) for c in snk_blocks}
-    src_map = {(c.start, c.end, c.level): c for c in src_blocks}
-    snk_map = {(c.start, c.end, c.level): c for c in snk_blocks}
-    result = []
+def block_position(block: Block):
+    # grid offset of blocks from to_blocks; blocks built by hand only have their start
+    return block.start if block.position is None else block.position
+
+
+def calculate_block_status(src_blocks: List[Block], snk_blocks: List[Block], ordered: bool=False) -> Tuple[List[Block], List[str]]:
+    """
+    Compare the blocks of one level by a merge over both sides in block order.
+
+    Blocks are matched on their integer grid position, so no datetimes are
+    compared. Block hash queries return blocks ordered (ordered=True) and are
+    merged as they come; rolled up and tree levels are grouped in Python or
+    by grouping sets, which keep no order, and are sorted first. Returns the
+    blocks and their statuses as parallel lists.
+    """
+    if not ordered:
+        src_blocks = sorted(src_blocks, key=block_position)
+        snk_blocks = sorted(snk_blocks, key=block_position)
+    result, statuses = [], []
+    i, j = 0, 0
+    while i < len(src_blocks) or j < len(snk_blocks):
+        sc = src_blocks[i] if i < len(src_blocks) else None
+        kc = snk_blocks[j] if j < len(snk_blocks) else None
+        if sc and kc and block_position(sc) == block_position(kc):
+            i += 1
+            j += 1
+            result.append(sc if sc.num_rows > kc.num_rows else kc)
+            statuses.append('N' if sc.num_rows == kc.num_rows and sc.hash == kc.hash else 'M')
+        elif kc is None or (sc is not None and block_position(sc) < block_position(kc)):
+            i += 1
+            result.append(sc)
+            statuses.append('A')
+        else:
+            j += 1
+            result.append(kc)
+            statuses.append('D')
+
+    return result, statuses
+
+def split_key_column(config: Union[StateConfig, SourceConfig, SinkConfig]) -> Optional[str]:
+    # secondary key hot blocks are split on, None if there is none besides the partition column
+    meta_columns = config.meta_columns
+    if meta_columns.order_column and meta_columns.order_column != meta_columns.partition_column:
+        return meta_columns.order_column
+    unique_columns = [c for c in meta_columns.unique_columns or [] if c != meta_columns.partition_column]
+    return unique_columns[0] if unique_columns else None
+
+
+def build_key_filters(block: Block, config: Union[StateConfig, SourceConfig, SinkConfig]) -> List[Filter]:
+    # keyset range of a split block on the side's secondary key
+    column = split_key_column(config)
+    filters = []
+    if block.key_start is not None:
+        filters.append(Filter(column=column, operator='>=', value=block.key_start))
+    if block.key_end is not None:
+        filters.append(Filter(column=column, operator='<', value=block.key_end))
+    return filters
+
+
+def build_key_range_hash_query(
+    block: Block,
+    cuts: List[Any],
+    config: Union[StateConfig, SourceConfig, SinkConfig],
+    r_config: ReconciliationConfig,
+    target: Literal["source", "sink"]
+) -> Query:
+    # row count and hash of each keyset range of a block, the range index is the number of cuts at or below the key
+    column = split_key_column(config)
+    query = build_range_fingerprint_query(block.start, block.end, [1], config, r_config, target)
+    bucket = "CASE " + " ".join(f"WHEN {column} < %s THEN {i}" for i in range(len(cuts))) + f" ELSE {len(cuts)} END"
+    query.select.append(Field(expr=bucket, alias="keyrange", type="column", params=list(cuts)))
+    query.group_by = [Field(expr="keyrange", type="column")]
+    return query
+
+
+def split_hot_block(
+    sourcestate: Adapter,
+    sinkstate: Adapter,
+    block: Block,
+    r_config: ReconciliationConfig,
+    max_block_size: int
+) -> List[Tuple[Block, str]]:
+    """
+    Split a block that can't be divided on the partition column any more,
+    e.g. thousands of rows sharing one timestamp, into keyset ranges of the
+    secondary key of about max_block_size rows.
+
+    Cut points are the key quantiles of source and sink, so every range is
+    bounded on both sides. The first and last range are open, so keys outside
+    the quantiles are covered too. The ranges are then hashed with one grouped
+    query per side and compared like blocks, so only the ranges that differ
+    stay M; ranges without rows on either side are left out.
+    """
+    src_column, snk_column = split_key_column(sourcestate.adapter_config), split_key_column(sinkstate.adapter_config)
+    if not src_column or not snk_column:
+        return [(block, 'M')]
+    num_splits = math.ceil(block.num_rows / max_block_size)
+    fractions = [round(i/num_splits, 6) for i in range(1, num_splits)]
+    src_rows, snk_rows = fetch_pair(
+        sourcestate,
+        build_quantiles_query(block.start, block.end, fractions, sourcestate.adapter_config, r_config, column=src_column),
+        sinkstate,
+        build_quantiles_query(block.start, block.end, fractions, sinkstate.adapter_config, r_config, column=snk_column)
+    )
+    cuts = sorted({value for rows in (src_rows, snk_rows) for value in (rows[0]["quantiles"] if rows else None) or [] if value is not None})
+    if not cuts:
+        return [(block, 'M')]
+    src_rows, snk_rows = fetch_pair(
+        sourcestate,
+        build_key_range_hash_query(block, cuts, sourcestate.adapter_config, r_config, "source"),
+        sinkstate,
+        build_key_range_hash_query(block, cuts, sinkstate.adapter_config, r_config, "sink")
+    )
+    bounds = [None] + cuts + [None]
+
+    def key_blocks(rows):
+        return [
+            Block(
+                start=block.start, end=block.end, level=block.level, num_rows=row["row_count"], hash=row["blockhash"],
+                key_start=bounds[row["keyrange"]], key_end=bounds[row["keyrange"]+1]
+            )
+            for row in rows
+        ]
 
-    for key in sorted(all_keys):
-        sc = src_map.get(key)
-        kc = snk_map.get(key)
-        sel = sc or kc
+    # keyrange stands in for the block start, the ranges are ordered by it
+    ranges = {}
+    for side, rows in (("source", src_rows), ("sink", snk_rows)):
+        for row, key_block in zip(rows, key_blocks(rows)):
+            ranges.setdefault(row["keyrange"], {})[side] = key_block
+    parts = []
+    for index in sorted(ranges):
+        sc, kc = ranges[index].get("source"), ranges[index].get("sink")
         if sc and kc:
-            sel = sc if sc.num_rows> kc.num_rows else kc
-        if sc and kc and sc.num_rows == kc.num_rows and sc.hash == kc.hash:
-            status[key] = 'N'
-        elif sc and kc:
-            status[key] = 'M'
-        elif sc and not kc:
-            status[key] = 'A'
+            status = 'N' if sc.num_rows == kc.num_rows and sc.hash == kc.hash else 'M'
+            parts.append((sc if sc.num_rows > kc.num_rows else kc, status))
         else:
-            status[key] = 'D'
-        result.append(sel)
+            parts.append((sc, 'A') if sc else (kc, 'D'))
+    return parts
 
-    return result, status           
 
-# Merge adjacent blocks with the same status ('M' or 'A') to optimize fewer queries
+def iter_split_hot_blocks(
+    sourcestate: Adapter,
+    sinkstate: Adapter,
+    pairs: Iterable[Tuple[Block, str]],
+    r_config: ReconciliationConfig,
+    max_block_size: int
+) -> Iterator[Tuple[Block, str]]:
+    # M blocks still over max_block_size after descent bottomed out are split on the secondary key
+    for c, st in pairs:
+        if st == 'M' and c.num_rows > max_block_size:
+            yield from split_hot_block(sourcestate, sinkstate, c, r_config, max_block_size)
+        else:
+            yield c, st
+
+
+# Merge adjacent blocks with the same status ('M', 'A' or 'D') to optimize fewer queries.
+# A and D blocks are whole-range copies/deletes, so only M blocks are capped at max_block_size
 def merge_adjacent(blocks: List[Block], statuses: List[str], max_block_size: int) -> Tuple[List[Block], List[str]]:
-    merged_blocks, merged_statuses = [], []
+    merged = list(iter_merge_adjacent(zip(blocks, statuses), max_block_size))
+    return [c for c, _ in merged], [st for _, st in merged]
 
-    for c, st in zip(blocks, statuses):
-        if st in ('M', 'A') and merged_blocks and merged_statuses[-1] == st and merged_blocks[-1].num_rows+c.num_rows <= max_block_size:
-            prev = merged_blocks[-1]
+def iter_merge_adjacent(pairs: Iterable[Tuple[Block, str]], max_block_size: int) -> Iterator[Tuple[Block, str]]:
+    # streaming merge_adjacent: an M/A/D block is held back until the next block shows it can't grow
+    held = None
+    for c, st in pairs:
+        if held and held[1] == st and not c.is_key_split and (st != 'M' or held[0].num_rows+c.num_rows <= max_block_size):
+            prev = held[0]
             prev.end = max(prev.end, c.end)
             prev.num_rows += c.num_rows
+            continue
+        if held:
+            yield held
+            held = None
+        if st in ('M', 'A', 'D') and not c.is_key_split:
+            held = (c, st)
         else:
-            merged_blocks.append(c)
-            merged_statuses.append(st)
+            yield c, st
+    if held:
+        yield held
 
-    return merged_blocks, merged_statuses
+def fetch_pair(sourcestate: Adapter, source_query: Query, sinkstate: Adapter, sink_query: Query):
+    if sourcestate is sinkstate:
+        # a single connection can't serve both queries at once
+        return sourcestate.fetch(source_query), sinkstate.fetch(sink_query)
+    src_rows, snk_rows = run_concurrently(
+        lambda: sourcestate.fetch(source_query),
+        lambda: sinkstate.fetch(sink_query)
+    )
+    return src_rows, snk_rows
 
-# # Main recursive calculation function
-def calculate_blocks(
-    sourcestate: Adapter, 
-    sinkstate: Adapter, 
-    start: Union[datetime,int,str], 
-    end: Union[datetime,int,str], 
-    level: int ,
+
+def is_summary_level(level: int, r_config: ReconciliationConfig) -> bool:
+    # top levels are compared by summaries, the ones below by row hashes
+    return level <= r_config.summary_levels
+
+
+def check_watermark_column(sourcestate: Adapter, sinkstate: Adapter, option: str):
+    # an in-place update moves neither count nor key hashes, only an updated_column watermark shows it
+    for target, state in (("source", sourcestate), ("sink", sinkstate)):
+        if not state.adapter_config.meta_columns.updated_column:
+            raise ValueError(f"{option} needs meta_columns.updated_column on the {target} state")
+
+
+def fold_summary_rows(rows: List[Dict]) -> List[Dict]:
+    # watermark and key hash compared as one block hash; sums come back as numeric or int depending on the store
+    return [
+        dict(row, blockhash=(row["blockhash"], None if row["keyhash"] is None else int(row["keyhash"])))
+        for row in rows
+    ]
+
+
+def compare_block_hashes(
+    sourcestate: Adapter,
+    sinkstate: Adapter,
+    start: Union[datetime,int,str],
+    end: Union[datetime,int,str],
+    level: int,
     r_config: ReconciliationConfig,
-    intervals: List[int], 
-    max_block_size: int,
-    max_level =100,
-    force_update=False
+    intervals: List[int],
+    ranges: List[Tuple[Union[datetime,int,str], Union[datetime,int,str]]] = None
 ) -> Tuple[List[Block], List[str]]:
-    # import pdb;pdb.set_trace()
-    source_query = build_block_hash_query(
+    # fetch block hashes of one level from both sides and compare them
+    summary = is_summary_level(level, r_config)
+    if summary:
+        check_watermark_column(sourcestate, sinkstate, "summary_levels")
+    build_query = partial(build_block_summary_query, key_hash=True) if summary else build_block_hash_query
+    source_query = build_query(
         start, 
         end, 
         level,
         intervals,
         sourcestate.adapter_config,
         r_config,
-        "source"
+        "source",
+        ranges=ranges
     )
-    sink_query = build_block_hash_query(
+    sink_query = build_query(
         start, 
         end, 
         level,
         intervals,
         sinkstate.adapter_config,
         r_config,
-        "sink"
+        "sink",
+        ranges=ranges
     )
 
-    src_rows = sourcestate.fetch(source_query)
-    snk_rows = sinkstate.fetch(sink_query)
+    src_rows, snk_rows = fetch_pair(sourcestate, source_query, sinkstate, sink_query)
+    if summary:
+        src_rows, snk_rows = fold_summary_rows(src_rows), fold_summary_rows(snk_rows)
 
     # import pdb;pdb.set_trace()
-    s_blocks = to_blocks(src_rows, r_config, start, end, level, intervals)
-    t_blocks = to_blocks(snk_rows, r_config, start, end, level, intervals)
+    s_blocks = to_blocks(src_rows, r_config, start, end, level, intervals, ranges=ranges)
+    t_blocks = to_blocks(snk_rows, r_config, start, end, level, intervals, ranges=ranges)
+
+    # ORDER BY MIN(partition key) returned both sides in block order
+    return calculate_block_status(s_blocks, t_blocks, ordered=True)
+
+
+def coalesce_ranges(ranges):
+    # join touching ranges so a batched query carries fewer predicates
+    merged = []
+    for s, e in ranges:
+        if merged and merged[-1][1] == s:
+            merged[-1] = (merged[-1][0], e)
+        else:
+            merged.append((s, e))
+    return merged
+
+
+def compare_block_hashes_batched(
+    sourcestate: Adapter,
+    sinkstate: Adapter,
+    ranges: List[Tuple[Union[datetime,int,str], Union[datetime,int,str]]],
+    level: int,
+    r_config: ReconciliationConfig,
+    intervals: List[int]
+) -> Tuple[List[Block], List[str]]:
+    # one query per side for all ranges of a level, chunked to keep statements bounded
+    all_blocks, all_statuses = [], []
+    for i in range(0, len(ranges), MAX_RANGES_PER_QUERY):
+        chunk = ranges[i:i+MAX_RANGES_PER_QUERY]
+        blocks, statuses = compare_block_hashes(
+            sourcestate,
+            sinkstate,
+            chunk[0][0],
+            chunk[-1][1],
+            level,
+            r_config,
+            intervals,
+            ranges=chunk
+        )
+        all_blocks.extend(blocks)
+        all_statuses.extend(statuses)
+    return all_blocks, all_statuses
+
+
+def fetch_partition_summaries(
+    sourcestate: Adapter,
+    sinkstate: Adapter,
+    partitions: List[Tuple[Union[datetime,int,str], Union[datetime,int,str]]],
+    start: Union[datetime,int,str],
+    end: Union[datetime,int,str],
+    level: int,
+    r_config: ReconciliationConfig,
+    intervals: List[int]
+) -> Tuple[Dict[Tuple, Block], Dict[Tuple, Block]]:
+    """
+    Row count and watermark of every partition, per side.
+
+    Blocks of ``level`` are summarized and folded into the partition they fall
+    in, so the level must be one whose blocks don't straddle partitions. The
+    watermark is carried in Block.hash; partitions without rows are left out.
+    """
+    src_rows, snk_rows = fetch_pair(
+        sourcestate,
+        build_block_summary_query(start, end, level, intervals, sourcestate.adapter_config, r_config, "source"),
+        sinkstate,
+        build_block_summary_query(start, end, level, intervals, sinkstate.adapter_config, r_config, "sink")
+    )
+    partition_starts = [s for s, _ in partitions]
+
+    def summarize(rows):
+        summaries = {}
+        for c in to_blocks(rows, r_config, start, end, level, intervals):
+            index = bisect.bisect_right(partition_starts, c.start) - 1
+            if index < 0 or partitions[index][1] <= c.start:
+                continue
+            s, e = partitions[index]
+            summary = summaries.get((s, e))
+            if summary is None:
+                summaries[(s, e)] = Block(start=s, end=e, level=1, num_rows=c.num_rows, hash=c.hash)
+                continue
+            summary.num_rows += c.num_rows
+            # an unknown watermark anywhere makes the partition's unknown
+            summary.hash = None if summary.hash is None or c.hash is None else max(summary.hash, c.hash)
+        return summaries
+
+    return summarize(src_rows), summarize(snk_rows)
+
+
+def split_cached_partitions(
+    partitions: List[Tuple[Union[datetime,int,str], Union[datetime,int,str]]],
+    summaries: Tuple[Dict[Tuple, Block], Dict[Tuple, Block]],
+    cache: BlockHashCache,
+    r_config: ReconciliationConfig,
+    force_update=False
+) -> Tuple[List[Tuple], List[Block]]:
+    # partitions still to hash, and blocks of the partitions the cache vouches for
+    src_summary, snk_summary = summaries
+    pending, cached = [], []
+    for s, e in partitions:
+        src, snk = src_summary.get((s, e)), snk_summary.get((s, e))
+        if src is None and snk is None:
+            # no rows on either side
+            continue
+        block = None if force_update else cache.match(1, s, e, r_config.strategy, src, snk)
+        if block:
+            cached.append(block)
+        else:
+            pending.append((s, e))
+    return pending, cached
+
+
+def update_block_cache(
+    cache: BlockHashCache,
+    partitions: List[Tuple[Union[datetime,int,str], Union[datetime,int,str]]],
+    blocks: List[Block],
+    statuses: List[str],
+    summaries: Tuple[Dict[Tuple, Block], Dict[Tuple, Block]],
+    r_config: ReconciliationConfig
+):
+    # remember partitions that matched as a whole, forget the rest
+    src_summary, snk_summary = summaries
+    partition_starts = [s for s, _ in partitions]
+    results = {}
+    for c, st in zip(blocks, statuses):
+        results.setdefault(bisect.bisect_right(partition_starts, c.start) - 1, []).append((c, st))
+    for index, (s, e) in enumerate(partitions):
+        cache.discard(1, s, e)
+        partition_results = results.get(index)
+        if not partition_results or any(st != 'N' for _, st in partition_results):
+            continue
+        src, snk = src_summary.get((s, e)), snk_summary.get((s, e))
+        num_rows = sum(c.num_rows for c, _ in partition_results)
+        if src and snk and src.num_rows == snk.num_rows == num_rows:
+            # a partition spanning several top level blocks has no single hash
+            block_hash = partition_results[0][0].hash if len(partition_results) == 1 else None
+            cache.put(Block(start=s, end=e, level=1, num_rows=num_rows, hash=block_hash), r_config.strategy, src.hash, snk.hash)
+    cache.commit()
+
+
+def match_range_fingerprint(
+    sourcestate: Adapter,
+    sinkstate: Adapter,
+    start: Union[datetime,int,str],
+    end: Union[datetime,int,str],
+    r_config: ReconciliationConfig,
+    intervals: List[int]
+) -> Optional[Block]:
+    """
+    Compare row count and fingerprint of the whole range on both sides.
+
+    Returns a level 0 block spanning the range if they match, None otherwise.
+    """
+    src_rows, snk_rows = fetch_pair(
+        sourcestate,
+        build_range_fingerprint_query(start, end, intervals, sourcestate.adapter_config, r_config, "source"),
+        sinkstate,
+        build_range_fingerprint_query(start, end, intervals, sinkstate.adapter_config, r_config, "sink")
+    )
+    src, snk = src_rows[0], snk_rows[0]
+    if src["row_count"] != snk["row_count"]:
+        return None
+    # sums come back as numeric or unsigned int depending on the store; an empty range sums to NULL or 0
+    src_hash = None if src["blockhash"] is None else int(src["blockhash"])
+    snk_hash = None if snk["blockhash"] is None else int(snk["blockhash"])
+    if src["row_count"] and src_hash != snk_hash:
+        return None
+    return Block(start=start, end=end, level=0, num_rows=src["row_count"], hash=src_hash)
+
+
+def needs_descent(block: Block, status: str, max_block_size: int, max_level: int) -> bool:
+    # the sink has no rows in an A block (the source none in a D block), so hashing its
+    # children can't change the outcome: it is copied (deleted) whole, whatever its size
+    return status == 'M' and block.num_rows > max_block_size and block.level < max_level
+
+
+def adaptive_child_interval(
+    block: Block,
+    interval: int,
+    max_block_size: int,
+    partition_column_type: str,
+    reduction_factor: int=None
+):
+    """
+    Interval for the children of ``block`` (of width ``interval``) that should
+    leave about max_block_size rows per child at the block's row density.
+
+    Only divisors of the parent interval are used, so children line up with
+    their parent. A prime or divisor-poor interval can leave only tiny
+    divisors; when the divisor would make more than reduction_factor² children
+    the fixed grid's step, interval // reduction_factor, is used instead.
+    Returns None when the block can't be split any further.
+    """
+    if interval <= 1:
+        return None
+    width = block.end - block.start
+    if partition_column_type == "datetime":
+        width = width.total_seconds()
+    elif partition_column_type == "date":
+        width = width.days
+    target = math.floor(max_block_size * width / max(block.num_rows, 1))
+    step = largest_divisor_at_most(interval, max(target, 1))
+    if reduction_factor and interval // step > reduction_factor**2:
+        step = max(interval // reduction_factor, 1)
+    return step
 
-    blocks, status_map = calculate_block_status(s_blocks, t_blocks)
+
+def child_intervals(
+    block: Block,
+    status: str,
+    intervals: List[int],
+    max_block_size: int,
+    max_level: int,
+    r_config: ReconciliationConfig,
+    adaptive: bool=False,
+    reduction_factor: int=None
+):
+    # intervals naming the children of block, None if the block is final
+    if not needs_descent(block, status, max_block_size, max_level):
+        return None
+    if not adaptive:
+        return intervals
+    step = adaptive_child_interval(block, intervals[block.level-1], max_block_size, r_config.partition_column_type, reduction_factor)
+    if step is None:
+        return None
+    return intervals[:block.level] + [step]
+
+
+# # Main recursive calculation function
+def calculate_blocks(
+    sourcestate: Adapter, 
+    sinkstate: Adapter, 
+    start: Union[datetime,int,str], 
+    end: Union[datetime,int,str], 
+    level: int ,
+    r_config: ReconciliationConfig,
+    intervals: List[int], 
+    max_block_size: int,
+    max_level =100,
+    force_update=False,
+    adaptive=False,
+    reduction_factor: int=None
+) -> Tuple[List[Block], List[str]]:
+    # import pdb;pdb.set_trace()
+    blocks, block_statuses = compare_block_hashes(sourcestate, sinkstate, start, end, level, r_config, intervals)
 
     final_blocks, statuses = [], []
-    for c in blocks:
-        key = (c.start, c.end, c.level)
-        st = status_map[key]
+    for c, st in zip(blocks, block_statuses):
+        deeper_intervals = child_intervals(c, st, intervals, max_block_size, max_level, r_config, adaptive=adaptive, reduction_factor=reduction_factor)
 
-        if st in ('M', 'A') and c.num_rows > max_block_size and level< max_level:
+        if deeper_intervals:
             # intervals[level] = math.floor(intervals[-1]/interval_reduction_factor)
             deeper_blocks, deeper_statuses = calculate_blocks(
                 sourcestate, 
@@ -351,10 +1214,12 @@ def calculate_blocks(
                 c.end, 
                 level+1,
                 r_config,
-                intervals, 
+                deeper_intervals, 
                 max_block_size,
                 max_level,
-                force_update=force_update
+                force_update=force_update,
+                adaptive=adaptive,
+                reduction_factor=reduction_factor
             )
             final_blocks.extend(deeper_blocks)
             statuses.extend(deeper_statuses)
@@ -367,6 +1232,260 @@ def calculate_blocks(
     # return merged_blocks, merged_statuses
 
 
+def calculate_blocks_batched(
+    sourcestate: Adapter,
+    sinkstate: Adapter,
+    start: Union[datetime,int,str],
+    end: Union[datetime,int,str],
+    r_config: ReconciliationConfig,
+    intervals: List[int],
+    max_block_size: int,
+    max_level=100,
+    compare_level=None,
+    adaptive=False,
+    reduction_factor: int=None
+) -> Tuple[List[Block], List[str]]:
+    """
+    Breadth-first variant of calculate_blocks.
+
+    All blocks that need descent at a level are refined together, so a
+    partition costs one source and one sink query per level instead of one
+    pair per mismatched block (per distinct child interval with adaptive
+    intervals). ``compare_level(ranges, level, intervals)`` replaces the
+    queries, e.g. to serve levels from an already fetched block tree.
+    """
+    if compare_level is None:
+        compare_level = lambda ranges, level, intervals: compare_block_hashes_batched(
+            sourcestate, sinkstate, ranges, level, r_config, intervals
+        )
+    final = []
+    # ranges to refine at the current level, keyed by the intervals naming their blocks
+    pending = {tuple(intervals): [(start, end)]}
+    level = 1
+    while pending and level <= max_level:
+        deeper = {}
+        for path, ranges in pending.items():
+            blocks, statuses = compare_level(ranges, level, list(path))
+            for c, st in zip(blocks, statuses):
+                deeper_intervals = child_intervals(c, st, list(path), max_block_size, max_level, r_config, adaptive=adaptive, reduction_factor=reduction_factor)
+                if deeper_intervals:
+                    deeper.setdefault(tuple(deeper_intervals), []).append((c.start, c.end))
+                else:
+                    final.append((c, st))
+        pending = {path: coalesce_ranges(sorted(ranges)) for path, ranges in deeper.items()}
+        level += 1
+    # blocks never overlap, finished blocks of all levels sort by their start
+    final.sort(key=lambda r: r[0].start)
+    return [c for c, _ in final], [st for _, st in final]
+
+
+def calculate_blocks_single_pass(
+    sourcestate: Adapter,
+    sinkstate: Adapter,
+    start: Union[datetime,int,str],
+    end: Union[datetime,int,str],
+    r_config: ReconciliationConfig,
+    intervals: List[int],
+    max_block_size: int,
+    max_level=100
+) -> Tuple[List[Block], List[str]]:
+    """
+    Fetch the hashes of all levels of a partition in one scan per side
+    (GROUPING SETS) and descend through them without further queries. With a
+    mergeable strategy only the leaf level is fetched and the parents are
+    summed up client-side.
+    """
+    max_level = min(max_level, len(intervals))
+    if r_config.strategy in MERGEABLE_STRATEGIES:
+        # parent hashes are sums of their children's, one leaf level scan covers the tree
+        src_rows, snk_rows = fetch_pair(
+            sourcestate,
+            build_block_hash_query(start, end, max_level, intervals, sourcestate.adapter_config, r_config, "source"),
+            sinkstate,
+            build_block_hash_query(start, end, max_level, intervals, sinkstate.adapter_config, r_config, "sink")
+        )
+        src_levels = rollup_block_levels(src_rows, max_level, intervals)
+        snk_levels = rollup_block_levels(snk_rows, max_level, intervals)
+    else:
+        src_rows, snk_rows = fetch_pair(
+            sourcestate,
+            build_block_tree_hash_query(start, end, max_level, intervals, sourcestate.adapter_config, r_config, "source"),
+            sinkstate,
+            build_block_tree_hash_query(start, end, max_level, intervals, sinkstate.adapter_config, r_config, "sink")
+        )
+        src_levels = split_block_tree(src_rows, max_level)
+        snk_levels = split_block_tree(snk_rows, max_level)
+
+    def compare_level(ranges, level, _intervals):
+        lo, hi = ranges[0][0], ranges[-1][1]
+        # children of blocks that aren't descended clip to an empty range, drop them
+        s_blocks = [c for c in to_blocks(src_levels[level], r_config, lo, hi, level, intervals, ranges=ranges) if c.start < c.end]
+        t_blocks = [c for c in to_blocks(snk_levels[level], r_config, lo, hi, level, intervals, ranges=ranges) if c.start < c.end]
+        return calculate_block_status(s_blocks, t_blocks)
+
+    return calculate_blocks_batched(
+        sourcestate,
+        sinkstate,
+        start,
+        end,
+        r_config,
+        intervals,
+        max_block_size,
+        max_level,
+        compare_level=compare_level
+    )
+
+
+def iter_blocks_parallel(
+    sourcestate: Adapter,
+    sinkstate: Adapter,
+    partitions: List[Tuple[Union[datetime,int,str], Union[datetime,int,str]]],
+    r_config: ReconciliationConfig,
+    intervals: List[int],
+    max_block_size: int,
+    max_level: int,
+    max_workers: int,
+    descent: str = DEPTH_FIRST,
+    adaptive: bool = False,
+    reduction_factor: int = None
+) -> Iterator[Tuple[int, List[Block], List[str]]]:
+    """
+    Discover blocks of all partitions on a pool of workers.
+
+    Every (partition, level) comparison is a task on a work-stealing queue, so
+    a partition with a deep mismatch is spread over idle workers instead of
+    holding up a single one. Breadth-first descent keeps one task per
+    partition and level covering all of its ranges, single-pass descent one
+    task per partition. Each worker opens its own
+    source and sink connections.
+
+    Yields ``(partition index, blocks, statuses)`` in partition order, each
+    partition as soon as it and all before it are finished, while the
+    workers carry on with later ones. Closing the generator stops the pool.
+    """
+    results = {index: [] for index in range(len(partitions))}
+    # outstanding tasks per partition, a partition is finished when it drops to 0
+    outstanding = [1] * len(partitions)
+    cond = threading.Condition()
+    state = {"stopped": False, "failed": False, "error": None}
+
+    def open_worker(worker_id: int):
+        src, snk = sourcestate.clone(), sinkstate.clone()
+        src.connect()
+        try:
+            snk.connect()
+        except Exception:
+            src.close()
+            raise
+        return src, snk
+
+    def close_worker(adapters):
+        for adapter in adapters:
+            adapter.close()
+
+    def discover(task, adapters, spawn):
+        index, ranges, level, path = task
+        src, snk = adapters
+        if descent == SINGLE_PASS:
+            (start, end), = ranges
+            blocks, statuses = calculate_blocks_single_pass(
+                src, snk, start, end, r_config, intervals, max_block_size, max_level
+            )
+            with cond:
+                results[index].extend(zip(blocks, statuses))
+            return
+        blocks, statuses = compare_block_hashes_batched(src, snk, ranges, level, r_config, list(path))
+        done, deeper = [], {}
+        for c, st in zip(blocks, statuses):
+            deeper_intervals = child_intervals(c, st, list(path), max_block_size, max_level, r_config, adaptive=adaptive, reduction_factor=reduction_factor)
+            if deeper_intervals:
+                deeper.setdefault(tuple(deeper_intervals), []).append((c.start, c.end))
+            else:
+                done.append((c, st))
+        for child_path, children in deeper.items():
+            if descent == BREADTH_FIRST:
+                spawn((index, coalesce_ranges(children), level+1, child_path))
+            else:
+                for child in children:
+                    spawn((index, [child], level+1, child_path))
+        with cond:
+            results[index].extend(done)
+
+    def handle(task, adapters, spawn):
+        index = task[0]
+
+        def spawn_child(child):
+            with cond:
+                outstanding[index] += 1
+            spawn(child)
+
+        try:
+            discover(task, adapters, spawn_child)
+        except BaseException:
+            with cond:
+                state["failed"] = True
+            raise
+        finally:
+            with cond:
+                outstanding[index] -= 1
+                cond.notify_all()
+
+    executor = WorkStealingExecutor(max_workers, handle, open_worker, close_worker)
+
+    def run():
+        try:
+            executor.run((index, [(s, e)], 1, tuple(intervals)) for index, (s, e) in enumerate(partitions))
+        except BaseException as exc:
+            state["error"] = exc
+        finally:
+            with cond:
+                state["stopped"] = True
+                cond.notify_all()
+
+    runner = threading.Thread(target=run, name="block-discovery", daemon=True)
+    runner.start()
+    try:
+        for index in range(len(partitions)):
+            with cond:
+                while outstanding[index] and not state["stopped"] and not state["failed"]:
+                    cond.wait()
+                if outstanding[index] or state["failed"]:
+                    break
+                window = results.pop(index)
+            # blocks of a partition never overlap, their start restores the serial order
+            window.sort(key=lambda r: r[0].start)
+            yield index, [c for c, _ in window], [st for _, st in window]
+    finally:
+        executor.cancel()
+        runner.join()
+    if state["error"] is not None:
+        raise state["error"]
+
+
+def calculate_blocks_parallel(
+    sourcestate: Adapter,
+    sinkstate: Adapter,
+    partitions: List[Tuple[Union[datetime,int,str], Union[datetime,int,str]]],
+    r_config: ReconciliationConfig,
+    intervals: List[int],
+    max_block_size: int,
+    max_level: int,
+    max_workers: int,
+    descent: str = DEPTH_FIRST,
+    adaptive: bool = False,
+    reduction_factor: int = None
+) -> Tuple[List[Block], List[str]]:
+    # blocks of all partitions in partition order, see iter_blocks_parallel
+    all_blocks, all_statuses = [], []
+    for _, blocks, statuses in iter_blocks_parallel(
+        sourcestate, sinkstate, partitions, r_config, intervals, max_block_size, max_level, max_workers,
+        descent=descent, adaptive=adaptive, reduction_factor=reduction_factor
+    ):
+        all_blocks.extend(blocks)
+        all_statuses.extend(statuses)
+    return all_blocks, all_statuses
+
+
 def build_blocks(
     sourcestate: Adapter, 
     sinkstate: Adapter, 
@@ -375,34 +1494,335 @@ def build_blocks(
     r_config: ReconciliationConfig,
     max_block_size: int,
     intervals=[],
-    force_update=False
+    force_update=False,
+    max_workers: int=1,
+    descent: str=DEPTH_FIRST,
+    cache: BlockHashCache=None,
+    partitioning: str=EQUAL_WIDTH,
+    partition_sample: float=None,
+    adaptive_intervals: bool=False,
+    range_fingerprint: bool=False
     
 )->Tuple[List[Block], List[str]]:
-    # import pdb;pdb.set_trace()
+    merged = list(iter_blocks(
+        sourcestate,
+        sinkstate,
+        start,
+        end,
+        r_config,
+        max_block_size,
+        intervals,
+        force_update=force_update,
+        max_workers=max_workers,
+        descent=descent,
+        cache=cache,
+        partitioning=partitioning,
+        partition_sample=partition_sample,
+        adaptive_intervals=adaptive_intervals,
+        range_fingerprint=range_fingerprint
+    ))
+    return [c for c, _ in merged], [st for _, st in merged]
+
+
+def iter_blocks(
+    sourcestate: Adapter,
+    sinkstate: Adapter,
+    start: Union[datetime,int,str],
+    end: Union[datetime,int,str],
+    r_config: ReconciliationConfig,
+    max_block_size: int,
+    intervals=[],
+    force_update=False,
+    max_workers: int=1,
+    descent: str=DEPTH_FIRST,
+    cache: BlockHashCache=None,
+    partitioning: str=EQUAL_WIDTH,
+    partition_sample: float=None,
+    adaptive_intervals: bool=False,
+    range_fingerprint: bool=False
+) -> Iterator[Tuple[Block, str]]:
+    """
+    Streaming build_blocks: yields merged (block, status) pairs in key order,
+    partition by partition as each one is compared, so a consumer can start
+    loading the first blocks while later partitions are still discovered.
+    An M/A block at the end of a partition is held until the next partition
+    shows whether it merges on.
+
+    With ``range_fingerprint`` both sides first compare a single count and
+    hash of the whole range and skip planning and descent when they agree.
+    """
     partition_column_type = r_config.partition_column_type
     max_level = len(intervals)
     if partition_column_type == "datetime":
         start, end = add_tz(start), add_tz(end)
-    # @TODO implement parallelism for fast chunk calculation
-    # import pdb;pdb.set_trace()
-    all_blocks, all_statuses = [], []
-    # import pdb;pdb.set_trace()
-    for s, e in partition_generator(start, end, intervals[0], partition_column_type):
-        blocks, statuses = calculate_blocks(
+    if range_fingerprint:
+        block = match_range_fingerprint(sourcestate, sinkstate, start, end, r_config, intervals)
+        if block is not None:
+            yield block, 'N'
+            return
+    partitions = list(partition_generator(start, end, intervals[0], partition_column_type))
+    summary_level = 1
+    if partitioning == EQUI_DEPTH:
+        planned = plan_equi_depth_partitions(
+            sourcestate, sinkstate, start, end, r_config, intervals, len(partitions), sample=partition_sample
+        )
+        if planned:
+            # planned windows are only aligned to leaf blocks
+            partitions, summary_level = planned, max_level
+
+    cached_blocks = []
+    if cache is not None:
+        check_watermark_column(sourcestate, sinkstate, "cache_path")
+        # a count/watermark scan is much cheaper than hashing, use it to skip unchanged partitions
+        summaries = fetch_partition_summaries(sourcestate, sinkstate, partitions, start, end, summary_level, r_config, intervals)
+        partitions, cached_blocks = split_cached_partitions(partitions, summaries, cache, r_config, force_update=force_update)
+
+    # planning and summaries keep the fixed grid, adaptive descent only starts from its top level.
+    # single pass needs every level up front and always uses the fixed grid
+    adaptive = adaptive_intervals and descent != SINGLE_PASS
+    descent_intervals = intervals[:1] if adaptive else intervals
+    descent_max_level = MAX_ADAPTIVE_LEVEL if adaptive else max_level
+    # the fixed grid's reduction factor bounds how many children an adaptive step may make
+    reduction_factor = intervals[0] // intervals[1] if len(intervals) > 1 else None
+
+    def calculate_partition(s, e):
+        if descent == SINGLE_PASS:
+            return calculate_blocks_single_pass(
+                sourcestate,
+                sinkstate,
+                s,
+                e,
+                r_config,
+                intervals,
+                max_block_size,
+                max_level
+            )
+        if descent == BREADTH_FIRST:
+            return calculate_blocks_batched(
+                sourcestate,
+                sinkstate,
+                s,
+                e,
+                r_config,
+                descent_intervals,
+                max_block_size,
+                descent_max_level,
+                adaptive=adaptive,
+                reduction_factor=reduction_factor
+            )
+        return calculate_blocks(
             sourcestate, 
             sinkstate, 
             s, 
             e, 
             1,
             r_config,
-            intervals,
+            descent_intervals,
             max_block_size,
-            max_level,
-            force_update=force_update
+            descent_max_level,
+            force_update=force_update,
+            adaptive=adaptive,
+            reduction_factor=reduction_factor
         )
-        all_blocks.extend(blocks)
-        all_statuses.extend(statuses)
-    return merge_adjacent(all_blocks, all_statuses, max_block_size)
+
+    if max_workers > 1:
+        windows = iter_blocks_parallel(
+            sourcestate,
+            sinkstate,
+            partitions,
+            r_config,
+            descent_intervals,
+            max_block_size,
+            descent_max_level,
+            max_workers,
+            descent=descent,
+            adaptive=adaptive,
+            reduction_factor=reduction_factor
+        )
+    else:
+        windows = ((index, *calculate_partition(s, e)) for index, (s, e) in enumerate(partitions))
+
+    def ordered_blocks():
+        # cached partitions are slotted in before the first computed partition after them
+        next_cached = 0
+        for index, blocks, statuses in windows:
+            s, e = partitions[index]
+            while next_cached < len(cached_blocks) and cached_blocks[next_cached].start < s:
+                yield cached_blocks[next_cached], 'N'
+                next_cached += 1
+            if cache is not None:
+                update_block_cache(cache, [(s, e)], blocks, statuses, summaries, r_config)
+            yield from zip(blocks, statuses)
+        for c in cached_blocks[next_cached:]:
+            yield c, 'N'
+
+    pairs = ordered_blocks()
+    if r_config.split_hot_blocks:
+        pairs = iter_split_hot_blocks(sourcestate, sinkstate, pairs, r_config, max_block_size)
+    try:
+        yield from iter_merge_adjacent(pairs, max_block_size)
+    finally:
+        # stops the worker pool when the consumer gives up early
+        windows.close()
+
+
+def diff_rows(src_rows: List[Dict], snk_rows: List[Dict]) -> RowDiff:
+    """
+    Sorted merge of (unique key, rowhash) rows into the keys to insert,
+    update and delete on the sink. Rows arrive ordered by key; the sort is
+    a single pass over them that also guards against the two stores
+    collating keys differently.
+    """
+    def keyed(rows):
+        return sorted(((tuple(v for k, v in row.items() if k != "rowhash"), row["rowhash"]) for row in rows), key=lambda r: r[0])
+
+    src, snk = keyed(src_rows), keyed(snk_rows)
+    inserts, updates, deletes = [], [], []
+    i, j = 0, 0
+    while i < len(src) or j < len(snk):
+        if j == len(snk) or (i < len(src) and src[i][0] < snk[j][0]):
+            inserts.append(src[i][0])
+            i += 1
+        elif i == len(src) or snk[j][0] < src[i][0]:
+            deletes.append(snk[j][0])
+            j += 1
+        else:
+            if src[i][1] != snk[j][1]:
+                updates.append(src[i][0])
+            i += 1
+            j += 1
+    return RowDiff(inserts=inserts, updates=updates, deletes=deletes)
+
+
+def sketch_cells(element: int, width: int) -> List[int]:
+    # cell of every hash function, from 16 bit slices of the element hash (same as in SQL)
+    return [i*width + ((element >> 16*i) & 0xFFFF) % width for i in range(SKETCH_HASHES)]
+
+
+def sketch_check(element: int) -> int:
+    return int.from_bytes(hashlib.md5(str(element).encode()).digest()[:8], 'big', signed=True)
+
+
+def decode_sketches(src_rows: List[Dict], snk_rows: List[Dict], width: int) -> Optional[RowDiff]:
+    """
+    Subtract the sink's row sketch from the source's and peel the
+    difference. Returns the differing keys, or None if the difference is too
+    large for the sketch to decode.
+    """
+    cells = {}
+    for sign, rows in ((1, src_rows), (-1, snk_rows)):
+        for row in rows:
+            cell = next(row[f"cell_{i}"] for i in range(SKETCH_HASHES) if row[f"cell_{i}"] is not None)
+            counts = cells.setdefault(int(cell), [0, 0, 0, 0])
+            counts[0] += sign*row["row_count"]
+            counts[1] ^= int(row["key_xor"])
+            counts[2] ^= int(row["hash_xor"])
+            counts[3] ^= int(row["check_xor"])
+
+    def is_pure(counts):
+        return counts[0] in (1, -1) and counts[3] == sketch_check(counts[2])
+
+    src_only, snk_only = set(), set()
+    queue = [cell for cell, counts in cells.items() if is_pure(counts)]
+    while queue:
+        counts = cells[queue.pop()]
+        if not is_pure(counts):
+            continue
+        sign, key, element = counts[0], counts[1], counts[2]
+        (src_only if sign == 1 else snk_only).add(key)
+        for cell in sketch_cells(element, width):
+            other = cells.setdefault(cell, [0, 0, 0, 0])
+            other[0] -= sign
+            other[1] ^= key
+            other[2] ^= element
+            other[3] ^= sketch_check(element)
+            if is_pure(other):
+                queue.append(cell)
+    if any(counts != [0, 0, 0, 0] for counts in cells.values()):
+        return None
+    # a changed row leaves its old element on the sink side and its new one on the source side
+    return RowDiff(
+        inserts=[(key,) for key in sorted(src_only - snk_only)],
+        updates=[(key,) for key in sorted(src_only & snk_only)],
+        deletes=[(key,) for key in sorted(snk_only - src_only)]
+    )
+
+
+def has_int_key(config: Union[StateConfig, SourceConfig, SinkConfig], r_config: ReconciliationConfig) -> bool:
+    # the sketch XORs the keys themselves, so it takes a single integer unique column
+    meta_columns = config.meta_columns
+    unique_columns = meta_columns.unique_columns or []
+    if len(unique_columns) != 1:
+        return False
+    key_column, = unique_columns
+    if key_column == meta_columns.partition_column:
+        return r_config.partition_column_type == "int"
+    return any(f.column == key_column and f.dtype == "int" for f in config.fields or [])
+
+
+def diff_block_rows(
+    sourcestate: Adapter,
+    sinkstate: Adapter,
+    block: Block,
+    r_config: ReconciliationConfig,
+    sketch_size: int=None
+) -> RowDiff:
+    """
+    Exact keys that differ in a mismatched block.
+
+    With a sketch size and a single integer key both sides first send a
+    fixed size IBLT of their (key, rowhash) set, which decodes to the
+    differing keys when only a few rows drifted. Otherwise, or if the sketch
+    query or its decoding fails, the full key and row hash lists are
+    compared.
+    """
+    def in_block(query: Query, config) -> Query:
+        # a block split on the secondary key only covers its keyset range
+        query.filters += build_key_filters(block, config)
+        return query
+
+    src_config, snk_config = sourcestate.adapter_config, sinkstate.adapter_config
+    if sketch_size and has_int_key(src_config, r_config) and has_int_key(snk_config, r_config):
+        width = max(1, math.ceil(sketch_size / SKETCH_HASHES))
+        try:
+            src_rows, snk_rows = fetch_pair(
+                sourcestate,
+                in_block(build_row_sketch_query(block.start, block.end, width, src_config, r_config, "source"), src_config),
+                sinkstate,
+                in_block(build_row_sketch_query(block.start, block.end, width, snk_config, r_config, "sink"), snk_config)
+            )
+            diff = decode_sketches(src_rows, snk_rows, width)
+        except Exception:
+            # the sketch is only a shortcut, the key lists below give the same answer
+            logger.warning("Row sketch of block %s-%s failed, comparing key lists", block.start, block.end, exc_info=True)
+            diff = None
+        if diff is not None:
+            return diff
+    src_rows, snk_rows = fetch_pair(
+        sourcestate,
+        in_block(build_row_hash_query(block.start, block.end, src_config, r_config, "source"), src_config),
+        sinkstate,
+        in_block(build_row_hash_query(block.start, block.end, snk_config, r_config, "sink"), snk_config)
+    )
+    return diff_rows(src_rows, snk_rows)
+
+
+def iter_row_diffs(
+    sourcestate: Adapter,
+    sinkstate: Adapter,
+    pairs: Iterable[Tuple[Block, str]],
+    r_config: ReconciliationConfig,
+    sketch_size: int=None
+) -> Iterator[Tuple[Block, str, Optional[RowDiff]]]:
+    """
+    Optional leaf stage over discovered blocks: every M block gets a RowDiff
+    so only the rows that differ need to be transferred. A, D and N blocks
+    pass through with None; they are inserted, deleted or skipped whole.
+    """
+    sketch_size = r_config.sketch_size if sketch_size is None else sketch_size
+    for block, status in pairs:
+        diff = diff_block_rows(sourcestate, sinkstate, block, r_config, sketch_size=sketch_size) if status == 'M' else None
+        yield block, status, diff
 
 
 def prepare_data_blocks(
@@ -413,8 +1833,37 @@ def prepare_data_blocks(
     interval_reduction_factor=None,
     start: Union[int, str, datetime]=None,
     end: Union[int, str, datetime]=None,
-    force_update=False
+    force_update=False,
+    max_workers: int=None,
+    descent: str=None,
+    cache_path: str=None,
+    partitioning: str=None,
+    partition_sample: float=None,
+    adaptive_intervals: bool=None,
+    range_fingerprint: bool=None
 )-> Tuple[List[Block], List[str]]:
+    pairs = list(iter_data_blocks(pipeline, r_config, initial_partition_interval, max_block_size, interval_reduction_factor, start, end, force_update, max_workers=max_workers, descent=descent, cache_path=cache_path, partitioning=partitioning, partition_sample=partition_sample, adaptive_intervals=adaptive_intervals, range_fingerprint=range_fingerprint))
+    return [c for c, _ in pairs], [st for _, st in pairs]
+
+
+def iter_data_blocks(
+    pipeline: 'Pipeline',
+    r_config: ReconciliationConfig,
+    initial_partition_interval=None,
+    max_block_size: int=None,
+    interval_reduction_factor=None,
+    start: Union[int, str, datetime]=None,
+    end: Union[int, str, datetime]=None,
+    force_update=False,
+    max_workers: int=None,
+    descent: str=None,
+    cache_path: str=None,
+    partitioning: str=None,
+    partition_sample: float=None,
+    adaptive_intervals: bool=None,
+    range_fingerprint: bool=None
+)-> Iterator[Tuple[Block, str]]:
+    # streaming prepare_data_blocks, see iter_blocks
     source, sink = pipeline.source, pipeline.sink
     sourcestate, sinkstate = pipeline.sourcestate, pipeline.sinkstate
     start, end = get_data_range(sourcestate, sinkstate, r_config, start=start, end=end)
@@ -422,6 +1871,13 @@ def prepare_data_blocks(
     max_block_size = max_block_size or r_config.max_block_size
     # sink_max_block_size = sink_max_block_size or sink.adapter_config.batch_size
     initial_partition_interval = initial_partition_interval or r_config.initial_partition_interval
+    max_workers = max_workers or r_config.max_workers
+    descent = descent or r_config.descent
+    cache_path = cache_path or r_config.cache_path
+    partitioning = partitioning or r_config.partitioning
+    partition_sample = partition_sample or r_config.partition_sample
+    adaptive_intervals = r_config.adaptive_intervals if adaptive_intervals is None else adaptive_intervals
+    range_fingerprint = r_config.range_fingerprint if range_fingerprint is None else range_fingerprint
     intervals = []
     interval = initial_partition_interval
     while interval>max_block_size:
@@ -429,16 +1885,9 @@ def prepare_data_blocks(
         interval = interval//interval_reduction_factor
     intervals.append(interval)
 
-    blocks, status = build_blocks(sourcestate, sinkstate, start, end, r_config, max_block_size, intervals, force_update=force_update)
-    return blocks, status
-    
-
-
-# def load(
-#     pipeline: 'Pipeline',
-#     r_config: ReconciliationConfig,
-#     blocks: List[Block],
-#     statuses: List[str]
-# ):
-#     sourcestate, sinkstate = pipeline.sourcestate, pipeline.sinkstate
-#     source, sink = pipeline.source, pipeline.sink
\ No newline at end of file
+    cache = BlockHashCache(cache_path, pipeline.config.name, r_config.name) if cache_path else None
+    try:
+        yield from iter_blocks(sourcestate, sinkstate, start, end, r_config, max_block_size, intervals, force_update=force_update, max_workers=max_workers, descent=descent, cache=cache, partitioning=partitioning, partition_sample=partition_sample, adaptive_intervals=adaptive_intervals, range_fingerprint=range_fingerprint)
+    finally:
+        if cache is not None:
+            cache.close()
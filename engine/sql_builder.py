@@ -16,6 +16,7 @@ class SqlBuilder:
                 select_clause.append(f"{f.expr} AS {f.alias}")
             else:
                 select_clause.append(f.expr)
+            params.extend(f.params or [])
         parts.append("SELECT " + ", ".join(select_clause))
 
         # FROM clause
@@ -26,6 +27,9 @@ class SqlBuilder:
         from_clause += f"{table.table}"
         if table.alias:
             from_clause += f" AS {table.alias}"
+        if query.sample:
+            from_clause += " TABLESAMPLE SYSTEM (%s)"
+            params.append(query.sample)
         parts.append(from_clause)
 
         # JOINs
@@ -51,22 +55,20 @@ class SqlBuilder:
 
         # WHERE filters - Using parameterized queries to prevent SQL injection
         if query.filters:
-            filter_exprs = []
-            for flt in query.filters:
-                # Use %s placeholders for values to prevent SQL injection
-                filter_exprs.append(f"{flt.column} {flt.operator} %s")
-                # Add the actual value to params list separately
-                params.append(flt.value)
-            parts.append("WHERE " + " AND ".join(filter_exprs))
+            parts.append(SqlBuilder._build_where(query.filters, params))
 
         # GROUP BY
         if query.group_by:
             group_by_exprs = [f.expr for f in query.group_by]
             parts.append("GROUP BY " + ", ".join(group_by_exprs))
+        elif query.grouping_sets:
+            sets = ["(" + ", ".join(f.expr for f in grouping_set) + ")" for grouping_set in query.grouping_sets]
+            parts.append("GROUP BY GROUPING SETS (" + ", ".join(sets) + ")")
 
         # ORDER BY
         if query.order_by:
-            parts.append("ORDER BY " + ", ".join(query.order_by))
+            order_by_exprs = [o if isinstance(o, str) else o.expr for o in query.order_by]
+            parts.append("ORDER BY " + ", ".join(order_by_exprs))
 
         # LIMIT
         if query.limit:
@@ -75,3 +77,35 @@ class SqlBuilder:
 
         sql = "\n".join(parts) + ";"
         return sql, params
+
+    @staticmethod
+    def _build_where(filters, params: list) -> str:
+        filter_exprs = []
+        for flt in filters:
+            if flt.operator == 'in_ranges':
+                # value is a list of half-open (start, end) ranges, an end of None is unbounded
+                ranges = []
+                for start, end in flt.value:
+                    if end is None:
+                        ranges.append(f"({flt.column} >= %s)")
+                        params.append(start)
+                    else:
+                        ranges.append(f"({flt.column} >= %s AND {flt.column} < %s)")
+                        params.extend([start, end])
+                filter_exprs.append("(" + " OR ".join(ranges) + ")")
+                continue
+            # Use %s placeholders for values to prevent SQL injection
+            filter_exprs.append(f"{flt.column} {flt.operator} %s")
+            # Add the actual value to params list separately
+            params.append(flt.value)
+        return "WHERE " + " AND ".join(filter_exprs)
+
+    @staticmethod
+    def build_delete(query: Query) -> Tuple[str, list]:
+        # DELETE of the rows matching the query's filters, select and grouping are ignored
+        params = []
+        table = query.table
+        sql = "DELETE FROM " + (f"{table.schema}." if table.schema else "") + table.table
+        if query.filters:
+            sql += "\n" + SqlBuilder._build_where(query.filters, params)
+        return sql + ";", params
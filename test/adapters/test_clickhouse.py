@@ -0,0 +1,188 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
+
+from adapters.clickhouse import ClickHouseAdapter
+from core.config import Block, MergeStrategyConfig, HASH_MD5_HASH, HASHTEXT64_HASH, MD5_SUM_HASH, SUM64_HASH, FieldConfig
+from engine.load import build_sink_delete_query, load
+from engine.reconcile import build_block_hash_query, build_block_tree_hash_query, build_quantiles_query, build_range_fingerprint_query, build_row_sketch_query
+
+
+@pytest.fixture
+def adapter_config():
+    return MagicMock(
+        fields=[FieldConfig(column="id"), FieldConfig(column="name")],
+        table=MagicMock(table="events", dbschema="analytics", alias=None),
+        filters=[],
+        joins=[],
+        meta_columns=MagicMock(hash_column=None, partition_column="id", order_column="id")
+    )
+
+
+@pytest.fixture
+def adapter(adapter_config):
+    return ClickHouseAdapter({}, adapter_config, 'source')
+
+
+def test_block_hash_sql_uses_named_params(adapter, adapter_config):
+    r_config = MagicMock(partition_column_type="int", strategy=MD5_SUM_HASH)
+    query = build_block_hash_query(0, 2000, 2, [1000, 100], adapter_config, r_config, "source")
+
+    sql, params = adapter._build_sql(query)
+
+    assert "concat(toString(intDiv(id, 1000)), '-', toString(intDiv(modulo(id, 1000), 100))) AS blockname" in sql
+    assert "sum(toInt64(reinterpretAsInt32(reverse(substring(MD5(" in sql
+    assert "WHERE id >= %(p0)s AND id < %(p1)s" in sql
+    assert params == {"p0": 0, "p1": 2000}
+
+
+def test_datetime_block_name(adapter, adapter_config):
+    adapter_config.meta_columns.partition_column = "created_at"
+    r_config = MagicMock(partition_column_type="datetime", strategy=HASH_MD5_HASH)
+    query = build_block_hash_query(datetime(2023, 1, 1), datetime(2023, 1, 2), 1, [86400], adapter_config, r_config, "source")
+
+    sql, _ = adapter._build_sql(query)
+
+    assert "toString(intDiv(toUnixTimestamp(created_at), 86400)) AS blockname" in sql
+    assert "arraySort(x -> x.1, groupArray((id, " in sql
+
+
+def test_block_tree_sql_groups_by_every_level(adapter, adapter_config):
+    r_config = MagicMock(partition_column_type="int", strategy=HASH_MD5_HASH)
+    query = build_block_tree_hash_query(0, 2000, 3, [1000, 100, 10], adapter_config, r_config, "source")
+
+    sql, _ = adapter._build_sql(query)
+
+    assert "AS blockname_1" in sql and "AS blockname_2" in sql and "AS blockname_3" in sql
+    assert "GROUP BY GROUPING SETS ((blockname_1), (blockname_2), (blockname_3))" in sql
+
+
+def test_sum64_block_hash_wraps_to_unsigned(adapter, adapter_config):
+    r_config = MagicMock(partition_column_type="int", strategy=SUM64_HASH)
+    query = build_block_hash_query(0, 2000, 1, [1000], adapter_config, r_config, "source")
+
+    sql, _ = adapter._build_sql(query)
+
+    assert "toUInt64(sum(reinterpretAsInt64(reverse(substring(MD5(concat(" in sql
+
+
+def test_postgres_native_hash_is_rejected(adapter, adapter_config):
+    r_config = MagicMock(partition_column_type="int", strategy=HASHTEXT64_HASH)
+    query = build_block_hash_query(0, 2000, 1, [1000], adapter_config, r_config, "source")
+
+    with pytest.raises(ValueError):
+        adapter._build_sql(query)
+
+
+def test_quantiles_sql_ignores_sample(adapter, adapter_config):
+    r_config = MagicMock(partition_column_type="int", strategy=MD5_SUM_HASH)
+    query = build_quantiles_query(0, 2000, [0.25, 0.5, 0.75], adapter_config, r_config, sample=10)
+
+    sql, params = adapter._build_sql(query)
+
+    assert sql.startswith("SELECT quantiles(0.25, 0.5, 0.75)(id) AS quantiles\nFROM analytics.events\n")
+    assert "TABLESAMPLE" not in sql
+    assert params == {"p0": 0, "p1": 2000}
+
+
+def test_uuid_partition_key(adapter, adapter_config):
+    adapter_config.meta_columns.partition_column = "event_id"
+    r_config = MagicMock(partition_column_type="uuid", strategy=MD5_SUM_HASH)
+    query = build_block_hash_query(0, 2**28, 1, [2**24], adapter_config, r_config, "source")
+
+    sql, params = adapter._build_sql(query)
+
+    key = "reinterpretAsUInt32(reverse(unhex(substring(toString(event_id), 1, 8))))"
+    assert f"toString(intDiv({key}, 16777216)) AS blockname" in sql
+    assert f"WHERE {key} >= %(p0)s AND {key} < %(p1)s" in sql
+    assert sql.endswith(f"ORDER BY min({key});")
+    assert params == {"p0": 0, "p1": 2**28}
+
+
+def test_int_block_ids(adapter, adapter_config):
+    r_config = MagicMock(partition_column_type="int", strategy=MD5_SUM_HASH, block_ids="int")
+    query = build_block_tree_hash_query(0, 2000, 2, [1000, 100], adapter_config, r_config, "source")
+
+    sql, _ = adapter._build_sql(query)
+
+    assert "intDiv(id, 1000) AS blockname_1, intDiv(id, 100) AS blockname_2" in sql
+    assert sql.endswith("SETTINGS group_by_use_nulls = 1;")
+
+
+def test_range_fingerprint_sql_sums_without_grouping(adapter, adapter_config):
+    r_config = MagicMock(partition_column_type="int", strategy=HASH_MD5_HASH)
+    query = build_range_fingerprint_query(0, 2000, [1000], adapter_config, r_config, "source")
+
+    sql, _ = adapter._build_sql(query)
+
+    assert "toUInt64(sum(reinterpretAsInt64(reverse(substring(MD5(concat(" in sql
+    assert "blockname" not in sql and "GROUP BY" not in sql and "ORDER BY" not in sql
+
+
+def test_row_sketch_sql_groups_by_cell_sets(adapter, adapter_config):
+    adapter_config.meta_columns.unique_columns = ["id"]
+    r_config = MagicMock(partition_column_type="int", strategy=MD5_SUM_HASH)
+    query = build_row_sketch_query(0, 2000, 10, adapter_config, r_config, "source")
+
+    sql, _ = adapter._build_sql(query)
+
+    assert "(10 + modulo(bitAnd(bitShiftRight(reinterpretAsInt64(reverse(substring(MD5(concat(toString(id), '|'" in sql
+    assert "groupBitXor(toInt64(id)) AS key_xor" in sql
+    assert "GROUP BY GROUPING SETS ((cell_0), (cell_1), (cell_2))" in sql
+    assert "ORDER BY" not in sql
+
+
+def test_write_batch_inserts_columns_in_one_call(adapter):
+    adapter.client = MagicMock()
+    adapter.adapter_config.partition_by = None
+    rows = [{"id": i, "name": f"row {i}"} for i in range(3)]
+
+    adapter.write_batch("analytics.events", rows)
+
+    adapter.client.execute.assert_called_once_with(
+        "INSERT INTO analytics.events (id,name) VALUES", [[0, 1, 2], ["row 0", "row 1", "row 2"]], columnar=True
+    )
+
+
+def test_write_batch_one_insert_per_partition(adapter):
+    adapter.client = MagicMock()
+    adapter.adapter_config.partition_by = "month"
+    rows = [{"id": i, "month": 202401 + i % 2} for i in range(5)]
+
+    adapter.write_batch("analytics.events", rows)
+
+    assert [c.args[1] for c in adapter.client.execute.call_args_list] == [
+        [[0, 2, 4], [202401, 202401, 202401]],
+        [[1, 3], [202402, 202402]]
+    ]
+
+
+def test_delete_block_range_uses_named_params(adapter, adapter_config):
+    adapter.client = MagicMock()
+    query = build_sink_delete_query(Block(0, 2000, 1, 100, None), adapter_config, MagicMock(partition_column_type="int"))
+
+    adapter.delete(query)
+
+    adapter.client.execute.assert_called_once_with(
+        "DELETE FROM analytics.events\nWHERE id >= %(p0)s AND id < %(p1)s;", {"p0": 0, "p1": 2000}
+    )
+
+
+def test_load_delete_insert_replaces_block(adapter, adapter_config):
+    adapter.client = MagicMock()
+    adapter_config.merge_strategy = MergeStrategyConfig(strategy="delete_insert")
+    adapter_config.partition_by = None
+    adapter_config.batch_size = 100
+    adapter_config.batch_bytes = None
+    source = MagicMock(adapter_config=MagicMock(fields=adapter_config.fields, table=adapter_config.table, filters=[], joins=[], batch_size=100, meta_columns=adapter_config.meta_columns))
+    source.fetch_batches.return_value = iter([[{"id": 1, "name": "a"}, {"id": 2, "name": "b"}]])
+
+    written = load(MagicMock(source=source, sink=adapter), MagicMock(partition_column_type="int"), [(Block(0, 10, 1, 2, None), 'M')])
+
+    assert written == 2
+    assert [c.args[0] for c in adapter.client.execute.call_args_list] == [
+        "DELETE FROM analytics.events\nWHERE id >= %(p0)s AND id < %(p1)s;",
+        "INSERT INTO analytics.events (id,name) VALUES"
+    ]
+    assert adapter.client.execute.call_args.args[1] == [[1, 2], ["a", "b"]]
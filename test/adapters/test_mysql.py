@@ -0,0 +1,139 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pymysql
+import pytest
+
+from adapters.mysql import MySQLAdapter, load_data_value
+from core.config import DELETE_INSERT, UPSERT
+from core.query import Filter, Query, Table
+from engine.reconcile import build_partition_filters
+
+
+@pytest.fixture
+def adapter():
+    adapter = MySQLAdapter(
+        {},
+        MagicMock(
+            merge_strategy=MagicMock(strategy=UPSERT, load_data_infile=False),
+            meta_columns=MagicMock(unique_columns=["id"])
+        ),
+        'sink'
+    )
+    # no server here, statements are rendered with the client's own escaping
+    adapter.conn = MagicMock(max_allowed_packet=16 * 1024 * 1024, encoding="utf8")
+    adapter.conn.escape.side_effect = lambda value: pymysql.converters.escape_item(value, "utf8mb4")
+    adapter.cursor = MagicMock()
+    adapter.cursor.fetchone.return_value = {"max_allowed_packet": 4 * 1024 * 1024}
+    adapter._max_packet = None
+    return adapter
+
+
+def executed(adapter):
+    return [c.args[0] for c in adapter.cursor.execute.call_args_list[1:]]
+
+
+def test_write_batch_upserts_multi_row_statement(adapter):
+    adapter.write_batch("t", [{"id": i, "name": f"row {i}"} for i in range(1, 4)])
+
+    assert executed(adapter) == [
+        "INSERT INTO t (id,name) VALUES (1,'row 1'),(2,'row 2'),(3,'row 3') ON DUPLICATE KEY UPDATE name=VALUES(name)"
+    ]
+    adapter.conn.commit.assert_called_once()
+
+
+def test_write_batch_splits_statements_at_max_allowed_packet(adapter):
+    adapter.cursor.fetchone.return_value = {"max_allowed_packet": 1024 + 400}
+    rows = [{"id": i, "name": "x" * 50} for i in range(100)]
+
+    adapter.write_batch("t", rows)
+
+    statements = executed(adapter)
+    assert len(statements) > 1
+    assert all(len(s) <= 400 for s in statements)
+    assert sum(s.count("'x") for s in statements) == 100
+    # one transaction for the whole batch
+    adapter.conn.commit.assert_called_once()
+
+
+def test_write_batch_measures_packet_in_bytes(adapter):
+    adapter.cursor.fetchone.return_value = {"max_allowed_packet": 1024 + 400}
+    rows = [{"id": i, "name": "数据" * 15, "data": b"\xff\x00"} for i in range(20)]
+
+    adapter.write_batch("t", rows)
+
+    statements = executed(adapter)
+    assert len(statements) > 1
+    assert all(len(s.encode("utf8", "surrogateescape")) <= 400 for s in statements)
+
+
+def test_write_batch_plain_insert_for_delete_insert(adapter):
+    adapter.adapter_config.merge_strategy.strategy = DELETE_INSERT
+
+    adapter.write_batch("t", [{"id": 1, "name": None}])
+
+    assert executed(adapter) == ["INSERT INTO t (id,name) VALUES (1,NULL)"]
+
+
+def test_write_batch_load_data_from_memory(adapter):
+    adapter.adapter_config.merge_strategy.strategy = DELETE_INSERT
+    adapter.adapter_config.merge_strategy.load_data_infile = True
+    loaded = []
+    # the client reads the file while the statement runs
+    adapter.cursor.execute.side_effect = lambda sql, params: loaded.append(open(params[0], "rb").read())
+
+    adapter.write_batch("t", [{"id": 1, "name": "a\tb"}, {"id": 2, "name": None}])
+
+    sql, _ = adapter.cursor.execute.call_args.args
+    assert sql == "LOAD DATA LOCAL INFILE %s INTO TABLE t CHARACTER SET binary (id,name)"
+    assert loaded == [b"1\ta\\tb\n2\t\\N\n"]
+    adapter.conn.commit.assert_called_once()
+
+
+def test_write_batch_rolls_back_failed_batch(adapter):
+    adapter.cursor.execute.side_effect = [None, pymysql.err.IntegrityError()]
+
+    with pytest.raises(pymysql.err.IntegrityError):
+        adapter.write_batch("t", [{"id": 1, "name": "a"}])
+
+    adapter.conn.rollback.assert_called_once()
+    adapter.conn.commit.assert_not_called()
+
+
+def test_load_data_value():
+    assert load_data_value(None) == b"\\N"
+    assert load_data_value(True) == b"1"
+    assert load_data_value(datetime(2024, 5, 6, 7, 8, 9)) == b"2024-05-06 07:08:09"
+    assert load_data_value("back\\slash\nline") == b"back\\\\slash\\nline"
+    assert load_data_value("数据") == "数据".encode()
+    assert load_data_value(memoryview(b"\xff\x00\t")) == b"\xff\\0\\t"
+    with pytest.raises(TypeError):
+        load_data_value({1})
+
+
+def test_replace_rows_deletes_and_inserts_in_one_transaction(adapter):
+    adapter.adapter_config.merge_strategy.strategy = DELETE_INSERT
+    query = Query(select=[], table=Table(table="t", schema="db"), filters=[Filter("id", ">=", 1), Filter("id", "<", 3)])
+
+    written = adapter.replace_rows("db.t", query, iter([[{"id": 1, "name": "a"}], [{"id": 2, "name": "b"}]]))
+
+    assert written == 2
+    calls = [c.args for c in adapter.cursor.execute.call_args_list]
+    assert calls[0] == ("DELETE FROM db.t\nWHERE id >= %s AND id < %s;", [1, 3])
+    assert [c[0] for c in calls[2:]] == ["INSERT INTO db.t (id,name) VALUES (1,'a')", "INSERT INTO db.t (id,name) VALUES (2,'b')"]
+    adapter.conn.commit.assert_called_once()
+
+
+@pytest.mark.parametrize("partition_column_type, column_expr", [
+    ("uuid", "CONV(LEFT(uuid_key, 8), 16, 10)"),
+    ("str", "CONV(LEFT(MD5(uuid_key), 8), 16, 10)")
+])
+def test_delete_translates_key_space_bounds(adapter, partition_column_type, column_expr):
+    filters = build_partition_filters("uuid_key", partition_column_type, 0, 268435456)
+    query = Query(select=[], table=Table(table="t", schema="db"), filters=filters)
+
+    adapter.delete(query)
+
+    adapter.cursor.execute.assert_called_once_with(
+        f"DELETE FROM db.t\nWHERE {column_expr} >= %s AND {column_expr} < %s;", [0, 268435456]
+    )
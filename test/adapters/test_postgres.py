@@ -0,0 +1,117 @@
+import os
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+import pytest
+
+from adapters.postgres import PostgresAdapter, copy_text_value
+from core.config import DELETE_INSERT, UPSERT
+
+TABLE = "public.copy_sink_table"
+
+
+@pytest.fixture
+def adapter():
+    adapter = PostgresAdapter(
+        store_config={
+            'host': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'port': os.environ.get('POSTGRES_PORT', '5432'),
+            'username': os.environ.get('POSTGRES_USER', 'synctool'),
+            'password': os.environ.get('POSTGRES_PASSWORD', 'synctool'),
+            'database': os.environ.get('POSTGRES_DB', 'synctool'),
+        },
+        adapter_config=MagicMock(
+            merge_strategy=MagicMock(strategy=UPSERT),
+            meta_columns=MagicMock(unique_columns=["id"])
+        ),
+        role='sink'
+    )
+    adapter.connect()
+    adapter.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    adapter.execute(f"CREATE TABLE {TABLE} (id int PRIMARY KEY, name varchar, created_at timestamp, active boolean)")
+    yield adapter
+    adapter.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    adapter.close()
+
+
+def table_rows(adapter):
+    adapter.cursor.execute(f"SELECT id, name, created_at, active FROM {TABLE} ORDER BY id")
+    return adapter.cursor.fetchall()
+
+
+def test_write_batch_upserts_through_staging_table(adapter):
+    adapter.write_batch(TABLE, [{"id": i, "name": f"row {i}", "created_at": None, "active": True} for i in range(1, 4)])
+    adapter.cursor = MagicMock(wraps=adapter.cursor)
+
+    adapter.write_batch(TABLE, [{"id": i, "name": f"new {i}", "created_at": None, "active": False} for i in range(3, 6)])
+
+    assert [row[:2] for row in table_rows(adapter)] == [(1, "row 1"), (2, "row 2"), (3, "new 3"), (4, "new 4"), (5, "new 5")]
+    assert adapter.cursor.copy_expert.call_count == 1
+    assert [c.args[0].split()[0] for c in adapter.cursor.execute.call_args_list] == ["CREATE", "INSERT", "SELECT"]
+
+
+def test_write_batch_copies_into_table_for_delete_insert(adapter):
+    adapter.adapter_config.merge_strategy.strategy = DELETE_INSERT
+    # column types are looked up once per table
+    adapter._table_json_columns(TABLE)
+    adapter.cursor = MagicMock(wraps=adapter.cursor)
+
+    adapter.write_batch(TABLE, [{"id": i, "name": f"row {i}", "created_at": None, "active": None} for i in range(1, 101)])
+
+    assert len(table_rows(adapter)) == 100
+    assert adapter.cursor.copy_expert.call_args.args[0].startswith(f"COPY {TABLE} (")
+    adapter.cursor.execute.assert_called_once()
+
+
+def test_write_batch_round_trips_special_values(adapter):
+    row = {"id": 1, "name": "tab\there\nnew line \\N back\\slash", "created_at": datetime(2024, 5, 6, 7, 8, 9), "active": False}
+    adapter.write_batch(TABLE, [row, {"id": 2, "name": None, "created_at": None, "active": None}])
+
+    assert table_rows(adapter) == [
+        (1, row["name"], row["created_at"], False),
+        (2, None, None, None)
+    ]
+
+
+def test_write_batch_rolls_back_failed_batch(adapter):
+    adapter.adapter_config.merge_strategy.strategy = DELETE_INSERT
+
+    with pytest.raises(Exception):
+        adapter.write_batch(TABLE, [{"id": 1, "name": "a"}, {"id": 1, "name": "b"}])
+
+    assert table_rows(adapter) == []
+
+
+def test_write_batch_round_trips_bytea_and_arrays(adapter):
+    adapter.execute(f"ALTER TABLE {TABLE} ADD COLUMN data bytea, ADD COLUMN tags text[], ADD COLUMN grid int[], ADD COLUMN wait interval")
+    tags = ["a,b", 'quo"te', "back\\slash", "{brace}", None, "tab\there"]
+    adapter.write_batch(TABLE, [
+        {"id": 1, "data": b"\x00\x01\\\xff", "tags": tags, "grid": [[1, 2], [3, None]], "wait": timedelta(days=1, seconds=5)},
+        {"id": 2, "data": memoryview(b"bytes"), "tags": [], "grid": None, "wait": None}
+    ])
+
+    adapter.cursor.execute(f"SELECT data, tags, grid, wait FROM {TABLE} ORDER BY id")
+    first, second = adapter.cursor.fetchall()
+    assert (bytes(first[0]), first[1], first[2], first[3]) == (b"\x00\x01\\\xff", tags, [[1, 2], [3, None]], timedelta(days=1, seconds=5))
+    assert (bytes(second[0]), second[1], second[2]) == (b"bytes", [], None)
+
+
+def test_write_batch_writes_lists_to_json_columns_as_json(adapter):
+    adapter.execute(f"ALTER TABLE {TABLE} ADD COLUMN doc jsonb, ADD COLUMN raw json, ADD COLUMN tags text[]")
+    adapter.write_batch(TABLE, [
+        {"id": 1, "doc": [1, "two", {"three": [3]}], "raw": ["tab\there"], "tags": ["a", "b"]},
+        {"id": 2, "doc": {"k": None}, "raw": '{"already": "json"}', "tags": None},
+        {"id": 3, "doc": 5, "raw": None, "tags": []}
+    ])
+
+    adapter.cursor.execute(f"SELECT doc, raw, tags FROM {TABLE} ORDER BY id")
+    assert adapter.cursor.fetchall() == [
+        ([1, "two", {"three": [3]}], ["tab\there"], ["a", "b"]),
+        ({"k": None}, {"already": "json"}, None),
+        (5, None, [])
+    ]
+
+
+def test_copy_text_value_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        copy_text_value({1, 2})
@@ -4,7 +4,10 @@ CREATE TABLE source_table (
     name VARCHAR(100),
     value DECIMAL(10, 2),
     hash_value VARCHAR(32),
-    created_at TIMESTAMP NOT NULL
+    created_at TIMESTAMP NOT NULL,
+    uuid_key UUID,
+    str_key VARCHAR(100),
+    created_date DATE
 );
 
 -- Create sink table with same schema
@@ -13,7 +16,10 @@ CREATE TABLE sink_table (
     name VARCHAR(100),
     value DECIMAL(10, 2),
     hash_value VARCHAR(32),
-    created_at TIMESTAMP NOT NULL
+    created_at TIMESTAMP NOT NULL,
+    uuid_key UUID,
+    str_key VARCHAR(100),
+    created_date DATE
 );
 
 -- Insert data into source table
@@ -24,7 +30,10 @@ SELECT
     'Item ' || id AS name,
     (id % 100)::decimal + ((id % 17) / 10.0)::decimal AS value,
     md5('Item ' || id || '-' || ((id % 100) + ((id % 17) / 10.0))) AS hash_value,
-    TIMESTAMP '2023-01-01 00:00:00' + (id * INTERVAL '1 minute')
+    TIMESTAMP '2023-01-01 00:00:00' + (id * INTERVAL '1 minute'),
+    md5('uuid-' || id)::uuid AS uuid_key,
+    'key-' || id AS str_key,
+    (TIMESTAMP '2023-01-01 00:00:00' + (id * INTERVAL '1 minute'))::date AS created_date
 FROM generate_series(1, 10000) AS id;
 
 -- Range 10001-20000: Mismatched data (different values)
@@ -34,7 +43,10 @@ SELECT
     'Item ' || id AS name,
     (id % 100)::decimal + ((id % 19) / 10.0)::decimal AS value,
     md5('Item ' || id || '-' || ((id % 100) + ((id % 19) / 10.0))) AS hash_value,
-    TIMESTAMP '2023-01-07 23:40:00' + (id * INTERVAL '1 minute')
+    TIMESTAMP '2023-01-07 23:40:00' + (id * INTERVAL '1 minute'),
+    md5('uuid-' || id)::uuid AS uuid_key,
+    'key-' || id AS str_key,
+    (TIMESTAMP '2023-01-07 23:40:00' + (id * INTERVAL '1 minute'))::date AS created_date
 FROM generate_series(10001, 20000) AS id;
 
 -- Range 20001-30000: Data in source but not in sink
@@ -44,7 +56,10 @@ SELECT
     'Item ' || id AS name,
     (id % 100)::decimal + ((id % 13) / 10.0)::decimal AS value,
     md5('Item ' || id || '-' || ((id % 100) + ((id % 13) / 10.0))) AS hash_value,
-    TIMESTAMP '2023-01-14 23:20:00' + (id * INTERVAL '1 minute')
+    TIMESTAMP '2023-01-14 23:20:00' + (id * INTERVAL '1 minute'),
+    md5('uuid-' || id)::uuid AS uuid_key,
+    'key-' || id AS str_key,
+    (TIMESTAMP '2023-01-14 23:20:00' + (id * INTERVAL '1 minute'))::date AS created_date
 FROM generate_series(20001, 30000) AS id;
 
 -- Range 1-10000: All matching in source
@@ -54,7 +69,10 @@ SELECT
     'Item ' || id AS name,
     (id % 100)::decimal + ((id % 17) / 10.0)::decimal AS value,
     md5('Item ' || id || '-' || ((id % 100) + ((id % 17) / 10.0))) AS hash_value,
-    TIMESTAMP '2023-01-01 00:00:00' + (id * INTERVAL '1 minute')
+    TIMESTAMP '2023-01-01 00:00:00' + (id * INTERVAL '1 minute'),
+    md5('uuid-' || id)::uuid AS uuid_key,
+    'key-' || id AS str_key,
+    (TIMESTAMP '2023-01-01 00:00:00' + (id * INTERVAL '1 minute'))::date AS created_date
 FROM generate_series(1, 10000) AS id;
 
 -- Range 10001-20000: Mismatched data (different values)
@@ -64,7 +82,10 @@ SELECT
     'Item ' || id AS name,
     (id % 100)::decimal + ((id % 23) / 10.0)::decimal AS value,  -- Different calculation
     md5('Item ' || id || '-' || ((id % 100) + ((id % 23) / 10.0))) AS hash_value,
-    TIMESTAMP '2023-01-07 23:40:00' + (id * INTERVAL '1 minute')
+    TIMESTAMP '2023-01-07 23:40:00' + (id * INTERVAL '1 minute'),
+    md5('uuid-' || id)::uuid AS uuid_key,
+    'key-' || id AS str_key,
+    (TIMESTAMP '2023-01-07 23:40:00' + (id * INTERVAL '1 minute'))::date AS created_date
 FROM generate_series(10001, 20000) AS id;
 
 -- Range 30001-40000: Data in sink but not in source
@@ -74,5 +95,8 @@ SELECT
     'Item ' || id AS name,
     (id % 100)::decimal + ((id % 11) / 10.0)::decimal AS value,
     md5('Item ' || id || '-' || ((id % 100) + ((id % 11) / 10.0))) AS hash_value,
-    TIMESTAMP '2023-01-21 23:00:00' + (id * INTERVAL '1 minute')
+    TIMESTAMP '2023-01-21 23:00:00' + (id * INTERVAL '1 minute'),
+    md5('uuid-' || id)::uuid AS uuid_key,
+    'key-' || id AS str_key,
+    (TIMESTAMP '2023-01-21 23:00:00' + (id * INTERVAL '1 minute'))::date AS created_date
 FROM generate_series(30001, 40000) AS id;
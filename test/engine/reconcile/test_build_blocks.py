@@ -2,7 +2,7 @@ import pytest
 from datetime import datetime
 from unittest.mock import MagicMock, patch
 from engine.reconcile import build_blocks, Block, calculate_blocks
-from core.config import HASH_MD5_HASH, MD5_SUM_HASH, FieldConfig, ReconciliationConfig
+from core.config import HASH_MD5_HASH, MD5_SUM_HASH, TEXT_BLOCK_IDS, FieldConfig, ReconciliationConfig
 from adapters.base import Adapter
 
 
@@ -44,6 +44,9 @@ class TestBuildBlocks:
         config = MagicMock(spec=ReconciliationConfig)
         config.partition_column_type = "int"
         config.strategy = HASH_MD5_HASH
+        config.block_ids = TEXT_BLOCK_IDS
+        config.summary_levels = 0
+        config.split_hot_blocks = False
         config.source_meta_columns = MagicMock(
             hash_column="hash_col",
             partition_column="id",
@@ -1,9 +1,12 @@
+import threading
+
 import pytest
-from datetime import datetime
+from datetime import date, datetime, timezone
 from unittest.mock import Mock, patch
 
-from core.config import MD5_SUM_HASH, FieldConfig, ReconciliationConfig
-from engine.reconcile import calculate_blocks, Block, to_blocks
+from core.config import MD5_SUM_HASH, TEXT_BLOCK_IDS, FieldConfig, ReconciliationConfig
+from engine.reconcile import adaptive_child_interval, calculate_block_status, calculate_blocks, calculate_blocks_batched, Block, to_blocks
+from engine.sql_builder import SqlBuilder
 from adapters.base import Adapter
 
 @pytest.fixture
@@ -41,6 +44,9 @@ def mock_reconciliation_config():
     config = Mock(spec=ReconciliationConfig)
     config.partition_column_type = "int"
     config.strategy = MD5_SUM_HASH
+    config.block_ids = TEXT_BLOCK_IDS
+    config.summary_levels = 0
+    config.split_hot_blocks = False
     config.source_state_meta_columns = Mock(
         hash_column="hash_col",
         partition_column="id",
@@ -665,3 +671,157 @@ def xtest_calculate_blocks_partition_column_str(mock_source_adapter, mock_sink_a
     assert isinstance(blocks[0], Block)
     assert blocks[0].num_rows == 50
     assert blocks[0].hash == "abc123"
+
+
+def test_calculate_blocks_fetches_source_and_sink_concurrently(mock_source_adapter, mock_sink_adapter, mock_reconciliation_config):
+    # each fetch waits for the other side, so this only completes if both are in flight together
+    barrier = threading.Barrier(2, timeout=5)
+    rows = [{"blockname": "0", "blockhash": "abc123", "row_count": 37}]
+
+    def fetch(query):
+        barrier.wait()
+        return rows
+
+    mock_source_adapter.fetch.side_effect = fetch
+    mock_sink_adapter.fetch.side_effect = fetch
+
+    blocks, statuses = calculate_blocks(
+        sourcestate=mock_source_adapter,
+        sinkstate=mock_sink_adapter,
+        start=13,
+        end=50,
+        level=1,
+        r_config=mock_reconciliation_config,
+        intervals=[50, 10, 3, 1],
+        max_block_size=100
+    )
+
+    assert statuses == ['N']
+    assert blocks[0].num_rows == 37
+
+
+def test_calculate_blocks_batched_one_query_per_level(mock_source_adapter, mock_sink_adapter, mock_reconciliation_config):
+    mock_source_adapter.adapter_config.meta_columns.partition_column = "id"
+    mock_sink_adapter.adapter_config.meta_columns.partition_column = "id"
+    mock_source_adapter.fetch.side_effect = [
+        [{"blockname": "0", "blockhash": "a", "row_count": 45}],
+        [
+            {"blockname": "0-0", "blockhash": "b", "row_count": 20},
+            {"blockname": "0-1", "blockhash": "c", "row_count": 5},
+            {"blockname": "0-2", "blockhash": "d", "row_count": 20},
+        ],
+        [
+            {"blockname": "0-0-3", "blockhash": "e", "row_count": 4},
+            {"blockname": "0-2-5", "blockhash": "f", "row_count": 4},
+        ],
+    ]
+    mock_sink_adapter.fetch.side_effect = [
+        [{"blockname": "0", "blockhash": "x", "row_count": 45}],
+        [
+            {"blockname": "0-0", "blockhash": "y", "row_count": 20},
+            {"blockname": "0-1", "blockhash": "c", "row_count": 5},
+            {"blockname": "0-2", "blockhash": "z", "row_count": 20},
+        ],
+        [
+            {"blockname": "0-0-3", "blockhash": "e", "row_count": 4},
+            {"blockname": "0-2-5", "blockhash": "g", "row_count": 4},
+        ],
+    ]
+
+    blocks, statuses = calculate_blocks_batched(
+        sourcestate=mock_source_adapter,
+        sinkstate=mock_sink_adapter,
+        start=0,
+        end=100,
+        r_config=mock_reconciliation_config,
+        intervals=[100, 10, 1],
+        max_block_size=10
+    )
+
+    # one query per side per level, no matter how many blocks descend
+    assert mock_source_adapter.fetch.call_count == 3
+    assert mock_sink_adapter.fetch.call_count == 3
+    assert [(b.start, b.end, b.level) for b in blocks] == [(3, 4, 3), (10, 20, 2), (25, 26, 3)]
+    assert statuses == ['N', 'N', 'M']
+
+    level3_query = mock_source_adapter.fetch.call_args_list[2].args[0]
+    ranges_filter = next(f for f in level3_query.filters if f.operator == 'in_ranges')
+    assert ranges_filter.value == [(0, 10), (20, 30)]
+    sql, params = SqlBuilder.build(level3_query)
+    assert "((id >= %s AND id < %s) OR (id >= %s AND id < %s))" in sql
+    assert params[:2] == [0, 30] and params[2:6] == [0, 10, 20, 30]
+
+
+def test_adaptive_child_interval_targets_max_block_size():
+    # 10000 rows over a 10000 wide block, 100 rows per child -> children of width 100
+    block = Block(start=0, end=10000, level=1, num_rows=10000, hash="x")
+    assert adaptive_child_interval(block, 10000, 100, "int") == 100
+    # a slightly oversized block is split in two, not ten
+    block = Block(start=0, end=10000, level=1, num_rows=120, hash="x")
+    assert adaptive_child_interval(block, 10000, 100, "int") == 5000
+    # only divisors of the parent interval are used
+    block = Block(start=0, end=86400, level=1, num_rows=7000, hash="x")
+    step = adaptive_child_interval(block, 86400, 100, "int")
+    assert 86400 % step == 0 and step <= 86400 * 100 / 7000
+    assert adaptive_child_interval(Block(start=0, end=1, level=3, num_rows=500, hash="x"), 1, 100, "int") is None
+
+
+def test_adaptive_child_interval_bounds_fan_out():
+    # 10007 is prime, the only divisor under the target is 1: 10007 children
+    block = Block(start=0, end=10007, level=1, num_rows=5000, hash="x")
+    assert adaptive_child_interval(block, 10007, 100, "int") == 1
+    # capped at reduction_factor² children, the fixed step is used instead
+    assert adaptive_child_interval(block, 10007, 100, "int", reduction_factor=10) == 1000
+    # a divisor within the cap is kept
+    assert adaptive_child_interval(Block(start=0, end=10000, level=1, num_rows=10000, hash="x"), 10000, 100, "int", reduction_factor=10) == 100
+
+
+@pytest.mark.parametrize("partition_column_type,start,end,intervals,ranges", [
+    ("int", 3, 99_995, [10000, 1000, 100], None),
+    ("int", 0, 100_000, [10000, 1000, 100], [(5, 1000), (20005, 30000), (90_000, 99_995)]),
+    ("date", date(1970, 1, 3), date(2000, 1, 1), [1000, 100, 10], [(date(1970, 1, 3), date(1970, 3, 5)), (date(1975, 1, 1), date(2000, 1, 1))]),
+    ("datetime", datetime(2000, 1, 1, 0, 0, 0, 123), datetime(2030, 1, 1), [86400, 3600, 60], None),
+    ("datetime", datetime(1970, 1, 1, 0, 0, 0, 123, tzinfo=timezone.utc), datetime(1970, 1, 2, tzinfo=timezone.utc), [86400, 3600, 60], None),
+])
+def test_to_blocks_vectorized_matches_scalar(partition_column_type, start, end, intervals, ranges):
+    r_config = Mock(partition_column_type=partition_column_type)
+    blocks_data = [
+        {"blockname": f"{i // 100}-{i // 10 % 10}-{i % 10}", "blockhash": f"h{i}", "row_count": i}
+        for i in range(1000)
+    ]
+
+    with patch("engine.reconcile.VECTORIZE_MIN_BLOCKS", 1):
+        vectorized = to_blocks(blocks_data, r_config, start, end, 3, intervals, ranges=ranges)
+    with patch("engine.reconcile.VECTORIZE_MIN_BLOCKS", len(blocks_data) + 1):
+        scalar = to_blocks(blocks_data, r_config, start, end, 3, intervals, ranges=ranges)
+
+    assert [(b.start, b.end, b.level, b.num_rows, b.hash) for b in vectorized] == \
+        [(b.start, b.end, b.level, b.num_rows, b.hash) for b in scalar]
+
+
+def test_calculate_block_status_merges_both_sides_in_block_order():
+    src = [Block(start=s, end=s+10, level=2, num_rows=n, hash=h) for s, n, h in [(0, 5, "a"), (10, 5, "b"), (30, 5, "d"), (20, 5, "c")]]
+    snk = [Block(start=s, end=s+10, level=2, num_rows=n, hash=h) for s, n, h in [(0, 5, "a"), (10, 6, "x"), (40, 1, "e")]]
+
+    blocks, statuses = calculate_block_status(src, snk)
+
+    assert [b.start for b in blocks] == [0, 10, 20, 30, 40]
+    assert statuses == ['N', 'M', 'A', 'A', 'D']
+    # of a mismatched pair the side with more rows is kept
+    assert blocks[1].num_rows == 6
+
+
+def test_calculate_block_status_merges_on_grid_positions():
+    rows = [{"blockname": i, "blockhash": "h", "row_count": 1} for i in (5, 6, 8)]
+    config = Mock(partition_column_type="datetime", block_ids="int")
+    start, end = datetime.fromtimestamp(0), datetime.fromtimestamp(1000)
+    src = to_blocks(rows, config, start, end, 1, [100])
+    snk = to_blocks(rows[1:], config, start, end, 1, [100])
+
+    assert [b.position for b in src] == [500, 600, 800]
+    with patch("engine.reconcile.sorted", create=True) as sort:
+        blocks, statuses = calculate_block_status(src, snk, ordered=True)
+    # results of an ordered query are merged as they come
+    sort.assert_not_called()
+    assert statuses == ['A', 'N', 'N']
+    assert blocks[0].start == datetime.fromtimestamp(500)
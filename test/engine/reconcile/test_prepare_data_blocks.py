@@ -1,14 +1,18 @@
+import bisect
+import hashlib
 import pytest
 import os
 from unittest.mock import MagicMock, patch
-from datetime import datetime
+from datetime import date, datetime, timedelta
 
 import psycopg2
+import sqlite3
 import pytz
-from core.config import MD5_SUM_HASH, HASH_MD5_HASH, FieldConfig, ReconciliationConfig, PipelineConfig
-from engine.reconcile import prepare_data_blocks, Block
+from core.config import EQUAL_WIDTH, INT_BLOCK_IDS, TEXT_BLOCK_IDS, EQUI_DEPTH, DEPTH_FIRST, BREADTH_FIRST, SINGLE_PASS, MD5_SUM_HASH, HASH_MD5_HASH, SUM64_HASH, HASHTEXT64_HASH, FieldConfig, ReconciliationConfig, PipelineConfig
+from engine.reconcile import build_row_sketch_query, get_data_range, iter_data_blocks, iter_row_diffs, plan_equi_depth_partitions, prepare_data_blocks, split_hot_block, Block
 from adapters.postgres import PostgresAdapter
 from adapters.base import Adapter
+from core.query import Field
 
 
 @pytest.fixture(scope="module")
@@ -156,6 +160,17 @@ def int_reconciliation_config():
     config.initial_partition_interval = 10000
     config.start=None
     config.end=None
+    config.max_workers = 1
+    config.descent = DEPTH_FIRST
+    config.cache_path = None
+    config.partitioning = EQUAL_WIDTH
+    config.partition_sample = None
+    config.adaptive_intervals = False
+    config.block_ids = TEXT_BLOCK_IDS
+    config.range_fingerprint = False
+    config.sketch_size = None
+    config.summary_levels = 0
+    config.split_hot_blocks = False
     return config
 
 
@@ -182,6 +197,17 @@ def datetime_reconciliation_config():
     config.initial_partition_interval = 86400  # 1 day in seconds
     config.start=None
     config.end=None
+    config.max_workers = 1
+    config.descent = DEPTH_FIRST
+    config.cache_path = None
+    config.partitioning = EQUAL_WIDTH
+    config.partition_sample = None
+    config.adaptive_intervals = False
+    config.block_ids = TEXT_BLOCK_IDS
+    config.range_fingerprint = False
+    config.sketch_size = None
+    config.summary_levels = 0
+    config.split_hot_blocks = False
     return config
 
 
@@ -228,7 +254,7 @@ class TestPrepareDataBlocks:
         
         # Verify no block exceeds max_block_size
         for block, status in zip(blocks, statuses):
-            if status in ('M', 'A'):
+            if status == 'M':
                 assert block.num_rows <= max_block_size, \
                     f"Block with {block.num_rows} rows exceeds max_block_size of {max_block_size}"
 
@@ -310,7 +336,7 @@ class TestPrepareDataBlocks:
         
         # Verify no block exceeds the small block size
         for block, status in zip(blocks_small, statuses_small):
-            if status in ('M', 'A'):
+            if status == 'M':
                 assert block.num_rows <= small_block_size, \
                     f"Block with {block.num_rows} rows exceeds max_block_size of {small_block_size}"
         
@@ -346,15 +372,52 @@ class TestPrepareDataBlocks:
             end=22000
         )
         
-        # Should have merged some blocks
-        # Since all blocks have the same status ('A'), they should be merged
-        # based on the max_block_size
-        for block in blocks:
-            # Blocks can exceed max_block_size after merging,
-            # but should not exceed max_block_size
-            assert block.num_rows <= max_block_size, \
-                f"Merged block with {block.num_rows} rows exceeds max_block_size of {max_block_size}"
-        
+        # Since all blocks have the same status ('A'), they merge into one
+        # range copied whole, whatever its size
+        assert statuses == ['A']
+        assert (blocks[0].start, blocks[0].end, blocks[0].num_rows) == (20001, 22000, 1999)
+
+        blocks, statuses = prepare_data_blocks(
+            pipeline=int_mock_pipeline,
+            r_config=int_reconciliation_config,
+            initial_partition_interval=1000,
+            max_block_size=max_block_size,
+            interval_reduction_factor=5,
+            start=10001,  # Range with mostly 'M' status blocks
+            end=12000
+        )
+        # Mismatched blocks are merged only up to max_block_size
+        for block, status in zip(blocks, statuses):
+            if status == 'M':
+                assert block.num_rows <= max_block_size, \
+                    f"Merged block with {block.num_rows} rows exceeds max_block_size of {max_block_size}"
+
+    def test_prepare_data_blocks_added_and_deleted_ranges_are_terminal(self, int_mock_pipeline, int_reconciliation_config):
+        """A and D blocks aren't descended and merge into single range copies/deletes."""
+        fetch = int_mock_pipeline.sourcestate.fetch
+        levels = []
+
+        def spy(query, *args, **kwargs):
+            # the adapter rewrites the query, so note its level first
+            levels.extend(f.metadata.level for f in query.select if f.alias == 'blockname')
+            return fetch(query, *args, **kwargs)
+
+        with patch.object(int_mock_pipeline.sourcestate, "fetch", side_effect=spy):
+            blocks, statuses = prepare_data_blocks(
+                pipeline=int_mock_pipeline,
+                r_config=int_reconciliation_config,
+                initial_partition_interval=1000,
+                max_block_size=100,
+                interval_reduction_factor=10,
+                start=20001,
+                end=40001
+            )
+
+        # only the block straddling id 30000, where both sides hold rows, is descended
+        assert statuses == ['A', 'M', 'D']
+        assert [(b.start, b.end) for b in blocks] == [(20001, 30000), (30000, 30100), (30100, 40001)]
+        assert (blocks[0].num_rows, blocks[2].num_rows) == (9999, 9901)
+        assert levels.count(2) == 1
 
     def test_prepare_data_blocks_datetime_partition(self, datetime_mock_pipeline, datetime_reconciliation_config):
         """Test prepare_data_blocks with datetime partition column."""
@@ -431,7 +494,7 @@ class TestPrepareDataBlocks:
         assert len(blocks) == len(statuses), "Should have same number of blocks and statuses"
         
         # Verify small block sizes due to custom interval settings
-        block_sizes = [block.num_rows for block,status in zip(blocks,statuses) if status in ('M','A')]
+        block_sizes = [block.num_rows for block,status in zip(blocks,statuses) if status == 'M']
         max_block_size = max(block_sizes) if block_sizes else 0
         assert max_block_size <= 500, "Max block size should respect max_block_size"
 
@@ -459,7 +522,7 @@ class TestPrepareDataBlocks:
         assert sum([b.num_rows for b,status in zip(blocks,statuses) if status=='M']) == 9563, "Should have 9563 modified rows"
  
         # Verify small block sizes due to custom interval settings
-        # block_sizes = [block.num_rows for block,status in zip(blocks,statuses) if status in ('M','A')]
+        # block_sizes = [block.num_rows for block,status in zip(blocks,statuses) if status == 'M']
         # max_block_size = max(block_sizes) if block_sizes else 0
         # assert max_block_size <= 5000, "Max block size should respect max_block_size"
 
@@ -487,7 +550,7 @@ class TestPrepareDataBlocks:
         assert sum([b.num_rows for b,status in zip(blocks,statuses) if status=='M']) == 9563, "Should have 9563 modified rows"
  
         # Verify small block sizes due to custom interval settings
-        block_sizes = [block.num_rows for block,status in zip(blocks,statuses) if status in ('M','A')]
+        block_sizes = [block.num_rows for block,status in zip(blocks,statuses) if status == 'M']
         max_block_size = max(block_sizes) if block_sizes else 0
         assert max_block_size <= 5000, "Max block size should respect max_block_size"
 
@@ -519,7 +582,7 @@ class TestPrepareDataBlocks:
         assert sum([b.num_rows for b,status in zip(blocks,statuses) if status=='M']) == 9563, "Should have 9563 modified rows"
  
         # Verify small block sizes due to custom interval settings
-        block_sizes = [block.num_rows for block,status in zip(blocks,statuses) if status in ('M','A')]
+        block_sizes = [block.num_rows for block,status in zip(blocks,statuses) if status == 'M']
         max_block_size = max(block_sizes) if block_sizes else 0
         assert max_block_size <= 5000, "Max block size should respect max_block_size"
 
@@ -551,7 +614,7 @@ class TestPrepareDataBlocks:
         assert sum([b.num_rows for b,status in zip(blocks,statuses) if status=='M']) == 9563, "Should have 9563 modified rows"
  
         # Verify small block sizes due to custom interval settings
-        block_sizes = [block.num_rows for block,status in zip(blocks,statuses) if status in ('M','A')]
+        block_sizes = [block.num_rows for block,status in zip(blocks,statuses) if status == 'M']
         max_block_size = max(block_sizes) if block_sizes else 0
         assert max_block_size <= 5000, "Max block size should respect max_block_size"
 
@@ -584,6 +647,849 @@ class TestPrepareDataBlocks:
         assert sum([b.num_rows for b,status in zip(blocks,statuses) if status=='M']) == 9563, "Should have 9563 modified rows"
  
         # Verify small block sizes due to custom interval settings
-        block_sizes = [block.num_rows for block,status in zip(blocks,statuses) if status in ('M','A')]
+        block_sizes = [block.num_rows for block,status in zip(blocks,statuses) if status == 'M']
         max_block_size = max(block_sizes) if block_sizes else 0
-        assert max_block_size <= 5000, "Max block size should respect max_block_size"
\ No newline at end of file
+        assert max_block_size <= 5000, "Max block size should respect max_block_size"
+    def test_prepare_data_blocks_parallel_int(self, int_mock_pipeline, int_reconciliation_config):
+        """Parallel discovery returns the same blocks, in the same order, as the serial walk."""
+        kwargs = dict(
+            initial_partition_interval=5000,
+            max_block_size=100,
+            interval_reduction_factor=5,
+            start=1,
+            end=40001
+        )
+        serial_blocks, serial_statuses = prepare_data_blocks(
+            pipeline=int_mock_pipeline,
+            r_config=int_reconciliation_config,
+            max_workers=1,
+            **kwargs
+        )
+        parallel_blocks, parallel_statuses = prepare_data_blocks(
+            pipeline=int_mock_pipeline,
+            r_config=int_reconciliation_config,
+            max_workers=4,
+            **kwargs
+        )
+
+        assert parallel_statuses == serial_statuses
+        assert [(b.start, b.end, b.num_rows) for b in parallel_blocks] == \
+            [(b.start, b.end, b.num_rows) for b in serial_blocks]
+
+    def test_prepare_data_blocks_parallel_datetime(self, datetime_mock_pipeline, datetime_reconciliation_config):
+        """Parallel discovery over datetime partitions keeps partition order."""
+        kwargs = dict(
+            initial_partition_interval=86400,
+            max_block_size=500,
+            interval_reduction_factor=4,
+            start=datetime(2023, 1, 1, tzinfo=pytz.utc),
+            end=datetime(2023, 1, 31, tzinfo=pytz.utc)
+        )
+        serial_blocks, serial_statuses = prepare_data_blocks(
+            pipeline=datetime_mock_pipeline,
+            r_config=datetime_reconciliation_config,
+            **kwargs
+        )
+        parallel_blocks, parallel_statuses = prepare_data_blocks(
+            pipeline=datetime_mock_pipeline,
+            r_config=datetime_reconciliation_config,
+            max_workers=3,
+            **kwargs
+        )
+
+        assert parallel_statuses == serial_statuses
+        assert [(b.start, b.end, b.num_rows) for b in parallel_blocks] == \
+            [(b.start, b.end, b.num_rows) for b in serial_blocks]
+
+    @pytest.mark.parametrize("max_workers", [1, 3])
+    def test_prepare_data_blocks_breadth_first_int(self, int_mock_pipeline, int_reconciliation_config, max_workers):
+        """Breadth-first descent finds the same blocks as the depth-first walk."""
+        kwargs = dict(
+            initial_partition_interval=10000,
+            max_block_size=50,
+            interval_reduction_factor=10,
+            start=1,
+            end=40001,
+            max_workers=max_workers
+        )
+        depth_blocks, depth_statuses = prepare_data_blocks(
+            pipeline=int_mock_pipeline,
+            r_config=int_reconciliation_config,
+            descent=DEPTH_FIRST,
+            **kwargs
+        )
+        breadth_blocks, breadth_statuses = prepare_data_blocks(
+            pipeline=int_mock_pipeline,
+            r_config=int_reconciliation_config,
+            descent=BREADTH_FIRST,
+            **kwargs
+        )
+
+        assert breadth_statuses == depth_statuses
+        assert [(b.start, b.end, b.num_rows) for b in breadth_blocks] == \
+            [(b.start, b.end, b.num_rows) for b in depth_blocks]
+
+    def test_prepare_data_blocks_breadth_first_datetime(self, datetime_mock_pipeline, datetime_reconciliation_config):
+        """Breadth-first descent over datetime partitions matches the depth-first walk."""
+        kwargs = dict(
+            initial_partition_interval=86400,
+            max_block_size=100,
+            interval_reduction_factor=4,
+            start=datetime(2023, 1, 1, tzinfo=pytz.utc),
+            end=datetime(2023, 1, 31, tzinfo=pytz.utc)
+        )
+        depth_blocks, depth_statuses = prepare_data_blocks(
+            pipeline=datetime_mock_pipeline,
+            r_config=datetime_reconciliation_config,
+            descent=DEPTH_FIRST,
+            **kwargs
+        )
+        breadth_blocks, breadth_statuses = prepare_data_blocks(
+            pipeline=datetime_mock_pipeline,
+            r_config=datetime_reconciliation_config,
+            descent=BREADTH_FIRST,
+            **kwargs
+        )
+
+        assert breadth_statuses == depth_statuses
+        assert [(b.start, b.end, b.num_rows) for b in breadth_blocks] == \
+            [(b.start, b.end, b.num_rows) for b in depth_blocks]
+
+    @pytest.mark.parametrize("strategy", [HASH_MD5_HASH, MD5_SUM_HASH, SUM64_HASH, HASHTEXT64_HASH])
+    def test_prepare_data_blocks_single_pass_int(self, int_mock_pipeline, int_reconciliation_config, strategy):
+        """Single-pass (GROUPING SETS) descent matches the level-by-level walk."""
+        int_mock_pipeline.sourcestate.adapter_config.meta_columns.hash_column=None
+        int_mock_pipeline.sinkstate.adapter_config.meta_columns.hash_column=None
+        int_reconciliation_config.strategy = strategy
+        kwargs = dict(
+            initial_partition_interval=10000,
+            max_block_size=50,
+            interval_reduction_factor=10,
+            start=1,
+            end=40001
+        )
+        depth_blocks, depth_statuses = prepare_data_blocks(
+            pipeline=int_mock_pipeline,
+            r_config=int_reconciliation_config,
+            descent=DEPTH_FIRST,
+            **kwargs
+        )
+        single_blocks, single_statuses = prepare_data_blocks(
+            pipeline=int_mock_pipeline,
+            r_config=int_reconciliation_config,
+            descent=SINGLE_PASS,
+            **kwargs
+        )
+
+        assert single_statuses == depth_statuses
+        assert [(b.start, b.end, b.num_rows, b.hash) for b in single_blocks] == \
+            [(b.start, b.end, b.num_rows, b.hash) for b in depth_blocks]
+
+    def test_prepare_data_blocks_single_pass_one_query_per_partition(self, int_mock_pipeline, int_reconciliation_config):
+        """Each partition is scanned once per side in single-pass mode."""
+        kwargs = dict(
+            initial_partition_interval=10000,
+            max_block_size=10,
+            interval_reduction_factor=10,
+            start=1,
+            end=40001
+        )
+        depth_blocks, depth_statuses = prepare_data_blocks(
+            pipeline=int_mock_pipeline,
+            r_config=int_reconciliation_config,
+            descent=DEPTH_FIRST,
+            **kwargs
+        )
+        with patch.object(int_mock_pipeline.sourcestate, 'fetch', wraps=int_mock_pipeline.sourcestate.fetch) as src_fetch:
+            blocks, statuses = prepare_data_blocks(
+                pipeline=int_mock_pipeline,
+                r_config=int_reconciliation_config,
+                descent=SINGLE_PASS,
+                **kwargs
+            )
+
+        assert src_fetch.call_count == 5
+        assert statuses == depth_statuses
+        assert [(b.start, b.end, b.num_rows) for b in blocks] == [(b.start, b.end, b.num_rows) for b in depth_blocks]
+
+    def test_prepare_data_blocks_cache_skips_unchanged_partitions(self, int_mock_pipeline, int_reconciliation_config, tmp_path):
+        """Partitions that matched before are served from the cache until their watermark moves."""
+        cache_path = str(tmp_path / "blocks.db")
+        int_mock_pipeline.config.name = "test_pipeline"
+        int_reconciliation_config.name = "default"
+        int_mock_pipeline.sourcestate.adapter_config.meta_columns.updated_column = "created_at"
+        int_mock_pipeline.sinkstate.adapter_config.meta_columns.updated_column = "created_at"
+        kwargs = dict(
+            initial_partition_interval=5000,
+            max_block_size=1000,
+            interval_reduction_factor=5,
+            start=1,
+            end=40001,
+            cache_path=cache_path
+        )
+
+        def run():
+            with patch.object(int_mock_pipeline.sourcestate, 'fetch', wraps=int_mock_pipeline.sourcestate.fetch) as src_fetch:
+                blocks, statuses = prepare_data_blocks(pipeline=int_mock_pipeline, r_config=int_reconciliation_config, **kwargs)
+            return [(b.start, b.end, b.num_rows) for b in blocks], statuses, src_fetch.call_count
+
+        first_blocks, first_statuses, first_calls = run()
+        # [1, 5000) and [5000, 10000) match as a whole and are no longer hashed
+        blocks, statuses, calls = run()
+        assert (blocks, statuses) == (first_blocks, first_statuses)
+        assert calls == first_calls - 2
+
+        with sqlite3.connect(cache_path) as conn:
+            conn.execute("UPDATE block_hashes SET source_watermark = 'changed' WHERE block_start = '1'")
+        blocks, statuses, calls = run()
+        assert (blocks, statuses) == (first_blocks, first_statuses)
+        assert calls == first_calls - 1
+
+        blocks, statuses, calls = run()
+        assert calls == first_calls - 2
+
+    def test_prepare_data_blocks_cache_needs_updated_column(self, int_mock_pipeline, int_reconciliation_config, tmp_path):
+        """MAX(id) doesn't move on an in-place update, so the cache refuses to run without a watermark."""
+        int_mock_pipeline.config.name = "test_pipeline"
+        int_reconciliation_config.name = "default"
+        int_mock_pipeline.sourcestate.adapter_config.meta_columns.updated_column = "created_at"
+        int_mock_pipeline.sinkstate.adapter_config.meta_columns.updated_column = None
+
+        with pytest.raises(ValueError, match="cache_path needs meta_columns.updated_column on the sink state"):
+            prepare_data_blocks(
+                pipeline=int_mock_pipeline,
+                r_config=int_reconciliation_config,
+                initial_partition_interval=5000,
+                max_block_size=1000,
+                interval_reduction_factor=5,
+                start=1,
+                end=40001,
+                cache_path=str(tmp_path / "blocks.db")
+            )
+
+    @pytest.mark.parametrize("strategy", [SUM64_HASH, HASHTEXT64_HASH])
+    def test_prepare_data_blocks_mergeable_rolls_up_leaf_hashes(self, int_mock_pipeline, int_reconciliation_config, strategy):
+        """A mergeable strategy fetches only the leaf level and derives the parents."""
+        int_reconciliation_config.strategy = strategy
+        kwargs = dict(
+            initial_partition_interval=10000,
+            max_block_size=50,
+            interval_reduction_factor=10,
+            start=1,
+            end=40001
+        )
+        depth_blocks, depth_statuses = prepare_data_blocks(
+            pipeline=int_mock_pipeline,
+            r_config=int_reconciliation_config,
+            descent=DEPTH_FIRST,
+            **kwargs
+        )
+        with patch.object(int_mock_pipeline.sourcestate, 'fetch', wraps=int_mock_pipeline.sourcestate.fetch) as src_fetch:
+            blocks, statuses = prepare_data_blocks(
+                pipeline=int_mock_pipeline,
+                r_config=int_reconciliation_config,
+                descent=SINGLE_PASS,
+                **kwargs
+            )
+
+        assert src_fetch.call_count == 5
+        assert all(not call.args[0].grouping_sets for call in src_fetch.call_args_list)
+        assert statuses == depth_statuses
+        assert [(b.start, b.end, b.num_rows, b.hash) for b in blocks] == \
+            [(b.start, b.end, b.num_rows, b.hash) for b in depth_blocks]
+
+    @pytest.mark.parametrize("sample", [None, 100])
+    def test_plan_equi_depth_partitions_balances_rows(self, int_mock_pipeline, int_reconciliation_config, sample):
+        """Equi-depth windows follow the data instead of the value range."""
+        # all rows live in [1, 40001), equal-width windows of 25000 would hold 30000 and 10000 of them
+        intervals = [25000, 5000, 1000]
+        partitions = plan_equi_depth_partitions(
+            int_mock_pipeline.sourcestate,
+            int_mock_pipeline.sinkstate,
+            1,
+            100001,
+            int_reconciliation_config,
+            intervals,
+            4,
+            sample=sample
+        )
+
+        assert partitions[0][0] == 1 and partitions[-1][1] == 100001
+        assert all(e == s2 for (_, e), (s2, _) in zip(partitions, partitions[1:]))
+        assert all(s % 1000 == 0 for s, _ in partitions[1:])
+        source_ids = set(range(1, 30001))
+        sink_ids = set(range(1, 20001)) | set(range(30001, 40001))
+        for s, e in partitions:
+            window = set(range(s, e))
+            assert len(window & source_ids) <= 7500 + 1000
+            assert len(window & sink_ids) <= 7500 + 1000
+
+    @pytest.mark.parametrize("descent", [DEPTH_FIRST, SINGLE_PASS])
+    def test_prepare_data_blocks_equi_depth_int(self, int_mock_pipeline, int_reconciliation_config, descent):
+        """Equi-depth partitions find the same differences as equal-width ones."""
+        kwargs = dict(
+            initial_partition_interval=10000,
+            max_block_size=100,
+            interval_reduction_factor=10,
+            start=1,
+            end=40001,
+            descent=descent
+        )
+        width_blocks, width_statuses = prepare_data_blocks(
+            pipeline=int_mock_pipeline,
+            r_config=int_reconciliation_config,
+            partitioning=EQUAL_WIDTH,
+            **kwargs
+        )
+        depth_blocks, depth_statuses = prepare_data_blocks(
+            pipeline=int_mock_pipeline,
+            r_config=int_reconciliation_config,
+            partitioning=EQUI_DEPTH,
+            **kwargs
+        )
+
+        def rows_by_status(blocks, statuses):
+            totals = {}
+            for b, st in zip(blocks, statuses):
+                totals[st] = totals.get(st, 0) + b.num_rows
+            return totals
+
+        assert set(depth_statuses) == {'N', 'M', 'A', 'D'}
+        assert rows_by_status(depth_blocks, depth_statuses) == rows_by_status(width_blocks, width_statuses)
+        assert all(b1.end <= b2.start for b1, b2 in zip(depth_blocks, depth_blocks[1:]))
+
+    def test_prepare_data_blocks_equi_depth_with_cache(self, int_mock_pipeline, int_reconciliation_config, tmp_path):
+        """Planned windows are cached like equal-width partitions."""
+        int_mock_pipeline.config.name = "test_pipeline"
+        int_reconciliation_config.name = "default"
+        int_mock_pipeline.sourcestate.adapter_config.meta_columns.updated_column = "created_at"
+        int_mock_pipeline.sinkstate.adapter_config.meta_columns.updated_column = "created_at"
+        kwargs = dict(
+            initial_partition_interval=5000,
+            max_block_size=1000,
+            interval_reduction_factor=5,
+            start=1,
+            end=40001,
+            cache_path=str(tmp_path / "blocks.db"),
+            partitioning=EQUI_DEPTH
+        )
+        first_blocks, first_statuses = prepare_data_blocks(pipeline=int_mock_pipeline, r_config=int_reconciliation_config, **kwargs)
+        with patch.object(int_mock_pipeline.sourcestate, 'fetch', wraps=int_mock_pipeline.sourcestate.fetch) as src_fetch:
+            blocks, statuses = prepare_data_blocks(pipeline=int_mock_pipeline, r_config=int_reconciliation_config, **kwargs)
+
+        hashed = [call.args[0] for call in src_fetch.call_args_list if any(f.type == "blockhash" for f in call.args[0].select)]
+        assert 'N' in statuses
+        assert sum(b.num_rows for b, st in zip(blocks, statuses) if st == 'N') == \
+            sum(b.num_rows for b, st in zip(first_blocks, first_statuses) if st == 'N')
+        # matching windows are not hashed again
+        assert all(f.value >= 10000 for q in hashed for f in q.filters if f.operator == '<')
+
+    @pytest.mark.parametrize("descent,max_workers", [(DEPTH_FIRST, 1), (BREADTH_FIRST, 1), (DEPTH_FIRST, 3), (BREADTH_FIRST, 3)])
+    def test_prepare_data_blocks_adaptive_intervals_int(self, int_mock_pipeline, int_reconciliation_config, descent, max_workers):
+        """Child intervals picked from row counts reach leaf size in fewer queries."""
+        kwargs = dict(
+            initial_partition_interval=10000,
+            max_block_size=100,
+            interval_reduction_factor=10,
+            start=1,
+            end=40001,
+            descent=descent,
+            max_workers=max_workers
+        )
+        with patch.object(int_mock_pipeline.sourcestate, 'fetch', wraps=int_mock_pipeline.sourcestate.fetch) as src_fetch:
+            fixed_blocks, fixed_statuses = prepare_data_blocks(
+                pipeline=int_mock_pipeline,
+                r_config=int_reconciliation_config,
+                adaptive_intervals=False,
+                **kwargs
+            )
+            fixed_calls = src_fetch.call_count
+        with patch.object(int_mock_pipeline.sourcestate, 'fetch', wraps=int_mock_pipeline.sourcestate.fetch) as src_fetch:
+            blocks, statuses = prepare_data_blocks(
+                pipeline=int_mock_pipeline,
+                r_config=int_reconciliation_config,
+                adaptive_intervals=True,
+                **kwargs
+            )
+            adaptive_calls = src_fetch.call_count
+
+        def rows_by_status(blocks, statuses):
+            totals = {}
+            for b, st in zip(blocks, statuses):
+                totals[st] = totals.get(st, 0) + b.num_rows
+            return totals
+
+        assert rows_by_status(blocks, statuses) == rows_by_status(fixed_blocks, fixed_statuses)
+        assert all(b.num_rows <= 100 for b, st in zip(blocks, statuses) if st == 'M')
+        assert all(b1.end <= b2.start for b1, b2 in zip(blocks, blocks[1:]))
+        if max_workers == 1:
+            assert adaptive_calls < fixed_calls
+
+    @pytest.mark.parametrize("descent,strategy", [
+        (DEPTH_FIRST, HASH_MD5_HASH),
+        (BREADTH_FIRST, HASH_MD5_HASH),
+        (SINGLE_PASS, HASH_MD5_HASH),
+        (SINGLE_PASS, SUM64_HASH),
+    ])
+    def test_prepare_data_blocks_int_block_ids(self, int_mock_pipeline, int_reconciliation_config, descent, strategy):
+        """Integer block ids name the same blocks as text block names."""
+        int_reconciliation_config.strategy = strategy
+        kwargs = dict(
+            initial_partition_interval=5000,
+            max_block_size=100,
+            interval_reduction_factor=5,
+            start=1,
+            end=40001,
+            descent=descent
+        )
+        text_blocks, text_statuses = prepare_data_blocks(
+            pipeline=int_mock_pipeline,
+            r_config=int_reconciliation_config,
+            **kwargs
+        )
+        int_reconciliation_config.block_ids = INT_BLOCK_IDS
+        rows = []
+        fetch = int_mock_pipeline.sourcestate.fetch
+        def spy(query, *args, **kwargs):
+            result = fetch(query, *args, **kwargs)
+            rows.extend(result)
+            return result
+        with patch.object(int_mock_pipeline.sourcestate, 'fetch', side_effect=spy):
+            blocks, statuses = prepare_data_blocks(
+                pipeline=int_mock_pipeline,
+                r_config=int_reconciliation_config,
+                **kwargs
+            )
+
+        names = [v for row in rows for k, v in row.items() if k.startswith("blockname") and v is not None]
+        assert names and all(isinstance(name, int) for name in names)
+        assert statuses == text_statuses
+        assert [(b.start, b.end, b.num_rows, b.hash) for b in blocks] == \
+            [(b.start, b.end, b.num_rows, b.hash) for b in text_blocks]
+
+    def test_prepare_data_blocks_int_block_ids_datetime(self, datetime_mock_pipeline, datetime_reconciliation_config):
+        """Datetime intervals that stop nesting fall back to text names at the deeper levels."""
+        kwargs = dict(
+            initial_partition_interval=86400,
+            max_block_size=20,
+            interval_reduction_factor=4,
+            start=datetime(2023, 1, 1, tzinfo=pytz.utc),
+            end=datetime(2023, 1, 31, tzinfo=pytz.utc)
+        )
+        text_blocks, text_statuses = prepare_data_blocks(
+            pipeline=datetime_mock_pipeline,
+            r_config=datetime_reconciliation_config,
+            **kwargs
+        )
+        datetime_reconciliation_config.block_ids = INT_BLOCK_IDS
+        blocks, statuses = prepare_data_blocks(
+            pipeline=datetime_mock_pipeline,
+            r_config=datetime_reconciliation_config,
+            **kwargs
+        )
+
+        assert statuses == text_statuses
+        assert [(b.start, b.end, b.num_rows, b.hash) for b in blocks] == \
+            [(b.start, b.end, b.num_rows, b.hash) for b in text_blocks]
+
+    @pytest.mark.parametrize("max_workers", [1, 3])
+    def test_iter_data_blocks_streams_partitions(self, int_mock_pipeline, int_reconciliation_config, max_workers):
+        """The streaming API yields the same pairs, starting before later partitions are compared."""
+        kwargs = dict(
+            initial_partition_interval=5000,
+            max_block_size=100,
+            interval_reduction_factor=5,
+            start=1,
+            end=40001,
+            max_workers=max_workers
+        )
+        blocks, statuses = prepare_data_blocks(
+            pipeline=int_mock_pipeline,
+            r_config=int_reconciliation_config,
+            **kwargs
+        )
+        pairs = list(iter_data_blocks(int_mock_pipeline, int_reconciliation_config, **kwargs))
+        assert [st for _, st in pairs] == statuses
+        assert [(b.start, b.end, b.num_rows) for b, _ in pairs] == \
+            [(b.start, b.end, b.num_rows) for b in blocks]
+
+        if max_workers == 1:
+            with patch.object(int_mock_pipeline.sourcestate, 'fetch', wraps=int_mock_pipeline.sourcestate.fetch) as src_fetch:
+                stream = iter_data_blocks(int_mock_pipeline, int_reconciliation_config, **kwargs)
+                first_block, first_status = next(stream)
+                # only the first partition [0, 5000) has been compared so far
+                upper_bounds = [f.value for call in src_fetch.call_args_list for f in call.args[0].filters if f.operator == '<']
+                assert upper_bounds and max(upper_bounds) <= 5000
+                stream.close()
+            assert (first_block.start, first_status) == (blocks[0].start, statuses[0])
+        else:
+            stream = iter_data_blocks(int_mock_pipeline, int_reconciliation_config, **kwargs)
+            assert next(stream)[1] == statuses[0]
+            # closing early stops the worker pool
+            stream.close()
+
+    @pytest.mark.parametrize("descent", [DEPTH_FIRST, BREADTH_FIRST])
+    def test_prepare_data_blocks_summary_levels(self, int_mock_pipeline, int_reconciliation_config, descent):
+        """Top levels compared by count, watermark and key hash find the same blocks."""
+        for state in (int_mock_pipeline.sourcestate, int_mock_pipeline.sinkstate):
+            # every changed row has a new hash_value, which stands in for an updated_at column here
+            state.adapter_config.meta_columns.updated_column = "hash_value"
+            state.adapter_config.meta_columns.unique_columns = ["id"]
+        int_reconciliation_config.descent = descent
+        kwargs = dict(initial_partition_interval=10000, max_block_size=100, interval_reduction_factor=10)
+        expected = prepare_data_blocks(pipeline=int_mock_pipeline, r_config=int_reconciliation_config, **kwargs)
+
+        int_reconciliation_config.summary_levels = 2
+        fetch = int_mock_pipeline.sourcestate.fetch
+        hashed_levels = set()
+
+        def spy(query, *args, **kwargs):
+            # the adapter rewrites the query, so note which levels hash rows first
+            if not any(f.alias == "keyhash" for f in query.select):
+                hashed_levels.update(f.metadata.level for f in query.select if f.alias == "blockname")
+            return fetch(query, *args, **kwargs)
+
+        with patch.object(int_mock_pipeline.sourcestate, "fetch", side_effect=spy):
+            blocks, statuses = prepare_data_blocks(pipeline=int_mock_pipeline, r_config=int_reconciliation_config, **kwargs)
+
+        assert statuses == expected[1]
+        assert [(b.start, b.end, b.num_rows) for b in blocks] == [(b.start, b.end, b.num_rows) for b in expected[0]]
+        assert hashed_levels == {3}
+
+    def test_prepare_data_blocks_summary_levels_in_place_update(self, int_mock_pipeline, int_reconciliation_config):
+        """A row updated in place moves the watermark, summary levels need one to see it."""
+        sink = int_mock_pipeline.sinkstate
+        for state in (int_mock_pipeline.sourcestate, sink):
+            state.adapter_config.meta_columns.updated_column = "hash_value"
+            state.adapter_config.meta_columns.unique_columns = ["id"]
+        int_reconciliation_config.summary_levels = 2
+        kwargs = dict(initial_partition_interval=10000, max_block_size=100, interval_reduction_factor=10, start=1, end=10001)
+        sink.cursor.execute("SELECT value, hash_value FROM sink_table WHERE id = 5")
+        value, hash_value = sink.cursor.fetchone()
+        try:
+            # same key, same count, only the watermark column moves with the change
+            sink.execute("UPDATE sink_table SET value = value + 1, hash_value = 'updated' WHERE id = 5")
+            blocks, statuses = prepare_data_blocks(pipeline=int_mock_pipeline, r_config=int_reconciliation_config, **kwargs)
+            assert [(b.start, b.end) for b, st in zip(blocks, statuses) if st == 'M'] == [(1, 100)]
+
+            sink.adapter_config.meta_columns.updated_column = None
+            with pytest.raises(ValueError, match="updated_column"):
+                prepare_data_blocks(pipeline=int_mock_pipeline, r_config=int_reconciliation_config, **kwargs)
+        finally:
+            sink.execute("UPDATE sink_table SET value = %s, hash_value = %s WHERE id = 5", (value, hash_value))
+
+    @pytest.mark.parametrize("strategy", [HASH_MD5_HASH, MD5_SUM_HASH, SUM64_HASH])
+    def test_prepare_data_blocks_range_fingerprint(self, int_mock_pipeline, int_reconciliation_config, strategy):
+        """A range in sync is settled by one fingerprint query per side, other ranges descend as before."""
+        int_reconciliation_config.strategy = strategy
+        if strategy == MD5_SUM_HASH:
+            int_mock_pipeline.sourcestate.adapter_config.meta_columns.hash_column = None
+            int_mock_pipeline.sinkstate.adapter_config.meta_columns.hash_column = None
+        kwargs = dict(initial_partition_interval=1000, max_block_size=100, interval_reduction_factor=10)
+
+        with patch.object(int_mock_pipeline.sourcestate, 'fetch', wraps=int_mock_pipeline.sourcestate.fetch) as src_fetch:
+            blocks, statuses = prepare_data_blocks(
+                pipeline=int_mock_pipeline,
+                r_config=int_reconciliation_config,
+                start=1,
+                end=10001,
+                range_fingerprint=True,
+                **kwargs
+            )
+        assert src_fetch.call_count == 1
+        assert statuses == ['N']
+        assert (blocks[0].start, blocks[0].end, blocks[0].num_rows) == (1, 10001, 10000)
+
+        expected_blocks, expected_statuses = prepare_data_blocks(
+            pipeline=int_mock_pipeline,
+            r_config=int_reconciliation_config,
+            start=5001,
+            end=25001,
+            **kwargs
+        )
+        blocks, statuses = prepare_data_blocks(
+            pipeline=int_mock_pipeline,
+            r_config=int_reconciliation_config,
+            start=5001,
+            end=25001,
+            range_fingerprint=True,
+            **kwargs
+        )
+        assert statuses == expected_statuses
+        assert [(b.start, b.end, b.num_rows) for b in blocks] == \
+            [(b.start, b.end, b.num_rows) for b in expected_blocks]
+
+    def test_iter_row_diffs_finds_exact_keys(self, int_mock_pipeline, int_reconciliation_config):
+        """Mismatched blocks resolve to exactly the keys that differ."""
+        int_mock_pipeline.sourcestate.adapter_config.meta_columns.unique_columns = ["id"]
+        int_mock_pipeline.sinkstate.adapter_config.meta_columns.unique_columns = ["id"]
+        blocks, statuses = prepare_data_blocks(
+            pipeline=int_mock_pipeline,
+            r_config=int_reconciliation_config,
+            initial_partition_interval=1000,
+            max_block_size=100,
+            interval_reduction_factor=10,
+            start=5001,
+            end=35001
+        )
+
+        diffs = list(iter_row_diffs(
+            int_mock_pipeline.sourcestate, int_mock_pipeline.sinkstate, zip(blocks, statuses), int_reconciliation_config
+        ))
+
+        assert all((diff is None) == (status != 'M') for _, status, diff in diffs)
+        updates = {key for _, _, diff in diffs if diff for key in diff.updates}
+        inserts = {key for _, _, diff in diffs if diff for key in diff.inserts}
+        deletes = {key for _, _, diff in diffs if diff for key in diff.deletes}
+        # 10001-20000 differ in value unless id % 19 == id % 23
+        assert updates == {(i,) for i in range(10001, 20001) if i % 19 != i % 23}
+        assert all(20000 < i <= 30000 for i, in inserts)
+        assert all(30000 < i <= 35000 for i, in deletes)
+
+    @pytest.mark.parametrize("strategy", [MD5_SUM_HASH, HASH_MD5_HASH])
+    def test_iter_row_diffs_sketch_matches_full_diff(self, int_mock_pipeline, int_reconciliation_config, strategy):
+        """Decoded row sketches name the same keys as the full key lists."""
+        int_mock_pipeline.sourcestate.adapter_config.meta_columns.hash_column = None
+        int_mock_pipeline.sinkstate.adapter_config.meta_columns.hash_column = None
+        int_reconciliation_config.strategy = strategy
+        int_mock_pipeline.sourcestate.adapter_config.meta_columns.unique_columns = ["id"]
+        int_mock_pipeline.sinkstate.adapter_config.meta_columns.unique_columns = ["id"]
+        blocks, statuses = prepare_data_blocks(
+            pipeline=int_mock_pipeline,
+            r_config=int_reconciliation_config,
+            initial_partition_interval=1000,
+            max_block_size=100,
+            interval_reduction_factor=10,
+            start=9901,
+            end=10201
+        )
+        pairs = list(zip(blocks, statuses))
+        assert 'M' in statuses
+
+        expected = list(iter_row_diffs(
+            int_mock_pipeline.sourcestate, int_mock_pipeline.sinkstate, pairs, int_reconciliation_config
+        ))
+        with patch("engine.reconcile.diff_rows") as full_diff:
+            sketched = list(iter_row_diffs(
+                int_mock_pipeline.sourcestate, int_mock_pipeline.sinkstate, pairs, int_reconciliation_config,
+                sketch_size=300
+            ))
+        assert [(b.start, s, d and (d.inserts, d.updates, d.deletes)) for b, s, d in sketched] == \
+            [(b.start, s, d and (d.inserts, d.updates, d.deletes)) for b, s, d in expected]
+        full_diff.assert_not_called()
+
+    def test_iter_row_diffs_small_sketch_falls_back(self, int_mock_pipeline, int_reconciliation_config):
+        """A sketch too small to decode falls back to the full key lists."""
+        int_mock_pipeline.sourcestate.adapter_config.meta_columns.unique_columns = ["id"]
+        int_mock_pipeline.sinkstate.adapter_config.meta_columns.unique_columns = ["id"]
+        block = Block(start=10001, end=10101, level=1, num_rows=100, hash=None)
+
+        expected, = iter_row_diffs(
+            int_mock_pipeline.sourcestate, int_mock_pipeline.sinkstate, [(block, 'M')], int_reconciliation_config
+        )
+        sketched, = iter_row_diffs(
+            int_mock_pipeline.sourcestate, int_mock_pipeline.sinkstate, [(block, 'M')], int_reconciliation_config,
+            sketch_size=3
+        )
+        assert len(expected[2].updates) > 50
+        assert sketched[2].updates == expected[2].updates
+
+    @pytest.mark.parametrize("key_column", ["str_key", "uuid_key"])
+    def test_iter_row_diffs_sketch_skips_non_integer_keys(self, int_mock_pipeline, int_reconciliation_config, key_column):
+        """Text and uuid keys can't be XORed into a sketch, they go straight to the key lists."""
+        int_mock_pipeline.sourcestate.adapter_config.meta_columns.unique_columns = [key_column]
+        int_mock_pipeline.sinkstate.adapter_config.meta_columns.unique_columns = [key_column]
+        block = Block(start=10001, end=10101, level=1, num_rows=100, hash=None)
+
+        with patch("engine.reconcile.build_row_sketch_query") as sketch_query:
+            sketched, = iter_row_diffs(
+                int_mock_pipeline.sourcestate, int_mock_pipeline.sinkstate, [(block, 'M')], int_reconciliation_config,
+                sketch_size=300
+            )
+        sketch_query.assert_not_called()
+        assert len(sketched[2].updates) > 50
+        assert all(isinstance(key, str) for key, in sketched[2].updates)
+
+    def test_iter_row_diffs_failed_sketch_falls_back(self, int_mock_pipeline, int_reconciliation_config):
+        """A sketch query the store rejects falls back to the key lists on a still usable connection."""
+        int_mock_pipeline.sourcestate.adapter_config.meta_columns.unique_columns = ["id"]
+        int_mock_pipeline.sinkstate.adapter_config.meta_columns.unique_columns = ["id"]
+        block = Block(start=10001, end=10101, level=1, num_rows=100, hash=None)
+        expected, = iter_row_diffs(
+            int_mock_pipeline.sourcestate, int_mock_pipeline.sinkstate, [(block, 'M')], int_reconciliation_config
+        )
+
+        def failing_sketch_query(*args, **kwargs):
+            query = build_row_sketch_query(*args, **kwargs)
+            query.select[-1] = Field(expr="BIT_XOR('not a number'::bigint)", alias="check_xor", type="column")
+            return query
+
+        with patch("engine.reconcile.build_row_sketch_query", side_effect=failing_sketch_query):
+            sketched, = iter_row_diffs(
+                int_mock_pipeline.sourcestate, int_mock_pipeline.sinkstate, [(block, 'M')], int_reconciliation_config,
+                sketch_size=300
+            )
+        assert (sketched[2].inserts, sketched[2].updates, sketched[2].deletes) == \
+            (expected[2].inserts, expected[2].updates, expected[2].deletes)
+
+
+def _key_of_uuid(row_id):
+    return int(hashlib.md5(f"uuid-{row_id}".encode()).hexdigest()[:8], 16)
+
+
+def _key_of_str(row_id):
+    return int(hashlib.md5(f"key-{row_id}".encode()).hexdigest()[:8], 16)
+
+
+def _key_of_date(row_id):
+    # created_at of init.sql, per id range
+    if row_id <= 10000:
+        base = datetime(2023, 1, 1)
+    elif row_id <= 20000:
+        base = datetime(2023, 1, 7, 23, 40)
+    elif row_id <= 30000:
+        base = datetime(2023, 1, 14, 23, 20)
+    else:
+        base = datetime(2023, 1, 21, 23, 0)
+    return (base + timedelta(minutes=row_id)).date()
+
+
+def assert_blocks_cover_differences(blocks, statuses, key_of):
+    """Matching blocks hold only identical rows, all other blocks at least one differing row."""
+    keyed = sorted((key_of(row_id), row_id) for row_id in range(1, 40001))
+    keys = [k for k, _ in keyed]
+    covered = 0
+    for block, status in zip(blocks, statuses):
+        ids = [row_id for _, row_id in keyed[bisect.bisect_left(keys, block.start):bisect.bisect_left(keys, block.end)]]
+        covered += len(ids)
+        # in 10001-20000 rows with id % 19 == id % 23 still hold equal values
+        differing = [row_id for row_id in ids if row_id > 20000 or (row_id > 10000 and row_id % 19 != row_id % 23)]
+        if status == 'N':
+            assert not differing, f"matching block {block.start}-{block.end} holds differing rows"
+        else:
+            assert differing, f"{status} block {block.start}-{block.end} holds no differing rows"
+    assert covered == len(keyed)
+
+
+class TestPrepareDataBlocksKeyTypes:
+    """Block discovery on uuid, str and date partition columns."""
+
+    @pytest.mark.parametrize("descent", [BREADTH_FIRST, SINGLE_PASS])
+    @pytest.mark.parametrize("column,column_type,key_of", [
+        ("uuid_key", "uuid", _key_of_uuid),
+        ("str_key", "str", _key_of_str),
+    ])
+    def test_keyed_partition_columns(self, int_mock_pipeline, int_reconciliation_config, descent, column, column_type, key_of):
+        int_mock_pipeline.sourcestate.adapter_config.meta_columns.partition_column = column
+        int_mock_pipeline.sinkstate.adapter_config.meta_columns.partition_column = column
+        int_reconciliation_config.partition_column_type = column_type
+
+        blocks, statuses = prepare_data_blocks(
+            pipeline=int_mock_pipeline,
+            r_config=int_reconciliation_config,
+            initial_partition_interval=2**28,
+            max_block_size=10,
+            interval_reduction_factor=16,
+            descent=descent
+        )
+
+        assert set(statuses) == {'N', 'M', 'A', 'D'}
+        assert blocks[0].start >= 0 and blocks[-1].end <= 2**32
+        assert_blocks_cover_differences(blocks, statuses, key_of)
+
+    def test_keyed_range_bounds(self, int_mock_pipeline, int_reconciliation_config):
+        """User bounds of keyed columns are key-space positions, uuids are widened to their buckets."""
+        int_reconciliation_config.partition_column_type = "uuid"
+        bounds = get_data_range(
+            int_mock_pipeline.sourcestate, int_mock_pipeline.sinkstate, int_reconciliation_config,
+            start="00000010-0000-0000-0000-000000000001", end="00000020-0000-0000-0000-000000000001"
+        )
+        assert bounds == (16, 33)
+        assert get_data_range(int_mock_pipeline.sourcestate, int_mock_pipeline.sinkstate, int_reconciliation_config, start="5", end=None) == (5, 2**32)
+
+        int_reconciliation_config.partition_column_type = "str"
+        for start in ("abc", -1, 2**32 + 1):
+            with pytest.raises(ValueError):
+                get_data_range(int_mock_pipeline.sourcestate, int_mock_pipeline.sinkstate, int_reconciliation_config, start=start, end=None)
+
+    def test_date_partition_column(self, int_mock_pipeline, int_reconciliation_config):
+        int_mock_pipeline.sourcestate.adapter_config.meta_columns.partition_column = "created_date"
+        int_mock_pipeline.sinkstate.adapter_config.meta_columns.partition_column = "created_date"
+        int_reconciliation_config.partition_column_type = "date"
+
+        blocks, statuses = prepare_data_blocks(
+            pipeline=int_mock_pipeline,
+            r_config=int_reconciliation_config,
+            initial_partition_interval=8,
+            max_block_size=1,
+            interval_reduction_factor=2
+        )
+
+        assert all(isinstance(b.start, date) and isinstance(b.end, date) for b in blocks)
+        assert 'N' in statuses and 'M' in statuses
+        assert_blocks_cover_differences(blocks, statuses, _key_of_date)
+
+    def test_hot_leaves_split_on_secondary_key(self, int_mock_pipeline, int_reconciliation_config):
+        """A day of 1440 rows can't be divided by date, it is split into id ranges instead."""
+        for state in (int_mock_pipeline.sourcestate, int_mock_pipeline.sinkstate):
+            state.adapter_config.meta_columns.partition_column = "created_date"
+            state.adapter_config.meta_columns.unique_columns = ["id"]
+        int_reconciliation_config.partition_column_type = "date"
+        int_reconciliation_config.split_hot_blocks = True
+        max_block_size = 100
+
+        blocks, statuses = prepare_data_blocks(
+            pipeline=int_mock_pipeline,
+            r_config=int_reconciliation_config,
+            initial_partition_interval=8,
+            max_block_size=max_block_size,
+            interval_reduction_factor=2
+        )
+
+        split = [(b, st) for b, st in zip(blocks, statuses) if b.is_key_split]
+        # split ranges are hashed again, ranges on one side only become A or D
+        assert {st for _, st in split} == {'A', 'D', 'M'}
+        source_ids = set(range(1, 30001))
+        sink_ids = set(range(1, 20001)) | set(range(30001, 40001))
+        ids_by_date = {}
+        for row_id in range(1, 40001):
+            ids_by_date.setdefault(_key_of_date(row_id), []).append(row_id)
+        covered = []
+        for block, status in zip(blocks, statuses):
+            ids = [
+                row_id for day, day_ids in ids_by_date.items() if block.start <= day < block.end for row_id in day_ids
+                if (block.key_start is None or row_id >= block.key_start)
+                and (block.key_end is None or row_id < block.key_end)
+            ]
+            covered.extend(ids)
+            if block.is_key_split:
+                assert len(source_ids.intersection(ids)) <= max_block_size
+                assert len(sink_ids.intersection(ids)) <= max_block_size
+                if status == 'N':
+                    assert source_ids.issuperset(ids) and sink_ids.issuperset(ids)
+                    assert not [row_id for row_id in ids if 10001 <= row_id <= 20000 and row_id % 19 != row_id % 23]
+        assert sorted(covered) == list(range(1, 40001))
+
+        diffs = list(iter_row_diffs(
+            int_mock_pipeline.sourcestate, int_mock_pipeline.sinkstate, [(b, st) for b, st in split if st == 'M'], int_reconciliation_config
+        ))
+        updates = [key for _, _, diff in diffs for key in diff.updates]
+        # each split block diffs only its own id range
+        assert len(updates) == len(set(updates))
+
+    def test_split_hot_block_rehashes_key_ranges(self, int_mock_pipeline, int_reconciliation_config):
+        """Keyset ranges of a mismatched block that are in sync come back N."""
+        for state in (int_mock_pipeline.sourcestate, int_mock_pipeline.sinkstate):
+            state.adapter_config.meta_columns.partition_column = "created_date"
+            state.adapter_config.meta_columns.unique_columns = ["id"]
+        int_reconciliation_config.partition_column_type = "date"
+        # ids 1-10000 are in sync, most of 10001-20000 differ
+        block = Block(date(2023, 1, 3), date(2023, 1, 19), 1, 12980, None)
+
+        parts = split_hot_block(int_mock_pipeline.sourcestate, int_mock_pipeline.sinkstate, block, int_reconciliation_config, 1000)
+
+        statuses = [st for _, st in parts]
+        assert statuses == ['N'] * statuses.count('N') + ['M'] * statuses.count('M')
+        assert statuses.count('N') >= 6
+        assert sum(part.num_rows for part, _ in parts) == 12980
+        assert all(part.key_end <= 10001 for part, st in parts if st == 'N')
@@ -0,0 +1,45 @@
+from datetime import datetime, timezone
+
+from core.config import HASH_MD5_HASH, MD5_SUM_HASH, Block
+from engine.block_cache import BlockHashCache
+
+
+def summary(num_rows, watermark):
+    return Block(start=None, end=None, level=1, num_rows=num_rows, hash=watermark)
+
+
+def test_match_requires_same_counts_and_watermarks(tmp_path):
+    cache = BlockHashCache(str(tmp_path / "blocks.db"), "pipeline", "default")
+    watermark = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    cache.put(Block(0, 100, 1, 10, "abc"), HASH_MD5_HASH, watermark, watermark)
+
+    block = cache.match(1, 0, 100, HASH_MD5_HASH, summary(10, watermark), summary(10, watermark))
+    assert (block.start, block.end, block.level, block.num_rows, block.hash) == (0, 100, 1, 10, "abc")
+
+    later = datetime(2024, 1, 2, tzinfo=timezone.utc)
+    assert cache.match(1, 0, 100, HASH_MD5_HASH, summary(10, later), summary(10, watermark)) is None
+    assert cache.match(1, 0, 100, HASH_MD5_HASH, summary(9, watermark), summary(10, watermark)) is None
+    assert cache.match(1, 0, 100, HASH_MD5_HASH, summary(10, watermark), None) is None
+    assert cache.match(1, 0, 100, MD5_SUM_HASH, summary(10, watermark), summary(10, watermark)) is None
+    assert cache.match(2, 0, 100, HASH_MD5_HASH, summary(10, watermark), summary(10, watermark)) is None
+
+
+def test_entries_persist_per_pipeline_and_reconciliation(tmp_path):
+    path = str(tmp_path / "blocks.db")
+    cache = BlockHashCache(path, "pipeline", "default")
+    cache.put(Block(0, 100, 1, 10, "abc"), HASH_MD5_HASH, 5, 5)
+    cache.put(Block(100, 200, 1, 10, "def"), HASH_MD5_HASH, 5, 5)
+    cache.discard(1, 100, 200)
+    cache.close()
+
+    cache = BlockHashCache(path, "pipeline", "default")
+    assert cache.match(1, 0, 100, HASH_MD5_HASH, summary(10, 5), summary(10, 5)).hash == "abc"
+    assert cache.match(1, 100, 200, HASH_MD5_HASH, summary(10, 5), summary(10, 5)) is None
+    other = BlockHashCache(path, "pipeline", "other")
+    assert other.match(1, 0, 100, HASH_MD5_HASH, summary(10, 5), summary(10, 5)) is None
+
+
+def test_blocks_without_watermark_are_not_cached(tmp_path):
+    cache = BlockHashCache(str(tmp_path / "blocks.db"), "pipeline", "default")
+    cache.put(Block(0, 100, 1, 10, "abc"), HASH_MD5_HASH, None, None)
+    assert cache.match(1, 0, 100, HASH_MD5_HASH, summary(10, None), summary(10, None)) is None
@@ -0,0 +1,311 @@
+import os
+from datetime import date, datetime
+from unittest.mock import MagicMock, patch
+
+import psycopg2
+import pytest
+
+from adapters.postgres import PostgresAdapter
+from core.config import HASH_MD5_HASH, Block, FieldConfig, MergeStrategyConfig, RowDiff
+from engine.load import build_sink_delete_query, build_source_rows_query, chunk_block, load, load_row_diff, row_size, to_sink_row
+
+SINK_TABLE = "load_sink_table"
+
+
+@pytest.fixture(scope="module")
+def store_config():
+    return {
+        'host': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'port': os.environ.get('POSTGRES_PORT', '5432'),
+        'username': os.environ.get('POSTGRES_USER', 'synctool'),
+        'password': os.environ.get('POSTGRES_PASSWORD', 'synctool'),
+        'database': os.environ.get('POSTGRES_DB', 'synctool'),
+    }
+
+
+@pytest.fixture
+def source(store_config):
+    adapter = PostgresAdapter(
+        store_config=store_config,
+        adapter_config=MagicMock(
+            fields=[FieldConfig(column="id"), FieldConfig(column="name"), FieldConfig(column="value")],
+            table=MagicMock(table="source_table", dbschema="public", alias=None),
+            filters=[],
+            joins=[],
+            batch_size=250,
+            meta_columns=MagicMock(partition_column="id", order_column="id", unique_columns=["id"])
+        ),
+        role='source'
+    )
+    adapter.connect()
+    yield adapter
+    adapter.close()
+
+
+@pytest.fixture
+def sink(store_config):
+    adapter = PostgresAdapter(
+        store_config=store_config,
+        adapter_config=MagicMock(
+            fields=[
+                FieldConfig(column="id", source_column="id"),
+                FieldConfig(column="name", source_column="name"),
+                FieldConfig(column="value", source_column="value"),
+                FieldConfig(column="label", source_column="TMPL({{ name }}/{{ id }})"),
+                FieldConfig(column="lookup", source="redis1"),
+            ],
+            table=MagicMock(table=SINK_TABLE, dbschema="public", alias=None),
+            filters=[],
+            batch_size=100,
+            batch_bytes=None,
+            merge_strategy=MergeStrategyConfig(strategy="upsert"),
+            meta_columns=MagicMock(partition_column="id", order_column="id", unique_columns=["id"])
+        ),
+        role='sink'
+    )
+    adapter.connect()
+    adapter.execute(f"DROP TABLE IF EXISTS public.{SINK_TABLE}")
+    adapter.execute(f"CREATE TABLE public.{SINK_TABLE} (id int PRIMARY KEY, name varchar, value numeric, label varchar)")
+    yield adapter
+    adapter.execute(f"DROP TABLE IF EXISTS public.{SINK_TABLE}")
+    adapter.close()
+
+
+def state_adapter(store_config, table):
+    # the rows' key and hash as the reconciliation compares them
+    adapter = PostgresAdapter(
+        store_config=store_config,
+        adapter_config=MagicMock(
+            fields=[FieldConfig(column="id"), FieldConfig(column="name"), FieldConfig(column="value")],
+            table=MagicMock(table=table, dbschema="public", alias=None),
+            filters=[],
+            joins=[],
+            meta_columns=MagicMock(partition_column="id", order_column="id", unique_columns=["id"], hash_column=None)
+        ),
+        role='state'
+    )
+    adapter.connect()
+    return adapter
+
+
+@pytest.fixture
+def pipeline(store_config, source, sink):
+    sourcestate, sinkstate = state_adapter(store_config, "source_table"), state_adapter(store_config, SINK_TABLE)
+    yield MagicMock(source=source, sink=sink, sourcestate=sourcestate, sinkstate=sinkstate)
+    sourcestate.close()
+    sinkstate.close()
+
+
+@pytest.fixture
+def r_config():
+    return MagicMock(partition_column_type="int", strategy=HASH_MD5_HASH, sketch_size=None)
+
+
+def sink_rows(sink):
+    sink.cursor.execute(f"SELECT id, name, value, label FROM public.{SINK_TABLE} ORDER BY id")
+    return sink.cursor.fetchall()
+
+
+def test_fetch_batches_streams_through_server_side_cursor(source, r_config):
+    query = build_source_rows_query(Block(1, 1001, 1, 1000, None), source.adapter_config, r_config)
+
+    batches = list(source.fetch_batches(query, 300))
+
+    assert [len(batch) for batch in batches] == [300, 300, 300, 100]
+    assert sorted(row["id"] for batch in batches for row in batch) == list(range(1, 1001))
+    # the cursor's transaction is closed, the connection is free for the next query
+    assert source.conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+
+def test_to_sink_row_maps_columns_and_templates(sink):
+    row = to_sink_row({"id": 7, "name": "Item 7", "value": 3}, sink.adapter_config)
+
+    assert row == {"id": 7, "name": "Item 7", "value": 3, "label": "Item 7/7"}
+
+
+def test_load_copies_added_and_mismatched_blocks_in_batches(pipeline, source, sink, r_config):
+    pairs = [(Block(1, 501, 1, 500, None), 'A'), (Block(501, 1001, 1, 500, None), 'N'), (Block(1001, 1601, 1, 600, None), 'M'), (Block(2001, 2101, 1, 100, None), 'D')]
+
+    with patch.object(source, "fetch_batches", wraps=source.fetch_batches) as fetch_batches, \
+            patch.object(sink, "write_batch", wraps=sink.write_batch) as write_batch:
+        written = load(pipeline, r_config, iter(pairs))
+
+    assert written == 1100
+    assert [call.args[1] for call in fetch_batches.call_args_list] == [250, 250]
+    assert max(len(call.args[1]) for call in write_batch.call_args_list) == 100
+    rows = sink_rows(sink)
+    assert [row[0] for row in rows] == list(range(1, 501)) + list(range(1001, 1601))
+    assert rows[0][1] == "Item 1" and rows[0][3] == "Item 1/1"
+
+
+def test_load_writes_each_block_as_discovery_yields_it(pipeline, sink, r_config):
+    events = []
+
+    def discovered():
+        for start in (1, 101):
+            events.append(("discovered", start))
+            yield Block(start, start + 100, 1, 100, None), 'A'
+
+    with patch.object(sink, "write_batch", side_effect=lambda table, rows: events.append(("written", rows[0]["id"]))):
+        load(pipeline, r_config, discovered())
+
+    assert events == [("discovered", 1), ("written", 1), ("discovered", 101), ("written", 101)]
+
+
+def test_load_flushes_sink_batches_by_bytes(pipeline, sink, r_config):
+    sink.adapter_config.batch_bytes = 2000
+
+    with patch.object(sink, "write_batch", wraps=sink.write_batch) as write_batch:
+        written = load(pipeline, r_config, [(Block(1, 1001, 1, 1000, None), 'A')])
+
+    batches = [call.args[1] for call in write_batch.call_args_list]
+    assert written == 1000 and sum(len(batch) for batch in batches) == 1000
+    # cut by bytes before reaching batch_size rows, and not at source batch boundaries
+    assert max(len(batch) for batch in batches) < 100
+    assert all(2000 <= sum(row_size(row) for row in batch) < 2000 + row_size(batch[-1]) for batch in batches[:-1])
+    assert len(sink_rows(sink)) == 1000
+
+
+def test_load_upserts_rows_already_in_the_sink(pipeline, sink, r_config):
+    sink.execute(f"INSERT INTO public.{SINK_TABLE} (id, name, value, label) VALUES (5, 'stale', 0, 'stale')")
+
+    load(pipeline, r_config, [(Block(1, 11, 1, 10, None), 'M')])
+
+    rows = sink_rows(sink)
+    assert len(rows) == 10
+    assert rows[4][1] == "Item 5"
+
+
+def test_load_moves_only_the_differing_rows_of_m_blocks(pipeline, source, sink, r_config):
+    load(pipeline, r_config, [(Block(1, 101, 1, 100, None), 'A')])
+    sink.execute(f"UPDATE public.{SINK_TABLE} SET name = 'stale' WHERE id IN (5, 50)")
+    sink.execute(f"DELETE FROM public.{SINK_TABLE} WHERE id = 70")
+
+    with patch.object(sink, "write_batch", wraps=sink.write_batch) as write_batch:
+        written = load(pipeline, r_config, [(Block(1, 101, 1, 100, None), 'M')])
+
+    assert written == 3
+    assert sorted(row["id"] for call in write_batch.call_args_list for row in call.args[1]) == [5, 50, 70]
+    rows = sink_rows(sink)
+    assert [row[0] for row in rows] == list(range(1, 101))
+    assert rows[4][1] == "Item 5" and rows[49][1] == "Item 50"
+
+
+def test_load_row_diff_looks_up_keys_in_chunks(pipeline, source, sink, r_config):
+    diff = RowDiff(inserts=[(i,) for i in range(1, 1501)], updates=[(1600,)], deletes=[])
+
+    with patch.object(source, "fetch_batches", wraps=source.fetch_batches) as fetch_batches:
+        written = load_row_diff(source, sink, Block(1, 2001, 1, 2000, None), diff, r_config, allow_delete=False)
+
+    assert written == 1501
+    assert [len(call.args[0].filters[2].value) for call in fetch_batches.call_args_list] == [1000, 501]
+    assert len(sink_rows(sink)) == 1501
+
+
+def test_load_deletes_sink_only_rows_of_m_blocks_when_allowed(pipeline, source, sink, r_config):
+    # the source ends at id 30000, the sink holds extra rows inside the same block
+    block = Block(29951, 30101, 1, 50, None)
+    sink.execute(f"INSERT INTO public.{SINK_TABLE} (id, name) SELECT i, 'extra' FROM generate_series(30001, 30100) i")
+
+    load(pipeline, r_config, [(block, 'M')])
+    assert [row[0] for row in sink_rows(sink)] == list(range(29951, 30101))
+
+    sink.adapter_config.merge_strategy = MergeStrategyConfig(strategy="upsert", allow_delete=True)
+    with patch.object(sink, "delete", wraps=sink.delete) as delete:
+        written = load(pipeline, r_config, [(block, 'M')])
+
+    assert written == 0
+    # one IN list of the 100 sink-only keys, no range delete
+    assert len(delete.call_args.args[0].filters[2].value) == 100
+    assert [row[0] for row in sink_rows(sink)] == list(range(29951, 30001))
+    # the block has converged, a second run finds nothing to move
+    with patch.object(sink, "delete") as delete:
+        assert load(pipeline, r_config, [(block, 'M')]) == 0
+    delete.assert_not_called()
+
+
+def test_load_replaces_m_block_range_without_unique_columns(pipeline, source, sink, r_config):
+    pipeline.sinkstate.adapter_config.meta_columns.unique_columns = None
+    sink.adapter_config.merge_strategy = MergeStrategyConfig(strategy="upsert", allow_delete=True)
+    sink.execute(f"INSERT INTO public.{SINK_TABLE} (id, name) SELECT i, 'extra' FROM generate_series(29990, 30100) i")
+
+    with patch.object(sink, "replace_rows", wraps=sink.replace_rows) as replace_rows:
+        written = load(pipeline, r_config, [(Block(29951, 30101, 1, 50, None), 'M')])
+
+    assert written == 50
+    replace_rows.assert_called_once()
+    rows = sink_rows(sink)
+    assert [row[0] for row in rows] == list(range(29951, 30001))
+    assert rows[-1][1] == "Item 30000"
+
+
+def test_load_split_block_reads_its_key_range(source, r_config):
+    block = Block(1, 1001, 4, 1000, None, key_start=200, key_end=300)
+    source.adapter_config.meta_columns.order_column = "name"
+    source.adapter_config.meta_columns.unique_columns = ["id"]
+    source.adapter_config.meta_columns.partition_column = "id"
+
+    query = build_source_rows_query(block, source.adapter_config, r_config)
+
+    assert [(f.column, f.operator, f.value) for f in query.filters[2:]] == [("name", ">=", 200), ("name", "<", 300)]
+
+
+def test_load_delete_insert_replaces_block_ranges(pipeline, sink, r_config):
+    sink.adapter_config.merge_strategy = MergeStrategyConfig(strategy="delete_insert", chunk_size=300)
+    # stale and extra rows inside the block, a row outside it that must stay
+    sink.execute(f"INSERT INTO public.{SINK_TABLE} (id, name) VALUES (5, 'stale'), (1500, 'gone'), (2500, 'kept')")
+
+    with patch.object(sink, "replace_rows", wraps=sink.replace_rows) as replace_rows:
+        written = load(pipeline, r_config, [(Block(1, 2001, 1, 1000, None), 'M')])
+
+    assert written == 2000
+    # one transaction per chunk of about chunk_size rows
+    assert replace_rows.call_count == 4
+    rows = sink_rows(sink)
+    assert [row[0] for row in rows] == list(range(1, 2001)) + [2500]
+    assert rows[4][1] == "Item 5" and rows[-1][1] == "kept"
+
+
+def test_load_deletes_d_blocks_when_allowed(pipeline, sink, r_config):
+    sink.execute(f"INSERT INTO public.{SINK_TABLE} (id, name) SELECT i, 'x' FROM generate_series(1, 20) i")
+
+    load(pipeline, r_config, [(Block(1, 11, 1, 10, None), 'D')])
+    assert len(sink_rows(sink)) == 20
+
+    sink.adapter_config.merge_strategy = MergeStrategyConfig(strategy="upsert", allow_delete=True)
+    load(pipeline, r_config, [(Block(1, 11, 1, 10, None), 'D')])
+    assert [row[0] for row in sink_rows(sink)] == list(range(11, 21))
+
+
+def test_load_delete_insert_rolls_back_failed_chunk(pipeline, source, sink, r_config):
+    sink.adapter_config.merge_strategy = MergeStrategyConfig(strategy="delete_insert")
+    sink.execute(f"INSERT INTO public.{SINK_TABLE} (id, name) VALUES (5, 'stale')")
+
+    def failing_batches(query, batch_size):
+        yield [{"id": 1, "name": "Item 1", "value": 1}]
+        raise RuntimeError("source went away")
+
+    with patch.object(source, "fetch_batches", failing_batches), pytest.raises(RuntimeError):
+        load(pipeline, r_config, [(Block(1, 11, 1, 10, None), 'M')])
+
+    assert [row[:2] for row in sink_rows(sink)] == [(5, "stale")]
+
+
+def test_sink_delete_query_covers_range_and_filters(sink):
+    sink.adapter_config.filters = [MagicMock(column="name", operator="<>", value="skip")]
+
+    query = build_sink_delete_query(Block(1, 11, 1, 10, None), sink.adapter_config, MagicMock(partition_column_type="int"))
+
+    assert [(f.column, f.operator, f.value) for f in query.filters] == [("id", ">=", 1), ("id", "<", 11), ("name", "<>", "skip")]
+    with pytest.raises(ValueError):
+        build_sink_delete_query(Block(1, 11, 1, 10, None), sink.adapter_config, MagicMock(partition_column_type="json"))
+
+
+def test_chunk_block_splits_ranges_by_rows():
+    assert [(b.start, b.end) for b in chunk_block(Block(0, 1000, 1, 250, None), 100)] == [(0, 334), (334, 668), (668, 1000)]
+    assert [(b.start, b.end) for b in chunk_block(Block(date(2024, 1, 1), date(2024, 1, 5), 1, 90, None), 30)] == [
+        (date(2024, 1, 1), date(2024, 1, 3)), (date(2024, 1, 3), date(2024, 1, 5))
+    ]
+    hours = chunk_block(Block(datetime(2024, 1, 1), datetime(2024, 1, 2), 1, 40, None), 10)
+    assert [b.start.hour for b in hours] == [0, 6, 12, 18]
+    assert chunk_block(Block(0, 1000, 1, 250, None, key_start=1, key_end=2), 100)[0].end == 1000
@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+
+from engine.parallel import WorkStealingExecutor
+
+
+def test_runs_seed_and_spawned_tasks():
+    seen = []
+    lock = threading.Lock()
+
+    def handle(task, context, spawn):
+        with lock:
+            seen.append(task)
+        # each task below depth 3 fans out into two children
+        if len(task) < 3:
+            spawn(task + (0,))
+            spawn(task + (1,))
+
+    WorkStealingExecutor(4, handle).run([(i,) for i in range(5)])
+
+    assert len(seen) == 5 * (1 + 2 + 4)
+    assert len(set(seen)) == len(seen)
+
+
+def test_skewed_work_is_stolen_by_idle_workers():
+    workers = set()
+    lock = threading.Lock()
+    barrier = threading.Barrier(3, timeout=5)
+
+    def open_worker(worker_id):
+        return worker_id
+
+    def handle(task, worker_id, spawn):
+        with lock:
+            workers.add(worker_id)
+        if task == "root":
+            for _ in range(3):
+                spawn("leaf")
+        else:
+            # only completes if three leaves run concurrently on different workers
+            barrier.wait()
+
+    WorkStealingExecutor(3, handle, open_worker=open_worker).run(["root"])
+
+    assert workers == {0, 1, 2}
+
+
+def test_worker_contexts_are_opened_and_closed():
+    opened, closed = [], []
+    lock = threading.Lock()
+
+    def open_worker(worker_id):
+        with lock:
+            opened.append(worker_id)
+        return f"conn-{worker_id}"
+
+    def close_worker(context):
+        with lock:
+            closed.append(context)
+
+    WorkStealingExecutor(2, lambda task, ctx, spawn: None, open_worker, close_worker).run([1, 2, 3])
+
+    assert sorted(opened) == [0, 1]
+    assert sorted(closed) == ["conn-0", "conn-1"]
+
+
+def test_handler_error_is_raised():
+    def handle(task, context, spawn):
+        if task == 3:
+            raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        WorkStealingExecutor(2, handle).run(range(10))
+
+
+def test_no_tasks():
+    WorkStealingExecutor(2, lambda task, ctx, spawn: None).run([])
+
+
+def test_invalid_worker_count():
+    with pytest.raises(ValueError):
+        WorkStealingExecutor(0, lambda task, ctx, spawn: None)
+
+
+def test_cancel_stops_handing_out_tasks():
+    seen = []
+    lock = threading.Lock()
+    executor = None
+
+    def handle(task, context, spawn):
+        with lock:
+            seen.append(task)
+        if task == 0:
+            executor.cancel()
+        spawn(task + 1)
+
+    executor = WorkStealingExecutor(1, handle)
+    executor.run([0])
+
+    assert seen == [0]
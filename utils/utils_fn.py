@@ -1,5 +1,9 @@
+from bisect import bisect_right
 from datetime import datetime
+from functools import lru_cache
 import importlib
+import math
+from typing import Tuple
 
 import pytz
 
@@ -57,3 +61,16 @@ def add_tz(dt: datetime, tz= pytz.UTC):
         return dt.replace(tzinfo=tz)
     else:
         return dt
+
+
+@lru_cache(maxsize=256)
+def divisors(n: int) -> Tuple[int, ...]:
+    # sorted divisors of n; a descent asks about the same few intervals for every block
+    small = [d for d in range(1, math.isqrt(n) + 1) if n % d == 0]
+    return tuple(small + [n // d for d in reversed(small) if d * d != n])
+
+
+def largest_divisor_at_most(n: int, limit: int) -> int:
+    # largest d with n % d == 0 and d <= limit, at least 1
+    found = divisors(n)
+    return found[max(bisect_right(found, limit) - 1, 0)]